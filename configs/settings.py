@@ -93,6 +93,12 @@ WSGI_APPLICATION = 'configs.wsgi.application'
 
 DB_ACTIVE = config('DB_ACTIVE', default='LOCAL')
 
+# Conexões persistentes: cada thread dos workers reaproveita a sua conexão por até
+# DB_CONN_MAX_AGE segundos (0 = uma conexão por requisição), então o total fica limitado
+# a workers x threads. Com CONN_HEALTH_CHECKS a conexão é testada antes de ser reaproveitada,
+# e o Django fecha ao fim da requisição as que deram erro.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
 if DB_ACTIVE == 'SUPABASE':
     # Configurações para o banco de dados Supabase
     DATABASES = {
@@ -103,6 +109,8 @@ if DB_ACTIVE == 'SUPABASE':
             'PASSWORD': config('DB_SUPABASE_PASSWORD'),
             'HOST': config('DB_SUPABASE_HOST'),
             'PORT': config('DB_SUPABASE_PORT'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
         }
     }
 else:
@@ -115,11 +123,72 @@ else:
             'PASSWORD': config('DB_LOCAL_PASSWORD'),
             'HOST': config('DB_LOCAL_HOST'),
             'PORT': config('DB_LOCAL_PORT'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
         }
     }
 
 
 
+# Cache
+# ARQUIVO (padrão): em disco, compartilhado pelos workers do gunicorn da mesma máquina.
+# LOCAL: memória do processo; só serve com um único processo (ex.: runserver).
+# REDIS: para vários servidores; requer o pacote `redis` e CACHE_REDIS_URL.
+# O alias 'ubs_consulta' guarda os resultados da consulta de CEP (ubs_consulta/cache.py),
+# com limite próprio para não disputar espaço com os contextos do controle_oficio.
+
+CACHE_ACTIVE = config('CACHE_ACTIVE', default='ARQUIVO')
+CACHE_UBS_CONSULTA_MAX_ENTRIES = config('CACHE_UBS_CONSULTA_MAX_ENTRIES', default=5000, cast=int)
+
+if CACHE_ACTIVE == 'REDIS':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_REDIS_URL', default='redis://127.0.0.1:6379/1'),
+        },
+        # Mesmo servidor; o limite e o descarte seguem o maxmemory/maxmemory-policy do Redis
+        'ubs_consulta': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_UBS_CONSULTA_REDIS_URL', default=config('CACHE_REDIS_URL', default='redis://127.0.0.1:6379/1')),
+            'KEY_PREFIX': 'ubs_consulta',
+        },
+    }
+elif CACHE_ACTIVE == 'LOCAL':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'ubs_consulta': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ubs_consulta',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_UBS_CONSULTA_MAX_ENTRIES},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / '.cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'ubs_consulta': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_UBS_CONSULTA_DIR', default=str(BASE_DIR / '.cache_ubs_consulta')),
+            'OPTIONS': {'MAX_ENTRIES': CACHE_UBS_CONSULTA_MAX_ENTRIES},
+        },
+    }
+
+
+# Consulta de UBS por CEP
+# Sem UBS_CONSULTA_EM_MEMORIA, os resultados de cada CEP ficam no cache (ubs_consulta/cache.py).
+# Com ele, cada worker guarda a base de logradouros/UBS em memória e as consultas não vão ao banco.
+# Depois de atualizar as tabelas, rode `recarregar_indice_cep` (os workers trocam o índice em
+# até 30 s; requer cache ARQUIVO ou REDIS).
+
+UBS_CONSULTA_EM_MEMORIA = config('UBS_CONSULTA_EM_MEMORIA', default=False, cast=bool)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
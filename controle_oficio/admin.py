@@ -1,5 +1,11 @@
-from django.contrib import admin
-from .models import Entidade, Bloco, Ficha
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .forms import ImportacaoEntidadesForm
+from .importacao import importar_entidades, ler_csv_entidades
+from .models import Entidade, Bloco, Ficha, FichaEvento
 
 # Inline para mostrar as Fichas dentro da página de detalhes de um Bloco
 class FichaInline(admin.TabularInline):
@@ -21,6 +27,53 @@ class EntidadeAdmin(admin.ModelAdmin):
     search_fields = ('nome', 'numero_documento')
     list_filter = ('tipo', 'tipo_documento')
     ordering = ('nome',)
+    change_list_template = 'admin/controle_oficio/entidade/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path(
+                'importar-csv/',
+                self.admin_site.admin_view(self.importar_csv),
+                name='controle_oficio_entidade_importar_csv',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def importar_csv(self, request):
+        """
+        Importa a lista de entidades (ex.: CNES do município) de uma vez,
+        cadastrando as novas e atualizando as existentes pelo numero_documento.
+        """
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect('admin:controle_oficio_entidade_changelist')
+
+        form = ImportacaoEntidadesForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                resultado = importar_entidades(
+                    ler_csv_entidades(form.cleaned_data['arquivo']),
+                    tipo_padrao=form.cleaned_data['tipo'],
+                    tipo_documento_padrao=form.cleaned_data['tipo_documento'],
+                )
+            except ValueError as e:
+                form.add_error('arquivo', str(e))
+            else:
+                self.message_user(
+                    request,
+                    f"{resultado['inseridas']} entidade(s) inserida(s), {resultado['atualizadas']} atualizada(s), "
+                    f"{resultado['inalteradas']} sem alteração, {len(resultado['rejeitadas'])} linha(s) rejeitada(s).",
+                    messages.SUCCESS,
+                )
+                for linha, motivo in resultado['rejeitadas'][:20]:
+                    self.message_user(request, f"Linha {linha}: {motivo}", messages.WARNING)
+                return redirect('admin:controle_oficio_entidade_changelist')
+
+        return TemplateResponse(request, 'admin/controle_oficio/entidade/importar_csv.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar entidades (CSV)',
+            'form': form,
+        })
 
 @admin.register(Bloco)
 class BlocoAdmin(admin.ModelAdmin):
@@ -53,4 +106,25 @@ class FichaAdmin(admin.ModelAdmin):
         from django.utils.html import format_html
         link = reverse("admin:controle_oficio_bloco_change", args=[obj.bloco.id])
         return format_html('<a href="{}">{}</a>', link, obj.bloco.numero_inicial)
-    bloco_link.short_description = 'Bloco de Origem'
\ No newline at end of file
+    bloco_link.short_description = 'Bloco de Origem'
+
+
+@admin.register(FichaEvento)
+class FichaEventoAdmin(admin.ModelAdmin):
+    """
+    Histórico das fichas, somente leitura (a tabela é só de inclusão).
+    """
+    list_display = ('data_evento', 'ficha', 'acao', 'status_anterior', 'status_novo', 'entidade_anterior', 'entidade', 'usuario')
+    list_select_related = ('ficha', 'entidade_anterior', 'entidade', 'usuario')
+    list_filter = ('acao', 'status_novo')
+    search_fields = ('ficha__numero',)
+    ordering = ('-data_evento', '-id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ControleOficioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'controle_oficio'
+
+    def ready(self):
+        from . import checks  # noqa: F401 (registra os checks do app)
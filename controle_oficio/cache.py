@@ -0,0 +1,121 @@
+"""
+Cache dos contextos calculados das telas de leitura (dashboard, lista de
+blocos, estatísticas da entidade e busca de entidades).
+
+Cada valor é guardado numa chave que leva a versão daquilo de que ele
+depende: as fichas do sistema todo ('fichas'), um bloco, uma entidade ou o
+cadastro de entidades (nomes e documentos, usados pela busca).
+As rotinas que alteram fichas trocam as versões afetadas, então uma leitura
+nunca encontra uma contagem antiga; os valores da versão anterior ficam
+órfãos e expiram sozinhos.
+"""
+import hashlib
+import secrets
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+# Tempo de vida dos contextos guardados. As versões invalidam tudo que muda com
+# as fichas; o limite só cobre o que muda com o relógio (a janela de 30 dias).
+TEMPO_CACHE_CONTEXTOS = 10 * 60
+
+# Escopos de versão
+FICHAS = 'fichas'
+BLOCO = 'bloco'
+ENTIDADE = 'entidade'
+CADASTRO_ENTIDADES = 'cadastro_entidades'
+
+
+def _prefixo():
+    # O nome do banco separa os caches de bancos diferentes (LOCAL/SUPABASE, testes)
+    return f"controle_oficio:{connection.settings_dict['NAME']}"
+
+
+def _chave_versao(escopo, identificador=None):
+    return f"{_prefixo()}:versao:{escopo}:{'' if identificador is None else identificador}"
+
+
+def _nova_versao():
+    # Valor aleatório em vez de contador: se o cache descartar a versão, a
+    # próxima não repete uma antiga que ainda tenha valores guardados
+    return secrets.token_hex(8)
+
+
+def versoes(escopo, identificadores):
+    """
+    Versões atuais de vários itens de um escopo, em um único get_many.
+    """
+    chaves = {identificador: _chave_versao(escopo, identificador) for identificador in identificadores}
+    atuais = cache.get_many(list(chaves.values()))
+    resultado = {}
+    for identificador, chave in chaves.items():
+        if chave not in atuais:
+            cache.add(chave, _nova_versao(), None)
+            atuais[chave] = cache.get(chave)
+        resultado[identificador] = atuais[chave]
+    return resultado
+
+
+def versao(escopo, identificador=None):
+    return versoes(escopo, [identificador])[identificador]
+
+
+def chave(nome, *partes):
+    """
+    Chave de um valor guardado; `partes` deve incluir as versões de que ele depende.
+    """
+    resumo = hashlib.md5(repr(partes).encode()).hexdigest()
+    return f'{_prefixo()}:{nome}:{resumo}'
+
+
+def _trocar_versoes(chaves):
+    cache.set_many({chave: _nova_versao() for chave in chaves}, None)
+
+
+def invalidar(escopo, identificadores=(None,)):
+    """
+    Troca a versão dos itens do escopo. A troca é repetida depois do commit:
+    uma leitura feita durante a transação (que ainda via os dados antigos)
+    pode ter guardado o valor antigo já na versão nova.
+    """
+    chaves = [_chave_versao(escopo, identificador) for identificador in set(identificadores)]
+    if not chaves:
+        return
+    _trocar_versoes(chaves)
+    transaction.on_commit(lambda: _trocar_versoes(chaves))
+
+
+def _pode_guardar():
+    # Dentro de uma transação o valor calculado pode incluir mudanças que ainda
+    # serão desfeitas (e o rollback não troca a versão de volta)
+    return not connection.in_atomic_block
+
+
+def em_cache(chave_valor, calcular, timeout=TEMPO_CACHE_CONTEXTOS):
+    """
+    Devolve o valor guardado em `chave_valor` ou calcula e guarda.
+    """
+    valor = cache.get(chave_valor)
+    if valor is None:
+        valor = calcular()
+        if _pode_guardar():
+            cache.set(chave_valor, valor, timeout)
+    return valor
+
+
+def varios_em_cache(chaves, calcular, timeout=TEMPO_CACHE_CONTEXTOS):
+    """
+    Como em_cache() para vários valores de uma vez: `chaves` é um dict
+    {identificador: chave} e `calcular` recebe só os identificadores que
+    faltaram, devolvendo {identificador: valor}.
+    """
+    guardados = cache.get_many(list(chaves.values()))
+    valores = {identificador: guardados[c] for identificador, c in chaves.items() if c in guardados}
+    faltando = [identificador for identificador in chaves if identificador not in valores]
+    if faltando:
+        calculados = calcular(faltando)
+        if _pode_guardar():
+            cache.set_many({chaves[identificador]: calculados[identificador] for identificador in faltando}, timeout)
+        valores.update(calculados)
+    return valores
@@ -0,0 +1,35 @@
+from django.core import checks
+from django.db import connections
+
+
+# Índices de trigramas criados pela migração 0006 para a busca de entidades
+INDICES_BUSCA_ENTIDADES = ['entidade_nome_trgm_idx', 'entidade_documento_trgm_idx']
+
+
+@checks.register(checks.Tags.database)
+def verificar_indices_busca(app_configs, databases=None, **kwargs):
+    """
+    Avisa quando os índices de trigramas da busca de entidades não existem
+    (por exemplo, sem a extensão pg_trgm no servidor): a busca funciona, mas
+    percorre a tabela inteira. Roda no migrate e em `check --database`.
+    """
+    from .models import Entidade
+
+    avisos = []
+    for alias in databases or []:
+        conexao = connections[alias]
+        tabela = Entidade._meta.db_table
+        with conexao.cursor() as cursor:
+            if tabela not in conexao.introspection.table_names(cursor):
+                continue
+            existentes = conexao.introspection.get_constraints(cursor, tabela)
+        faltando = [nome for nome in INDICES_BUSCA_ENTIDADES if nome not in existentes]
+        if faltando:
+            avisos.append(checks.Warning(
+                f"Índices da busca de entidades ausentes no banco '{alias}': {', '.join(faltando)}.",
+                hint="Instale a extensão pg_trgm no servidor e rode a migração "
+                     "controle_oficio 0006_entidade_busca novamente (migrate controle_oficio 0005 e migrate).",
+                obj=Entidade,
+                id='controle_oficio.W001',
+            ))
+    return avisos
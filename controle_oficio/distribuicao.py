@@ -0,0 +1,162 @@
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import BLOCO, ENTIDADE, invalidar
+from .models import Bloco, Ficha, FichaEvento, ResumoDiarioFicha
+
+
+# Limite de números por pedido de distribuição por intervalo
+LIMITE_FICHAS_POR_INTERVALO = 1000
+
+
+def distribuir_numeros(entidade, numeros, usuario=None):
+    """
+    Distribui para a entidade as fichas com os números informados, em lote:
+    uma query de lock, um UPDATE ... RETURNING e a classificação dos demais
+    números pela diferença de conjuntos. Cada ficha distribuída ganha um
+    evento no histórico, em nome de `usuario`.
+
+    Retorna um dict com as listas 'distribuidos', 'indisponiveis' e 'invalidos',
+    na ordem em que os números foram informados.
+    """
+    numeros = list(dict.fromkeys(numeros))  # Remove repetidos mantendo a ordem
+    return _distribuir(entidade, 'numero = ANY(%s)', [numeros], numeros, usuario)
+
+
+def interpretar_intervalos(texto):
+    """
+    Lê intervalos no formato "10000000-10000029, 10000040, 10000050-10000055"
+    e retorna uma lista de tuplas (inicio, fim) de inteiros.
+    Lança ValueError para trechos inválidos.
+    """
+    intervalos = []
+    for parte in re.split(r'[,;\n]+', texto or ''):
+        parte = parte.strip()
+        if not parte:
+            continue
+        inicio, separador, fim = parte.partition('-')
+        inicio, fim = inicio.strip(), (fim.strip() if separador else inicio.strip())
+        if not (inicio.isdigit() and fim.isdigit()):
+            raise ValueError(f"Intervalo inválido: '{parte}'. Use números ou 'inicial-final'.")
+        if int(inicio) > int(fim):
+            raise ValueError(f"Intervalo invertido: '{parte}'. O número inicial deve ser menor que o final.")
+        intervalos.append((int(inicio), int(fim)))
+    return intervalos
+
+
+def numeros_dos_intervalos(tipo, intervalos):
+    """
+    Expande os intervalos nos números de ficha já com o zero-padding do tipo
+    (8 dígitos para DO, 10 para DNV), sem repetir números.
+    """
+    total = sum(fim - inicio + 1 for inicio, fim in intervalos)
+    if total > LIMITE_FICHAS_POR_INTERVALO:
+        raise ValueError(
+            f"Os intervalos somam {total} fichas; o limite por distribuição é {LIMITE_FICHAS_POR_INTERVALO}."
+        )
+    numeros = (
+        Bloco.formatar_numero(tipo, numero)
+        for inicio, fim in intervalos
+        for numero in range(inicio, fim + 1)
+    )
+    return list(dict.fromkeys(numeros))
+
+
+def distribuir_intervalos(entidade, tipo, intervalos, bloco=None, usuario=None):
+    """
+    Distribui as fichas dos intervalos numéricos informados em um único UPDATE
+    sobre os números já expandidos (uma faixa de texto também pegaria números
+    com mais dígitos, que o Bloco aceita para os dois tipos).
+    Com `bloco`, restringe os intervalos às fichas daquele bloco.
+
+    Retorna o mesmo dict de distribuir_numeros().
+    """
+    numeros = numeros_dos_intervalos(tipo, intervalos)
+    condicao = 'tipo = %s AND numero = ANY(%s)'
+    parametros = [tipo, numeros]
+    if bloco is not None:
+        condicao += ' AND bloco_id = %s'
+        parametros.append(bloco.pk)
+
+    return _distribuir(entidade, condicao, parametros, numeros, usuario)
+
+
+def resumir_numeros(numeros):
+    """
+    Junta números consecutivos para as mensagens: "10000000 a 10000029, 10000040".
+    """
+    grupos = []
+    for numero in sorted(numeros, key=lambda n: (len(n), n)):
+        ultimo = grupos[-1] if grupos else None
+        if ultimo and len(ultimo[1]) == len(numero) and int(ultimo[1]) + 1 == int(numero):
+            ultimo[1] = numero
+        else:
+            grupos.append([numero, numero])
+    return ', '.join(inicio if inicio == fim else f"{inicio} a {fim}" for inicio, fim in grupos)
+
+
+def _distribuir(entidade, condicao, parametros, numeros, usuario=None):
+    """
+    Núcleo da distribuição em lote. `condicao` é o trecho SQL (com parâmetros)
+    que seleciona as fichas candidatas e `numeros` são os números pedidos,
+    usados para classificar o que não foi distribuído.
+    """
+    if not numeros:
+        return {'distribuidos': [], 'indisponiveis': [], 'invalidos': []}
+
+    tabela = Ficha._meta.db_table
+    agora = timezone.now()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Lock pessimista para evitar corrida; guarda o estado atual para o resumo diário
+        cursor.execute(
+            f"""
+            SELECT numero, id, bloco_id, data_recebimento, tipo, status, entidade_id
+            FROM {tabela}
+            WHERE {condicao}
+            ORDER BY numero
+            FOR UPDATE
+            """,
+            parametros,
+        )
+        linhas = cursor.fetchall()
+        ids = {numero: (ficha_id, bloco_id) for numero, ficha_id, bloco_id, *_ in linhas}
+        estados = {numero: estado for numero, _, _, *estado in linhas}
+
+        cursor.execute(
+            f"""
+            UPDATE {tabela}
+            SET entidade_id = %s, status = 'Distribuida', data_entrega = %s, updated_at = %s
+            WHERE ({condicao}) AND status = 'Disponível'
+            RETURNING numero
+            """,
+            [entidade.pk, agora, agora, *parametros],
+        )
+        distribuidos = {numero for (numero,) in cursor.fetchall()}
+
+        ResumoDiarioFicha.objects.aplicar_deltas(
+            ResumoDiarioFicha.objects.deltas_de_atualizacao(
+                [estados[numero] for numero in distribuidos],
+                status='Distribuida',
+                entidade_id=entidade.pk,
+            )
+        )
+        FichaEvento.objects.registrar(
+            'Distribuicao',
+            [(ids[numero][0], estados[numero][2], estados[numero][3]) for numero in sorted(distribuidos)],
+            usuario=usuario,
+            data_evento=agora,
+            status='Distribuida',
+            entidade_id=entidade.pk,
+        )
+        if distribuidos:
+            invalidar(BLOCO, [ids[numero][1] for numero in distribuidos])
+            invalidar(ENTIDADE, [entidade.pk] + [estados[numero][3] for numero in distribuidos if estados[numero][3]])
+
+    return {
+        'distribuidos': [numero for numero in numeros if numero in distribuidos],
+        'indisponiveis': [numero for numero in numeros if numero in estados and numero not in distribuidos],
+        'invalidos': [numero for numero in numeros if numero not in estados],
+    }
@@ -0,0 +1,140 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Ficha, ResumoDiarioFicha
+
+
+STATUS_FINALIZADOS = ['Utilizada', 'Cancelada']
+TIPOS = ['DO', 'DNV']
+
+
+def dias_selecionados(datas):
+    """
+    Converte uma lista de datas ('AAAA-MM-DD' ou date) em dates ordenadas,
+    ignorando valores inválidos vindos do formulário.
+    """
+    dias = set()
+    for valor in datas:
+        if isinstance(valor, date):
+            dias.add(valor)
+            continue
+        try:
+            dias.add(date.fromisoformat(str(valor)))
+        except ValueError:
+            continue
+    return sorted(dias)
+
+
+def intervalos_por_datas(datas):
+    """
+    Converte uma lista de datas em intervalos [inicio, fim) de datetimes no
+    fuso atual. Datas consecutivas viram um único intervalo, assim o filtro
+    fica em poucas comparações na coluna bruta.
+    """
+    intervalos = []
+    for dia in dias_selecionados(datas):
+        if intervalos and intervalos[-1][1] == dia:
+            intervalos[-1][1] = dia + timedelta(days=1)
+        else:
+            intervalos.append([dia, dia + timedelta(days=1)])
+
+    return [(_inicio_do_dia(inicio), _inicio_do_dia(fim)) for inicio, fim in intervalos]
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def filtro_data_recebimento(intervalos):
+    """
+    Monta o Q de data_recebimento para os intervalos [inicio, fim).
+    Compara a coluna diretamente (sem __date) para que o índice possa ser usado.
+    """
+    filtro = Q()
+    for inicio, fim in intervalos:
+        filtro |= Q(data_recebimento__gte=inicio, data_recebimento__lt=fim)
+    return filtro
+
+
+def _contagem(filtro):
+    return Count('id', filter=filtro)
+
+
+def _soma_resumo(filtro):
+    return Coalesce(Sum('quantidade', filter=filtro), 0)
+
+
+def _agregados(prefixo, filtro_base, agregacao):
+    return {
+        f'{prefixo}total': agregacao(filtro_base),
+        f'{prefixo}disponiveis': agregacao(filtro_base & Q(status='Disponível')),
+        f'{prefixo}distribuidas': agregacao(filtro_base & Q(status='Distribuida')),
+        f'{prefixo}finalizadas': agregacao(filtro_base & Q(status__in=STATUS_FINALIZADOS)),
+    }
+
+
+def _percentual(parte, total):
+    return (parte / total) * 100 if total else 0
+
+
+def _calcular(queryset, agregacao):
+    agregados = _agregados('', Q(), agregacao)
+    for tipo in TIPOS:
+        agregados.update(_agregados(f'{tipo.lower()}_', Q(tipo=tipo), agregacao))
+
+    resultado = queryset.order_by().aggregate(**agregados)
+
+    estatisticas = {
+        'total': resultado['total'],
+        'disponiveis': resultado['disponiveis'],
+        'distribuidas': resultado['distribuidas'],
+        'finalizadas': resultado['finalizadas'],
+        'percentual_finalizadas': _percentual(resultado['finalizadas'], resultado['total']),
+        'por_tipo': {},
+    }
+    for tipo in TIPOS:
+        prefixo = f'{tipo.lower()}_'
+        estatisticas['por_tipo'][tipo] = {
+            'total': resultado[f'{prefixo}total'],
+            'disponiveis': resultado[f'{prefixo}disponiveis'],
+            'distribuidas': resultado[f'{prefixo}distribuidas'],
+            'finalizadas': resultado[f'{prefixo}finalizadas'],
+            'percentual_finalizadas': _percentual(resultado[f'{prefixo}finalizadas'], resultado[f'{prefixo}total']),
+        }
+    return estatisticas
+
+
+def estatisticas_fichas(intervalos=None, queryset=None):
+    """
+    Calcula todas as contagens por status (geral e por tipo DO/DNV) em uma
+    única query com agregação condicional sobre a tabela de fichas.
+
+    `intervalos` é uma lista de (inicio, fim) aplicada em data_recebimento.
+    """
+    fichas = queryset if queryset is not None else Ficha.objects.all()
+    if intervalos:
+        fichas = fichas.filter(filtro_data_recebimento(intervalos))
+    return _calcular(fichas, _contagem)
+
+
+def estatisticas_resumo(datas=None, queryset=None):
+    """
+    Mesmas estatísticas de estatisticas_fichas(), lidas do resumo diário
+    (ResumoDiarioFicha) em vez da tabela de fichas.
+
+    `datas` são os dias de recebimento selecionados no filtro.
+    """
+    resumos = queryset if queryset is not None else ResumoDiarioFicha.objects.all()
+    if datas:
+        resumos = resumos.filter(dia__in=dias_selecionados(datas))
+    return _calcular(resumos, _soma_resumo)
+
+
+def datas_de_recebimento():
+    """
+    Dias com fichas recebidas, do mais recente para o mais antigo.
+    """
+    return ResumoDiarioFicha.objects.filter(quantidade__gt=0).dates('dia', 'day', order='DESC')
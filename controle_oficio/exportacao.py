@@ -0,0 +1,102 @@
+import csv
+
+from django.db import connection
+from django.db.models import CharField, F, Func, Value
+from django.utils import timezone
+
+from .estatisticas import filtro_data_recebimento, intervalos_por_datas
+from .models import Ficha
+
+
+# Cabeçalho do CSV, na mesma ordem das colunas de consulta_exportacao()
+CABECALHO_EXPORTACAO = [
+    'Número', 'Tipo', 'Status', 'Bloco', 'Recebida em',
+    'Entidade', 'Tipo de documento', 'Documento', 'Entregue em',
+    'Desfecho em', 'Desfecho por',
+]
+
+# Separador e BOM para o arquivo abrir direto no Excel em português
+DELIMITADOR_CSV = ';'
+BOM_UTF8 = '\ufeff'
+
+# Linhas buscadas por vez do cursor do lado do servidor
+LINHAS_POR_LOTE = 2000
+
+
+class DataHoraLocal(Func):
+    """
+    Formata um DateTimeField no fuso do sistema já no banco, para que o
+    streaming e o COPY gerem exatamente o mesmo texto.
+    """
+    function = 'to_char'
+    output_field = CharField()
+
+    def __init__(self, campo):
+        no_fuso = Func(Value(timezone.get_current_timezone_name()), F(campo), function='timezone')
+        super().__init__(no_fuso, Value('DD/MM/YYYY HH24:MI'))
+
+
+def consulta_exportacao(datas=None, entidade_id=None):
+    """
+    Histórico das fichas com bloco, entidade e responsável pelo desfecho,
+    uma tupla por ficha na ordem de CABECALHO_EXPORTACAO.
+
+    `datas` segue a seleção de dias do dashboard (data de recebimento).
+    """
+    fichas = Ficha.objects.all()
+    if datas:
+        fichas = fichas.filter(filtro_data_recebimento(intervalos_por_datas(datas)))
+    if entidade_id:
+        fichas = fichas.filter(entidade_id=entidade_id)
+
+    return (
+        fichas
+        .annotate(
+            recebida_em=DataHoraLocal('data_recebimento'),
+            entregue_em=DataHoraLocal('data_entrega'),
+            desfecho_em=DataHoraLocal('data_desfecho'),
+        )
+        .order_by('numero')
+        .values_list(
+            'numero', 'tipo', 'status', 'bloco__numero_inicial', 'recebida_em',
+            'entidade__nome', 'entidade__tipo_documento', 'entidade__numero_documento', 'entregue_em',
+            'desfecho_em', 'desfecho_por__username',
+        )
+    )
+
+
+class _Eco:
+    """
+    "Arquivo" que só devolve o que recebe, para o csv.writer gerar linhas sob demanda.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(queryset):
+    """
+    Gera o CSV linha a linha. O iterator() usa um cursor do lado do servidor
+    no PostgreSQL, então a memória fica constante mesmo com milhões de fichas.
+    """
+    escritor = csv.writer(_Eco(), delimiter=DELIMITADOR_CSV, lineterminator='\n')
+    yield BOM_UTF8 + escritor.writerow(CABECALHO_EXPORTACAO)
+    for linha in queryset.iterator(chunk_size=LINHAS_POR_LOTE):
+        yield escritor.writerow(linha)
+
+
+def copiar_csv(queryset, arquivo):
+    """
+    Grava o CSV em `arquivo` (aberto em modo texto) com COPY ... TO STDOUT:
+    o próprio PostgreSQL formata as linhas, sem passar cada uma pelo Python.
+    """
+    sql, parametros = queryset.query.sql_with_params()
+    arquivo.write(BOM_UTF8 + DELIMITADOR_CSV.join(CABECALHO_EXPORTACAO) + '\n')
+    with connection.cursor() as cursor:
+        consulta = cursor.mogrify(sql, parametros)
+        if isinstance(consulta, bytes):
+            consulta = consulta.decode()
+        cursor.copy_expert(
+            f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, DELIMITER '{DELIMITADOR_CSV}')",
+            arquivo,
+        )
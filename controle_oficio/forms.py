@@ -1,5 +1,7 @@
 from django import forms
-from .models import Entidade
+from .models import Bloco, Entidade
+from .distribuicao import interpretar_intervalos, numeros_dos_intervalos
+from .recebimento import interpretar_numeros_iniciais, ler_csv_blocos
 
 class EntidadeForm(forms.ModelForm):
     class Meta:
@@ -38,4 +40,103 @@ class EntidadeForm(forms.ModelForm):
                     'placeholder': 'Nome do responsável (opcional)'
                 }
             ),
-        }
\ No newline at end of file
+        }
+
+
+class DistribuicaoIntervaloForm(forms.Form):
+    """
+    Distribuição por faixa de números ("do número X ao Y"), por bloco ou entre blocos.
+    """
+    tipo = forms.ChoiceField(choices=Bloco.TIPO_CHOICES, required=False)
+    bloco = forms.ModelChoiceField(queryset=Bloco.objects.all(), required=False)
+    intervalos = forms.CharField(
+        required=False,
+        widget=forms.TextInput(
+            attrs={
+                'class': 'form-input',
+                'placeholder': 'Ex.: 10000000-10000029, 10000040'
+            }
+        ),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        bloco = cleaned_data.get('bloco')
+        texto = cleaned_data.get('intervalos')
+
+        if bloco is not None:
+            cleaned_data['tipo'] = bloco.tipo
+        elif not cleaned_data.get('tipo'):
+            raise forms.ValidationError("Informe o tipo (DO ou DNV) ou o bloco.")
+
+        try:
+            intervalos = interpretar_intervalos(texto)
+            if not intervalos:
+                if bloco is None:
+                    raise ValueError("Informe ao menos um intervalo de números.")
+                # Sem intervalos, distribui o bloco inteiro
+                inicio = int(bloco.numero_inicial)
+                intervalos = [(inicio, inicio + Bloco.FICHAS_POR_BLOCO - 1)]
+            numeros_dos_intervalos(cleaned_data['tipo'], intervalos)  # Valida o limite de fichas
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+        cleaned_data['intervalos'] = intervalos
+        return cleaned_data
+
+
+class RecebimentoBlocosForm(forms.Form):
+    """
+    Recebimento de uma remessa de blocos de uma vez: números iniciais digitados
+    e/ou um arquivo CSV ("tipo;numero_inicial" ou só "numero_inicial").
+    """
+    tipo = forms.ChoiceField(choices=Bloco.TIPO_CHOICES, widget=forms.Select(attrs={'class': 'form-select'}))
+    numeros_iniciais = forms.CharField(
+        required=False,
+        widget=forms.Textarea(
+            attrs={
+                'class': 'form-input',
+                'rows': 6,
+                'placeholder': 'Um número inicial por linha ou separados por vírgula'
+            }
+        ),
+    )
+    arquivo = forms.FileField(required=False, widget=forms.ClearableFileInput(attrs={'accept': '.csv,.txt'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        tipo = cleaned_data.get('tipo')
+        if not tipo:
+            return cleaned_data
+
+        try:
+            blocos = [(tipo, numero) for numero in interpretar_numeros_iniciais(cleaned_data.get('numeros_iniciais'))]
+            if cleaned_data.get('arquivo'):
+                blocos += ler_csv_blocos(cleaned_data['arquivo'], tipo_padrao=tipo)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        except UnicodeDecodeError:
+            raise forms.ValidationError("O arquivo precisa estar em UTF-8.")
+
+        if not blocos:
+            raise forms.ValidationError("Informe os números iniciais ou envie um arquivo CSV.")
+
+        cleaned_data['blocos'] = blocos
+        return cleaned_data
+
+
+class ImportacaoEntidadesForm(forms.Form):
+    """
+    Upload do CSV de entidades no admin (upsert pelo numero_documento).
+    """
+    arquivo = forms.FileField(help_text="CSV com cabeçalho: tipo, tipo_documento, numero_documento (ou cnes), nome, responsavel_tecnico.")
+    tipo = forms.ChoiceField(
+        choices=[('', 'Usar a coluna do arquivo')] + Entidade.TIPO_CHOICES,
+        required=False,
+        help_text="Tipo para as linhas sem a coluna tipo.",
+    )
+    tipo_documento = forms.ChoiceField(
+        choices=[('', 'Usar a coluna do arquivo')] + Entidade.TIPO_DOC_CHOICES,
+        required=False,
+        help_text="Tipo de documento para as linhas sem a coluna tipo_documento.",
+    )
@@ -0,0 +1,165 @@
+import csv
+import io
+
+from django.db import transaction
+
+from .cache import CADASTRO_ENTIDADES, invalidar
+from .models import Entidade
+
+
+# Entidades gravadas por INSERT ... ON CONFLICT
+ENTIDADES_POR_LOTE = 5000
+
+# Campos comparados com o cadastro e atualizados quando o numero_documento já existe
+CAMPOS_COMPARADOS = ['tipo', 'tipo_documento', 'nome', 'responsavel_tecnico']
+CAMPOS_ATUALIZADOS = CAMPOS_COMPARADOS + ['updated_at']
+
+# Nomes de coluna aceitos no CSV (em minúsculas) -> campo da Entidade
+COLUNAS = {
+    'tipo': 'tipo',
+    'tipo_documento': 'tipo_documento',
+    'numero_documento': 'numero_documento',
+    'documento': 'numero_documento',
+    'cnes': 'numero_documento',
+    'nome': 'nome',
+    'nome_fantasia': 'nome',
+    'responsavel_tecnico': 'responsavel_tecnico',
+}
+
+
+def ler_csv_entidades(arquivo):
+    """
+    Lê o CSV de entidades (separado por vírgula ou ponto e vírgula, UTF-8 ou
+    Latin-1, como nas planilhas do CNES) e gera (linha, dict de campos).
+    A primeira linha deve ser o cabeçalho; colunas desconhecidas são ignoradas.
+    """
+    conteudo = arquivo.read()
+    if isinstance(conteudo, bytes):
+        try:
+            conteudo = conteudo.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            conteudo = conteudo.decode('latin-1')
+
+    primeira_linha = conteudo.split('\n', 1)[0]
+    delimitador = ';' if primeira_linha.count(';') > primeira_linha.count(',') else ','
+    leitor = csv.reader(io.StringIO(conteudo), delimiter=delimitador)
+
+    cabecalho = [COLUNAS.get(coluna.strip().lower()) for coluna in next(leitor, [])]
+    if 'numero_documento' not in cabecalho:
+        raise ValueError("O arquivo precisa de uma coluna 'numero_documento' (ou 'cnes').")
+
+    for linha, valores in enumerate(leitor, start=2):
+        if not any(valor.strip() for valor in valores):
+            continue
+        yield linha, {
+            campo: valor.strip()
+            for campo, valor in zip(cabecalho, valores)
+            if campo is not None
+        }
+
+
+def _opcoes(choices):
+    # Aceita tanto o valor gravado quanto o rótulo exibido, sem diferenciar maiúsculas
+    opcoes = {}
+    for valor, rotulo in choices:
+        opcoes[valor.lower()] = valor
+        opcoes[rotulo.lower()] = valor
+    return opcoes
+
+
+TIPOS = _opcoes(Entidade.TIPO_CHOICES)
+TIPOS_DOCUMENTO = _opcoes(Entidade.TIPO_DOC_CHOICES)
+
+
+def _validar(campos, tipo_padrao, tipo_documento_padrao):
+    """
+    Monta a Entidade de uma linha, ou devolve o motivo da rejeição.
+    """
+    tipo = campos.get('tipo') or tipo_padrao or ''
+    tipo_documento = campos.get('tipo_documento') or tipo_documento_padrao or ''
+    campos = {
+        'tipo': TIPOS.get(tipo.lower()),
+        'tipo_documento': TIPOS_DOCUMENTO.get(tipo_documento.lower()),
+        'numero_documento': campos.get('numero_documento', ''),
+        'nome': campos.get('nome', ''),
+        'responsavel_tecnico': campos.get('responsavel_tecnico') or None,
+    }
+
+    if not campos['numero_documento']:
+        return None, "número do documento vazio"
+    if not campos['nome']:
+        return None, "nome vazio"
+    if campos['tipo'] is None:
+        return None, f"tipo '{tipo}' inválido"
+    if campos['tipo_documento'] is None:
+        return None, f"tipo de documento '{tipo_documento}' inválido"
+    for campo in ('numero_documento', 'nome', 'responsavel_tecnico'):
+        limite = Entidade._meta.get_field(campo).max_length
+        if campos[campo] and len(campos[campo]) > limite:
+            return None, f"{campo} passa de {limite} caracteres"
+    return Entidade(**campos), None
+
+
+def importar_entidades(linhas, tipo_padrao=None, tipo_documento_padrao=None):
+    """
+    Cadastra ou atualiza (upsert pelo numero_documento) as entidades das
+    linhas (linha, campos), em lotes com bulk_create(update_conflicts=True).
+    `tipo_padrao` e `tipo_documento_padrao` valem para linhas sem essas colunas.
+
+    Retorna um dict com 'inseridas', 'atualizadas', 'inalteradas' e
+    'rejeitadas' (lista de (linha, motivo)).
+    """
+    rejeitadas = []
+    por_documento = {}
+    for linha, campos in linhas:
+        entidade, motivo = _validar(campos, tipo_padrao, tipo_documento_padrao)
+        if entidade is None:
+            rejeitadas.append((linha, motivo))
+            continue
+        # Um mesmo documento não pode aparecer duas vezes no mesmo INSERT ... ON CONFLICT
+        anterior = por_documento.pop(entidade.numero_documento, None)
+        if anterior is not None:
+            rejeitadas.append((anterior[0], f"documento repetido na linha {linha}; vale a última"))
+        por_documento[entidade.numero_documento] = (linha, entidade)
+
+    entidades = [entidade for _, entidade in por_documento.values()]
+    inseridas = atualizadas = inalteradas = 0
+    with transaction.atomic():
+        for inicio in range(0, len(entidades), ENTIDADES_POR_LOTE):
+            lote = entidades[inicio:inicio + ENTIDADES_POR_LOTE]
+
+            # Valores atuais do lote, para contar inserções/atualizações e
+            # não regravar entidades que vieram iguais (reimportação da mesma lista)
+            atuais = {
+                linha[0]: linha[1:]
+                for linha in Entidade.objects.filter(
+                    numero_documento__in=[entidade.numero_documento for entidade in lote]
+                ).values_list('numero_documento', *CAMPOS_COMPARADOS)
+            }
+            gravar = [
+                entidade for entidade in lote
+                if atuais.get(entidade.numero_documento) != tuple(getattr(entidade, campo) for campo in CAMPOS_COMPARADOS)
+            ]
+            if gravar:
+                Entidade.objects.bulk_create(
+                    gravar,
+                    update_conflicts=True,
+                    unique_fields=['numero_documento'],
+                    update_fields=CAMPOS_ATUALIZADOS,
+                )
+
+            novas = sum(1 for entidade in gravar if entidade.numero_documento not in atuais)
+            inseridas += novas
+            atualizadas += len(gravar) - novas
+            inalteradas += len(lote) - len(gravar)
+
+        # O bulk_create não dispara post_save, então a busca é invalidada aqui
+        if inseridas or atualizadas:
+            invalidar(CADASTRO_ENTIDADES)
+
+    return {
+        'inseridas': inseridas,
+        'atualizadas': atualizadas,
+        'inalteradas': inalteradas,
+        'rejeitadas': sorted(rejeitadas),
+    }
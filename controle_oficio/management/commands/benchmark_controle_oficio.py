@@ -0,0 +1,190 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from controle_oficio.estatisticas import datas_de_recebimento
+from controle_oficio.models import Bloco, Entidade, Ficha
+
+
+# Quantidade de fichas usada nos cenários de distribuição e de lote
+FICHAS_POR_LOTE = 30
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede tempo e número de queries das principais telas e ações do controle de ofícios '
+        '(dashboard, detalhe da entidade, lista de blocos, distribuição e lotes) e grava o '
+        'resultado em JSON. Com --comparar, aponta regressões em relação a uma execução anterior. '
+        'As ações que alteram dados são desfeitas ao final de cada repetição.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help='Repetições de cada cenário.')
+        parser.add_argument('--saida', help='Arquivo JSON onde gravar o resultado (padrão: só exibe).')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para comparar.')
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.2,
+            help='Aumento relativo de tempo (mediana) aceito antes de apontar regressão. Padrão: 0.2 (20%%).',
+        )
+        parser.add_argument('--usuario', help='Usuário usado nas requisições (padrão: primeiro superusuário ativo).')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes deve ser maior que zero.')
+
+        client = self._cliente(options['usuario'])
+        resultado = {
+            'gerado_em': timezone.now().isoformat(),
+            'repeticoes': options['repeticoes'],
+            'volume': {
+                'blocos': Bloco.objects.count(),
+                'fichas': Ficha.objects.count(),
+                'entidades': Entidade.objects.count(),
+            },
+            'cenarios': {},
+        }
+
+        for nome, requisicao in self._cenarios():
+            resultado['cenarios'][nome] = self._medir(client, requisicao, options['repeticoes'])
+            medicao = resultado['cenarios'][nome]
+            self.stdout.write(
+                f"{nome:<32} HTTP {medicao['status']}  {medicao['queries']:>4} queries  "
+                f"{medicao['tempo_ms']['mediana']:>9.2f} ms (mediana)"
+            )
+
+        conteudo = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo)
+            self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}."))
+        else:
+            self.stdout.write(conteudo)
+
+        if options['comparar']:
+            self._comparar(resultado, options['comparar'], options['tolerancia'])
+
+    def _cliente(self, username):
+        usuarios = get_user_model().objects.filter(is_active=True)
+        usuario = usuarios.filter(username=username).first() if username else usuarios.filter(is_superuser=True).first()
+        if usuario is None:
+            raise CommandError('Nenhum usuário encontrado para as requisições. Informe --usuario.')
+
+        # O Client usa "testserver" como host; fora dos testes ele precisa estar em ALLOWED_HOSTS
+        hosts = [host for host in settings.ALLOWED_HOSTS if host]
+        if '*' in hosts or 'testserver' in hosts:
+            client = Client()
+        else:
+            client = Client(HTTP_HOST=hosts[0].lstrip('.') if hosts else 'localhost')
+        client.force_login(usuario)
+        return client
+
+    def _cenarios(self):
+        """
+        Monta a lista (nome, função que recebe o client e faz a requisição) com
+        dados reais do banco: a entidade com mais fichas em mãos, o bloco com
+        mais fichas disponíveis e as datas de recebimento mais recentes.
+        """
+        entidade = (
+            Entidade.objects
+            .annotate(em_maos=Count('fichas', filter=Q(fichas__status='Distribuida')))
+            .order_by('-em_maos', 'pk')
+            .first()
+        )
+        if entidade is None:
+            raise CommandError('Não há entidades no banco. Rode antes o comando gerar_dados_sinteticos.')
+        outra_entidade = Entidade.objects.exclude(pk=entidade.pk).order_by('pk').first() or entidade
+
+        fichas_em_maos = list(
+            entidade.fichas.filter(status='Distribuida').order_by('numero').values_list('id', flat=True)[:FICHAS_POR_LOTE]
+        )
+        disponiveis = list(
+            Ficha.objects.filter(status='Disponível').order_by('numero').values_list('numero', flat=True)[:FICHAS_POR_LOTE]
+        )
+        datas = [dia.isoformat() for dia in datas_de_recebimento()[:5]]
+
+        url_entidade = reverse('entidade_detail', args=[entidade.pk])
+        return [
+            ('dashboard', lambda c: c.get(reverse('controle_oficio_dashboard'))),
+            ('dashboard_htmx_datas', lambda c: c.get(
+                reverse('controle_oficio_dashboard'), {'datas': datas}, HTTP_HX_REQUEST='true'
+            )),
+            ('entidade_detail', lambda c: c.get(url_entidade)),
+            ('estoque_disponivel', lambda c: c.get(
+                reverse('estoque_disponivel', args=[entidade.pk]), {'tipo': 'DO'}, HTTP_HX_REQUEST='true'
+            )),
+            ('bloco_list', lambda c: c.get(reverse('bloco_list'))),
+            ('distribuir_fichas', lambda c: c.post(
+                reverse('distribuir_fichas', args=[entidade.pk]), {'fichas': disponiveis}
+            )),
+            ('transferir_fichas_em_lote', lambda c: c.post(reverse('transferir_fichas_em_lote'), {
+                'ficha_ids': fichas_em_maos,
+                'nova_entidade_id': outra_entidade.pk,
+                'entidade_origem_id': entidade.pk,
+            })),
+            ('dar_desfecho_em_lote', lambda c: c.post(reverse('dar_desfecho_em_lote'), {
+                'ficha_ids': fichas_em_maos,
+                'status': 'Utilizada',
+                'entidade_id': entidade.pk,
+            })),
+        ]
+
+    def _medir(self, client, requisicao, repeticoes):
+        tempos = []
+        queries = 0
+        status = None
+        for _ in range(repeticoes):
+            # Cada repetição roda numa transação desfeita, então as ações em lote
+            # sempre encontram o mesmo estado inicial
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as contexto:
+                    inicio = time.perf_counter()
+                    resposta = requisicao(client)
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                transaction.set_rollback(True)
+            queries = max(queries, len(contexto))
+            status = resposta.status_code
+
+        return {
+            'status': status,
+            'queries': queries,
+            'tempo_ms': {
+                'min': round(min(tempos), 3),
+                'mediana': round(statistics.median(tempos), 3),
+                'max': round(max(tempos), 3),
+            },
+        }
+
+    def _comparar(self, resultado, caminho, tolerancia):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)['cenarios']
+        except (OSError, ValueError, KeyError) as erro:
+            raise CommandError(f'Não foi possível ler {caminho}: {erro}')
+
+        regressoes = []
+        for nome, atual in resultado['cenarios'].items():
+            base = anterior.get(nome)
+            if base is None:
+                continue
+            if atual['queries'] > base['queries']:
+                regressoes.append(f"{nome}: queries {base['queries']} -> {atual['queries']}")
+            if atual['tempo_ms']['mediana'] > base['tempo_ms']['mediana'] * (1 + tolerancia):
+                regressoes.append(
+                    f"{nome}: mediana {base['tempo_ms']['mediana']:.2f} ms -> {atual['tempo_ms']['mediana']:.2f} ms"
+                )
+
+        if regressoes:
+            for regressao in regressoes:
+                self.stdout.write(self.style.ERROR(regressao))
+            raise CommandError(f'{len(regressoes)} regressão(ões) em relação a {caminho}.')
+        self.stdout.write(self.style.SUCCESS(f'Sem regressões em relação a {caminho}.'))
@@ -0,0 +1,169 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from controle_oficio.estatisticas import filtro_data_recebimento, intervalos_por_datas
+from controle_oficio.models import Bloco, Entidade, Ficha
+from controle_oficio.views import BlocoListView, consulta_estoque_disponivel, consulta_fichas_entidade
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera uma massa sintética de fichas (padrão: 5 milhões) dentro de uma transação, '
+        'roda EXPLAIN nas consultas quentes das views e confere se usam índices. '
+        'Nada é gravado: a transação é desfeita no final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fichas', type=int, default=5_000_000, help='Quantidade de fichas sintéticas.')
+        parser.add_argument('--entidades', type=int, default=2000, help='Quantidade de entidades sintéticas.')
+        parser.add_argument('--analyze', action='store_true', help='Usa EXPLAIN ANALYZE (executa as consultas).')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Este benchmark só roda no PostgreSQL.')
+
+        with transaction.atomic():
+            inicio = time.monotonic()
+            self._gerar_massa(options['fichas'], options['entidades'])
+            self.stdout.write(f"Massa sintética gerada em {time.monotonic() - inicio:.1f}s.")
+
+            resultados = [
+                self._explicar(nome, queryset, options['analyze'])
+                for nome, queryset in self._consultas_quentes()
+            ]
+            transaction.set_rollback(True)
+
+        falhas = [r for r in resultados if r['seq_scan_fichas']]
+        for r in resultados:
+            situacao = self.style.ERROR('SEQ SCAN') if r['seq_scan_fichas'] else self.style.SUCCESS('índice')
+            self.stdout.write(f"{r['nome']:<40} {situacao:<20} {', '.join(sorted(r['indices'])) or '-'}")
+            if r['tempo_ms'] is not None:
+                self.stdout.write(f"{'':<40} {r['tempo_ms']:.2f} ms")
+
+        if falhas:
+            raise CommandError(f"{len(falhas)} consulta(s) fazem Seq Scan na tabela de fichas.")
+
+    def _gerar_massa(self, total_fichas, total_entidades):
+        tabela_ficha = Ficha._meta.db_table
+        tabela_bloco = Bloco._meta.db_table
+        tabela_entidade = Entidade._meta.db_table
+        total_blocos = max(total_fichas // Bloco.FICHAS_POR_BLOCO, 2)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {tabela_entidade} (tipo, tipo_documento, numero_documento, nome, created_at, updated_at)
+                SELECT 'Medico', 'CPF', 'bench-' || g, 'Entidade sintética ' || g, now(), now()
+                FROM generate_series(1, %s) g
+                RETURNING id
+                """,
+                [total_entidades],
+            )
+            ids_entidades = [linha[0] for linha in cursor.fetchall()]
+
+            # Metade DO (8 dígitos, a partir de 90000000) e metade DNV (10 dígitos, a partir de 9000000000)
+            cursor.execute(
+                f"""
+                INSERT INTO {tabela_bloco} (tipo, numero_inicial, data_recebimento)
+                SELECT
+                    CASE WHEN g %% 2 = 0 THEN 'DO' ELSE 'DNV' END,
+                    CASE WHEN g %% 2 = 0
+                        THEN (90000000 + (g / 2) * 30)::text
+                        ELSE (9000000000 + (g / 2) * 30)::text
+                    END,
+                    now() - (random() * interval '1500 days')
+                FROM generate_series(0, %s - 1) g
+                ON CONFLICT (numero_inicial) DO NOTHING
+                """,
+                [total_blocos],
+            )
+
+            # Distribuição de status parecida com a produção: maioria finalizada, parte em estoque
+            cursor.execute(
+                f"""
+                INSERT INTO {tabela_ficha} (
+                    numero, bloco_id, tipo, status, entidade_id, data_recebimento,
+                    data_entrega, data_desfecho, created_at, updated_at
+                )
+                SELECT
+                    lpad((b.numero_inicial::bigint + i)::text, length(b.numero_inicial), '0'),
+                    b.id, b.tipo, s.status,
+                    CASE WHEN s.status = 'Disponível' THEN NULL ELSE (%s::bigint[])[1 + floor(random() * %s)::int] END,
+                    b.data_recebimento,
+                    CASE WHEN s.status = 'Disponível' THEN NULL ELSE b.data_recebimento + interval '10 days' END,
+                    CASE WHEN s.status IN ('Utilizada', 'Cancelada')
+                        THEN b.data_recebimento + (random() * interval '200 days') END,
+                    now(), now()
+                FROM {tabela_bloco} b
+                CROSS JOIN generate_series(0, %s - 1) i
+                CROSS JOIN LATERAL (
+                    SELECT CASE
+                        WHEN r < 0.15 THEN 'Disponível'
+                        WHEN r < 0.25 THEN 'Distribuida'
+                        WHEN r < 0.95 THEN 'Utilizada'
+                        ELSE 'Cancelada'
+                    END AS status
+                    FROM (SELECT random() + i * 0 + b.id * 0 AS r) aleatorio
+                ) s
+                WHERE b.numero_inicial LIKE '9%%'
+                ON CONFLICT (numero) DO NOTHING
+                """,
+                [ids_entidades, len(ids_entidades), Bloco.FICHAS_POR_BLOCO],
+            )
+            cursor.execute(f"ANALYZE {tabela_entidade}, {tabela_bloco}, {tabela_ficha}")
+
+    def _consultas_quentes(self):
+        entidade = Entidade.objects.filter(numero_documento='bench-1').first()
+        bloco = Bloco.objects.filter(numero_inicial='90000000').first()
+        hoje = timezone.localdate()
+        data_limite = timezone.now() - timedelta(days=30)
+
+        return [
+            ('dashboard: filtro por datas', (
+                Ficha.objects
+                .filter(filtro_data_recebimento(intervalos_por_datas([hoje - timedelta(days=3), hoje])))
+                .values('status').annotate(quantidade=Count('id')).order_by()
+            )),
+            ('entidade: fichas da página', consulta_fichas_entidade(entidade, data_limite)),
+            ('entidade: estoque disponível (DO)', consulta_estoque_disponivel('DO')[:21]),
+            ('bloco: fichas disponíveis', bloco.fichas.filter(status='Disponível').only('id', 'numero')),
+            ('lote: desfecho/transferência', Ficha.objects.filter(
+                id__in=list(entidade.fichas.values_list('id', flat=True)[:30]),
+                entidade=entidade,
+                status='Distribuida',
+            )),
+            ('distribuição por intervalo', Ficha.objects.filter(
+                tipo='DO', numero__range=('90000000', '90000029')
+            )),
+            ('entidade: distribuídas por tipo', Ficha.objects.filter(
+                entidade=entidade, tipo='DO', status='Distribuida'
+            )),
+            ('entidade: uso recente', Ficha.objects.filter(
+                Q(entidade=entidade) & Q(data_desfecho__gte=data_limite)
+            )),
+            ('blocos: primeira página', BlocoListView().get_queryset()[:BlocoListView.paginate_by]),
+        ]
+
+    def _explicar(self, nome, queryset, analyze):
+        plano = json.loads(queryset.explain(format='json', analyze=analyze))[0]
+        nos = list(self._percorrer(plano['Plan']))
+        tabela_ficha = Ficha._meta.db_table
+        return {
+            'nome': nome,
+            'seq_scan_fichas': any(
+                no['Node Type'] == 'Seq Scan' and no.get('Relation Name') == tabela_ficha for no in nos
+            ),
+            'indices': {no['Index Name'] for no in nos if 'Index Name' in no},
+            'tempo_ms': plano.get('Execution Time'),
+        }
+
+    def _percorrer(self, no):
+        yield no
+        for filho in no.get('Plans', []):
+            yield from self._percorrer(filho)
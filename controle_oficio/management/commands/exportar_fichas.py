@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controle_oficio.exportacao import consulta_exportacao, copiar_csv
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta em CSV o histórico das fichas (com bloco, entidade e desfecho) usando COPY ... TO STDOUT. '
+        'Filtra por dias de recebimento (--data, ou --inicio/--fim) e por entidade.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('saida', help='Arquivo CSV a gravar.')
+        parser.add_argument('--data', action='append', default=[], help='Dia de recebimento (AAAA-MM-DD); pode repetir.')
+        parser.add_argument('--inicio', help='Primeiro dia do período de recebimento (AAAA-MM-DD).')
+        parser.add_argument('--fim', help='Último dia do período de recebimento (AAAA-MM-DD).')
+        parser.add_argument('--entidade', type=int, help='ID da entidade.')
+
+    def handle(self, *args, **options):
+        try:
+            datas = [date.fromisoformat(dia) for dia in options['data']]
+            if options['inicio'] or options['fim']:
+                if not (options['inicio'] and options['fim']):
+                    raise CommandError('Informe --inicio e --fim juntos.')
+                inicio, fim = date.fromisoformat(options['inicio']), date.fromisoformat(options['fim'])
+                # Dias consecutivos viram um único intervalo no filtro, como no dashboard
+                datas += [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+        except ValueError:
+            raise CommandError('Data inválida. Use o formato AAAA-MM-DD.')
+
+        fichas = consulta_exportacao(datas, options['entidade'])
+        try:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as arquivo:
+                copiar_csv(fichas, arquivo)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Histórico exportado para {options['saida']}."))
@@ -0,0 +1,156 @@
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from controle_oficio.models import Bloco, Entidade, Ficha, ResumoDiarioFicha
+
+
+# Prefixo do numero_documento das entidades geradas, para identificá-las depois
+PREFIXO_DOCUMENTO = 'SINT'
+
+# Tipo de entidade -> tipo de documento usado na geração
+DOCUMENTO_POR_TIPO_ENTIDADE = {
+    'Medico': 'CPF',
+    'Estabelecimento': 'CNES',
+    'Parteiro': 'RG',
+    'Enfermeiro': 'COREN',
+    'IML': 'CNES',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera uma massa de dados realista para medir o controle de ofícios em escala: '
+        'entidades, blocos (com fichas via Bloco.gerar_fichas) recebidos ao longo de anos '
+        'e o histórico de distribuição e desfecho das fichas. Use em um banco descartável.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocos', type=int, default=20000, help='Quantidade de blocos (30 fichas cada).')
+        parser.add_argument('--entidades', type=int, default=2000, help='Quantidade de entidades.')
+        parser.add_argument('--anos', type=int, default=3, help='Período, em anos, em que os blocos foram recebidos.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório (resultados reproduzíveis).')
+
+    def handle(self, *args, **options):
+        if options['blocos'] < 1 or options['entidades'] < 1 or options['anos'] < 1:
+            raise CommandError('--blocos, --entidades e --anos devem ser maiores que zero.')
+
+        aleatorio = random.Random(options['semente'])
+        agora = timezone.now()
+
+        ids_entidades = self._gerar_entidades(options['entidades'], aleatorio)
+        self.stdout.write(f'{len(ids_entidades)} entidades disponíveis para a geração.')
+
+        blocos = self._gerar_blocos(options['blocos'], options['anos'], agora, aleatorio)
+        self.stdout.write(f'{len(blocos)} blocos criados ({len(blocos) * Bloco.FICHAS_POR_BLOCO} fichas).')
+
+        alteradas = self._gerar_historico(blocos, ids_entidades, agora, aleatorio)
+        self.stdout.write(self.style.SUCCESS(f'Histórico gerado: {alteradas} fichas distribuídas ou finalizadas.'))
+
+    def _gerar_entidades(self, quantidade, aleatorio):
+        inicio = Entidade.objects.filter(numero_documento__startswith=PREFIXO_DOCUMENTO).count()
+        tipos = list(DOCUMENTO_POR_TIPO_ENTIDADE)
+        novas = []
+        for n in range(inicio + 1, inicio + quantidade + 1):
+            tipo = aleatorio.choice(tipos)
+            novas.append(Entidade(
+                tipo=tipo,
+                tipo_documento=DOCUMENTO_POR_TIPO_ENTIDADE[tipo],
+                numero_documento=f'{PREFIXO_DOCUMENTO}{n:07d}',
+                nome=f'Entidade sintética {n}',
+            ))
+        Entidade.objects.bulk_create(novas, batch_size=1000)
+        return list(
+            Entidade.objects
+            .filter(numero_documento__startswith=PREFIXO_DOCUMENTO)
+            .values_list('id', flat=True)
+        )
+
+    def _gerar_blocos(self, quantidade, anos, agora, aleatorio):
+        # Os números continuam depois da maior ficha existente de cada tipo, para não colidir
+        proximo_numero = {}
+        for tipo in Bloco.TAMANHO_NUMERO_POR_TIPO:
+            maior = Ficha.objects.filter(tipo=tipo).aggregate(maior=Max('numero'))['maior']
+            proximo_numero[tipo] = int(maior) + 1 if maior else 10 ** (Bloco.TAMANHO_NUMERO_POR_TIPO[tipo] - 1)
+
+        # Datas em ordem crescente: blocos mais novos recebem números maiores, como na prática
+        periodo = timedelta(days=365 * anos)
+        datas = sorted(agora - aleatorio.random() * periodo for _ in range(quantidade))
+
+        blocos = []
+        for data_recebimento in datas:
+            tipo = 'DO' if aleatorio.random() < 0.4 else 'DNV'
+            blocos.append(Bloco(
+                tipo=tipo,
+                numero_inicial=Bloco.formatar_numero(tipo, proximo_numero[tipo]),
+                data_recebimento=data_recebimento,
+            ))
+            proximo_numero[tipo] += Bloco.FICHAS_POR_BLOCO
+
+        # bulk_create não dispara o post_save, então as fichas são geradas explicitamente
+        for inicio in range(0, len(blocos), 500):
+            with transaction.atomic():
+                lote = Bloco.objects.bulk_create(blocos[inicio:inicio + 500])
+                for bloco in lote:
+                    bloco.gerar_fichas()
+        return blocos
+
+    def _gerar_historico(self, blocos, ids_entidades, agora, aleatorio):
+        """
+        Sorteia a história de cada bloco: quanto mais antigo, maior a chance de ter
+        sido entregue a uma entidade e de suas fichas já terem desfecho.
+        """
+        linhas = []
+        deltas = Counter()
+        periodo = max((agora - blocos[0].data_recebimento).days, 1)
+
+        for bloco in blocos:
+            idade = (agora - bloco.data_recebimento).days
+            if aleatorio.random() > 0.3 + 0.65 * idade / periodo:
+                continue  # Bloco ainda no estoque
+
+            entidade_id = aleatorio.choice(ids_entidades)
+            data_entrega = min(bloco.data_recebimento + timedelta(days=aleatorio.randint(1, 60)), agora)
+            dias_com_entidade = (agora - data_entrega).days
+            chance_desfecho = min(0.97, dias_com_entidade / 365)
+
+            for i in range(Bloco.FICHAS_POR_BLOCO):
+                numero = Bloco.formatar_numero(bloco.tipo, int(bloco.numero_inicial) + i)
+                if aleatorio.random() < chance_desfecho:
+                    status = 'Utilizada' if aleatorio.random() < 0.9 else 'Cancelada'
+                    data_desfecho = data_entrega + aleatorio.random() * (agora - data_entrega)
+                else:
+                    status, data_desfecho = 'Distribuida', None
+                linhas.append((numero, status, entidade_id, data_entrega, data_desfecho))
+
+                deltas[ResumoDiarioFicha.objects.chave(bloco.data_recebimento, bloco.tipo, 'Disponível', None)] -= 1
+                deltas[ResumoDiarioFicha.objects.chave(bloco.data_recebimento, bloco.tipo, status, entidade_id)] += 1
+
+        with transaction.atomic():
+            for inicio in range(0, len(linhas), 1000):
+                self._atualizar_fichas(linhas[inicio:inicio + 1000])
+            ResumoDiarioFicha.objects.aplicar_deltas(deltas)
+        return len(linhas)
+
+    def _atualizar_fichas(self, linhas):
+        # Um UPDATE ... FROM (VALUES ...) por lote, em vez de um save() por ficha
+        valores = ', '.join(['(%s, %s, %s, %s, %s)'] * len(linhas))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Ficha._meta.db_table} AS f
+                SET status = v.status,
+                    entidade_id = v.entidade_id::bigint,
+                    data_entrega = v.data_entrega::timestamptz,
+                    data_desfecho = v.data_desfecho::timestamptz,
+                    updated_at = now()
+                FROM (VALUES {valores}) AS v (numero, status, entidade_id, data_entrega, data_desfecho)
+                WHERE f.numero = v.numero
+                """,
+                [valor for linha in linhas for valor in linha],
+            )
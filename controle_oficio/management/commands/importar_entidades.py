@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from controle_oficio.importacao import importar_entidades, ler_csv_entidades
+from controle_oficio.models import Entidade
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa entidades de um CSV (ex.: lista do CNES), cadastrando ou atualizando '
+        'pelo numero_documento. Colunas: tipo, tipo_documento, numero_documento (ou cnes), '
+        'nome (ou nome_fantasia), responsavel_tecnico.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo CSV com cabeçalho.')
+        parser.add_argument('--tipo', help='Tipo para as linhas sem a coluna tipo (ex.: Estabelecimento).')
+        parser.add_argument(
+            '--tipo-documento', dest='tipo_documento',
+            help='Tipo de documento para as linhas sem a coluna tipo_documento (ex.: CNES).',
+        )
+        parser.add_argument('--mostrar', type=int, default=20, help='Quantas linhas rejeitadas listar.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar_entidades(
+                    ler_csv_entidades(arquivo),
+                    tipo_padrao=options['tipo'],
+                    tipo_documento_padrao=options['tipo_documento'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['inseridas']} entidade(s) inserida(s), {resultado['atualizadas']} atualizada(s), "
+            f"{resultado['inalteradas']} sem alteração, {len(resultado['rejeitadas'])} linha(s) rejeitada(s)."
+        ))
+        for linha, motivo in resultado['rejeitadas'][:options['mostrar']]:
+            self.stdout.write(self.style.WARNING(f'Linha {linha}: {motivo}'))
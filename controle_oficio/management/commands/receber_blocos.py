@@ -0,0 +1,49 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from controle_oficio.models import Bloco
+from controle_oficio.recebimento import BlocosInvalidos, interpretar_numeros_iniciais, ler_csv_blocos, receber_blocos
+
+
+class Command(BaseCommand):
+    help = (
+        'Recebe uma remessa de blocos de uma vez (todos os blocos e fichas na mesma transação). '
+        'Informe os números iniciais e/ou um CSV com "tipo;numero_inicial" por linha.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('numeros', nargs='*', help='Números iniciais dos blocos.')
+        parser.add_argument('--tipo', choices=list(Bloco.TAMANHO_NUMERO_POR_TIPO), help='Tipo dos blocos (DO ou DNV).')
+        parser.add_argument('--csv', help='Arquivo CSV com os blocos.')
+        parser.add_argument('--data', help='Data de recebimento (AAAA-MM-DD). Padrão: agora.')
+
+    def handle(self, *args, **options):
+        data_recebimento = None
+        if options['data']:
+            try:
+                dia = date.fromisoformat(options['data'])
+            except ValueError:
+                raise CommandError('Data inválida. Use o formato AAAA-MM-DD.')
+            data_recebimento = timezone.make_aware(datetime.combine(dia, time.min))
+
+        try:
+            numeros = interpretar_numeros_iniciais(' '.join(options['numeros']))
+            if numeros and not options['tipo']:
+                raise CommandError('Informe --tipo para os números iniciais.')
+            blocos = [(options['tipo'], numero) for numero in numeros]
+            if options['csv']:
+                with open(options['csv'], encoding='utf-8-sig') as arquivo:
+                    blocos += ler_csv_blocos(arquivo, tipo_padrao=options['tipo'])
+            criados = receber_blocos(blocos, data_recebimento)
+        except BlocosInvalidos as e:
+            for erro in e.erros:
+                self.stderr.write(erro)
+            raise CommandError('Remessa recusada; nenhum bloco foi gravado.')
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(criados)} bloco(s) recebido(s), com {len(criados) * Bloco.FICHAS_POR_BLOCO} fichas geradas.'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from controle_oficio.models import ResumoDiarioFicha
+
+
+class Command(BaseCommand):
+    help = 'Recalcula do zero o resumo diário de fichas (dia x tipo x status x entidade).'
+
+    def handle(self, *args, **options):
+        linhas = ResumoDiarioFicha.objects.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Resumo reconstruído com {linhas} linhas.'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 21:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def popular_resumo(apps, schema_editor):
+    Ficha = apps.get_model('controle_oficio', 'Ficha')
+    ResumoDiarioFicha = apps.get_model('controle_oficio', 'ResumoDiarioFicha')
+    linhas = (
+        Ficha.objects
+        .order_by()
+        .annotate(dia=TruncDate('data_recebimento'))
+        .values('dia', 'tipo', 'status', 'entidade_id')
+        .annotate(quantidade=Count('id'))
+    )
+    ResumoDiarioFicha.objects.bulk_create((ResumoDiarioFicha(**linha) for linha in linhas), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle_oficio', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiarioFicha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('tipo', models.CharField(choices=[('DO', 'Declaração de Óbito'), ('DNV', 'Declaração de Nascido Vivo')], max_length=3)),
+                ('status', models.CharField(choices=[('Disponível', 'Disponível'), ('Distribuida', 'Distribuída'), ('Utilizada', 'Utilizada'), ('Cancelada', 'Cancelada'), ('Verificar', 'Verificar')], max_length=15)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('entidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos', to='controle_oficio.entidade')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'tipo', 'status', 'entidade'), name='resumo_ficha_chave_unica', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(popular_resumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 21:42
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices criados com CREATE INDEX CONCURRENTLY para não travar a tabela de fichas
+    atomic = False
+
+    dependencies = [
+        ('controle_oficio', '0002_resumodiarioficha'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='bloco',
+            index=models.Index(fields=['-data_recebimento', '-id'], name='bloco_recebimento_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ficha',
+            index=models.Index(fields=['entidade', 'tipo', 'status'], name='ficha_ent_tipo_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ficha',
+            index=models.Index(condition=models.Q(('data_desfecho__isnull', False)), fields=['entidade', 'data_desfecho'], name='ficha_ent_desfecho_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ficha',
+            index=models.Index(condition=models.Q(('status', 'Disponível')), fields=['bloco', 'numero'], name='ficha_disp_bloco_numero_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ficha',
+            index=models.Index(fields=['data_recebimento'], name='ficha_data_recebimento_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:00
+
+import controle_oficio.models
+import django.contrib.postgres.constraints
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def verificar_sobreposicoes(apps, schema_editor):
+    """
+    As constraints de exclusão não podem ser criadas se já houver blocos sobrepostos;
+    lista os pares para que sejam corrigidos antes de aplicar a migração.
+    """
+    tabela = apps.get_model('controle_oficio', 'Bloco')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT a.numero_inicial, b.numero_inicial
+            FROM {tabela} a
+            JOIN {tabela} b ON a.tipo = b.tipo AND a.id < b.id
+                AND a.numero_inicio <= b.numero_fim AND b.numero_inicio <= a.numero_fim
+            ORDER BY a.numero_inicial
+            LIMIT 50
+            """
+        )
+        pares = cursor.fetchall()
+    if pares:
+        lista = ', '.join(f'{a} x {b}' for a, b in pares)
+        raise RuntimeError(f'Existem blocos com faixas de números sobrepostas; corrija antes de migrar: {lista}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle_oficio', '0003_indices_fichas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloco',
+            name='numero_fim',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('numero_inicial', models.BigIntegerField()), '+', models.Value(29)), output_field=models.BigIntegerField()),
+        ),
+        migrations.AddField(
+            model_name='bloco',
+            name='numero_inicio',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Cast('numero_inicial', models.BigIntegerField()), output_field=models.BigIntegerField()),
+        ),
+        migrations.RunPython(verificar_sobreposicoes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bloco',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('tipo', 'DO')), expressions=[(controle_oficio.models.FaixaNumeros('numero_inicio', 'numero_fim'), '&&')], name='bloco_faixa_do_sem_sobreposicao', violation_error_message='A faixa de números deste bloco se sobrepõe à de outro bloco.'),
+        ),
+        migrations.AddConstraint(
+            model_name='bloco',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('tipo', 'DNV')), expressions=[(controle_oficio.models.FaixaNumeros('numero_inicio', 'numero_fim'), '&&')], name='bloco_faixa_dnv_sem_sobreposicao', violation_error_message='A faixa de números deste bloco se sobrepõe à de outro bloco.'),
+        ),
+    ]
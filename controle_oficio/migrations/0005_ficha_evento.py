@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle_oficio', '0004_faixa_numeros_bloco'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FichaEvento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('acao', models.CharField(choices=[('Distribuicao', 'Distribuição'), ('Desfecho', 'Desfecho'), ('Transferencia', 'Transferência')], max_length=15)),
+                ('status_anterior', models.CharField(choices=[('Disponível', 'Disponível'), ('Distribuida', 'Distribuída'), ('Utilizada', 'Utilizada'), ('Cancelada', 'Cancelada'), ('Verificar', 'Verificar')], max_length=15)),
+                ('status_novo', models.CharField(choices=[('Disponível', 'Disponível'), ('Distribuida', 'Distribuída'), ('Utilizada', 'Utilizada'), ('Cancelada', 'Cancelada'), ('Verificar', 'Verificar')], max_length=15)),
+                ('data_evento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('entidade', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_fichas', to='controle_oficio.entidade')),
+                ('entidade_anterior', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_de_saida', to='controle_oficio.entidade')),
+                ('ficha', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='controle_oficio.ficha')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-data_evento', '-id'],
+                'indexes': [models.Index(fields=['ficha', 'data_evento'], name='evento_ficha_data_idx'), models.Index(fields=['entidade', 'data_evento'], name='evento_entidade_data_idx'), models.Index(condition=models.Q(('entidade_anterior__isnull', False)), fields=['entidade_anterior', 'data_evento'], name='evento_ent_anterior_data_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:29
+
+import warnings
+
+from django.db import DatabaseError, migrations, models, transaction
+
+
+# Índices GIN de trigramas para a busca por trecho (icontains vira UPPER(...) LIKE '%...%')
+INDICES_TRIGRAMA = {
+    'entidade_nome_trgm_idx': 'UPPER(nome::text) gin_trgm_ops',
+    'entidade_documento_trgm_idx': 'UPPER(numero_documento::text) gin_trgm_ops',
+}
+
+
+def criar_indices_trigrama(apps, schema_editor):
+    """
+    Cria a extensão pg_trgm e os índices de trigramas da busca de entidades.
+    Se o servidor não tiver a extensão (ou o usuário não puder criá-la), a
+    busca continua funcionando, só que percorrendo a tabela; o aviso abaixo e
+    o check controle_oficio.W001 indicam os índices que faltam.
+    """
+    tabela = apps.get_model('controle_oficio', 'Entidade')._meta.db_table
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as erro:
+        warnings.warn(
+            f"Não foi possível criar a extensão pg_trgm ({erro}). Os índices {', '.join(INDICES_TRIGRAMA)} "
+            "não foram criados e a busca de entidades vai percorrer a tabela inteira."
+        )
+        return
+    for nome, expressao in INDICES_TRIGRAMA.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} USING gin ({expressao})')
+
+
+def remover_indices_trigrama(apps, schema_editor):
+    for nome in INDICES_TRIGRAMA:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nome}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle_oficio', '0005_ficha_evento'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='entidade',
+            options={'ordering': ['nome', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='entidade',
+            index=models.Index(fields=['nome', 'id'], name='entidade_nome_id_idx'),
+        ),
+        migrations.RunPython(criar_indices_trigrama, remover_indices_trigrama),
+    ]
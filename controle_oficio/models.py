@@ -1,10 +1,44 @@
-from django.db import models
+from collections import Counter
+
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Cast, TruncDate
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import BigIntegerRangeField, RangeOperators
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
+from .cache import BLOCO, CADASTRO_ENTIDADES, ENTIDADE, FICHAS, invalidar
+
+
+class FaixaNumeros(models.Func):
+    """
+    int8range fechado [inicio, fim] com os números das fichas de um bloco.
+    """
+    function = 'int8range'
+    template = "%(function)s(%(expressions)s, '[]')"
+    output_field = BigIntegerRangeField()
+
+
+class BlocoQuerySet(models.QuerySet):
+
+    def sobrepostos(self, faixas):
+        """
+        Blocos cuja faixa de números cruza alguma das faixas (tipo, inicio, fim)
+        informadas. Usa o mesmo int8range das constraints de exclusão, então cada
+        faixa é resolvida pelo índice GiST do tipo em vez de percorrer as fichas.
+        """
+        filtro = Q()
+        for tipo, inicio, fim in faixas:
+            filtro |= Q(tipo=tipo, faixa_numeros__overlap=(inicio, fim + 1))
+        if not filtro:
+            return self.none()
+        return self.annotate(faixa_numeros=FaixaNumeros('numero_inicio', 'numero_fim')).filter(filtro)
+
 
 class Bloco(models.Model):
     TIPO_CHOICES = [
@@ -26,21 +60,110 @@ class Bloco(models.Model):
     )
     data_recebimento = models.DateTimeField(default=timezone.now)
 
-    def gerar_fichas(self):
-        fichas_a_criar = []
-        tamanho = 8 if self.tipo == 'DO' else 10  # tamanho fixo por tipo
-        for i in range(30):
-            numero_ficha = str(int(self.numero_inicial) + i).zfill(tamanho)
-            fichas_a_criar.append(
-                Ficha(
-                    numero=numero_ficha,
-                    bloco=self,
-                    tipo=self.tipo,
-                    data_recebimento=self.data_recebimento
-                )
+    FICHAS_POR_BLOCO = 30
+    TAMANHO_NUMERO_POR_TIPO = {'DO': 8, 'DNV': 10}  # tamanho fixo por tipo
+
+    # Primeiro e último número do bloco como inteiros, calculados pelo banco
+    numero_inicio = models.GeneratedField(
+        expression=Cast('numero_inicial', models.BigIntegerField()),
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+    )
+    numero_fim = models.GeneratedField(
+        expression=Cast('numero_inicial', models.BigIntegerField()) + (FICHAS_POR_BLOCO - 1),
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+    )
+
+    objects = BlocoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listagem de blocos (mais recentes primeiro)
+            models.Index(fields=['-data_recebimento', '-id'], name='bloco_recebimento_idx'),
+        ]
+        # Dois blocos do mesmo tipo não podem ter faixas de números que se cruzam.
+        # Uma constraint parcial por tipo dispensa a extensão btree_gist.
+        constraints = [
+            ExclusionConstraint(
+                name='bloco_faixa_do_sem_sobreposicao',
+                expressions=[(FaixaNumeros('numero_inicio', 'numero_fim'), RangeOperators.OVERLAPS)],
+                condition=Q(tipo='DO'),
+                violation_error_message='A faixa de números deste bloco se sobrepõe à de outro bloco.',
+            ),
+            ExclusionConstraint(
+                name='bloco_faixa_dnv_sem_sobreposicao',
+                expressions=[(FaixaNumeros('numero_inicio', 'numero_fim'), RangeOperators.OVERLAPS)],
+                condition=Q(tipo='DNV'),
+                violation_error_message='A faixa de números deste bloco se sobrepõe à de outro bloco.',
+            ),
+        ]
+
+    def clean(self):
+        super().clean()
+        if not self.tipo or not self.numero_inicial or not self.numero_inicial.isdigit():
+            return
+
+        inicio = int(self.numero_inicial)
+        sobreposto = (
+            Bloco.objects
+            .sobrepostos([(self.tipo, inicio, inicio + self.FICHAS_POR_BLOCO - 1)])
+            .exclude(pk=self.pk)
+            .first()
+        )
+        if sobreposto is not None:
+            raise ValidationError({
+                'numero_inicial': f"As fichas deste bloco se sobrepõem ao bloco {sobreposto.numero_inicial} "
+                                  f"({sobreposto.numero_inicial} a {self.formatar_numero(self.tipo, sobreposto.numero_fim)}).",
+            })
+
+    @classmethod
+    def formatar_numero(cls, tipo, numero):
+        return str(int(numero)).zfill(cls.TAMANHO_NUMERO_POR_TIPO[tipo])
+
+    def construir_fichas(self):
+        """
+        Monta (sem salvar) as 30 fichas sequenciais do bloco.
+        """
+        return [
+            Ficha(
+                numero=self.formatar_numero(self.tipo, int(self.numero_inicial) + i),
+                bloco=self,
+                tipo=self.tipo,
+                data_recebimento=self.data_recebimento
             )
+            for i in range(self.FICHAS_POR_BLOCO)
+        ]
+
+    def gerar_fichas(self):
+        fichas_a_criar = self.construir_fichas()
         Ficha.objects.bulk_create(fichas_a_criar)
 
+        # Todas as fichas novas entram no resumo como disponíveis e sem entidade
+        ResumoDiarioFicha.objects.aplicar_deltas(Counter({
+            ResumoDiarioFicha.objects.chave(self.data_recebimento, self.tipo, 'Disponível', None): len(fichas_a_criar)
+        }))
+
+
+class FichaQuerySet(models.QuerySet):
+
+    def dar_desfecho(self, status, **campos):
+        """
+        Marca as fichas como 'Utilizada'/'Cancelada' numa única query, com o
+        mesmo carimbo de data_desfecho do Ficha.save(): só as fichas que mudam
+        de status recebem a data. Retorna o número de fichas atualizadas.
+        """
+        if status not in ['Utilizada', 'Cancelada']:
+            raise ValueError(f"Status de desfecho inválido: {status}")
+        return self.update(
+            status=status,
+            data_desfecho=Case(
+                When(~Q(status=status), then=Value(timezone.now())),
+                default=F('data_desfecho'),
+            ),
+            **campos,
+        )
+
 
 class Ficha(models.Model):
     STATUS_CHOICES = [
@@ -67,16 +190,111 @@ class Ficha(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = FichaQuerySet.as_manager()
+
+    # Campos cujo valor carregado do banco é guardado para detectar mudanças no save()
+    CAMPOS_RASTREADOS = ('status', 'entidade_id', 'tipo', 'data_recebimento')
+
     class Meta:
         ordering = ['numero']
+        indexes = [
+            # Página da entidade, lotes de desfecho/transferência e contagens por entidade
+            models.Index(fields=['entidade', 'tipo', 'status'], name='ficha_ent_tipo_status_idx'),
+            # Uso recente por entidade (estatística de 30 dias)
+            models.Index(
+                fields=['entidade', 'data_desfecho'],
+                name='ficha_ent_desfecho_idx',
+                condition=Q(data_desfecho__isnull=False),
+            ),
+            # Estoque disponível por bloco: só as fichas disponíveis entram no índice
+            models.Index(
+                fields=['bloco', 'numero'],
+                name='ficha_disp_bloco_numero_idx',
+                condition=Q(status='Disponível'),
+            ),
+            # Filtro por data de recebimento do dashboard
+            models.Index(fields=['data_recebimento'], name='ficha_data_recebimento_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._guardar_valores_originais()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._guardar_valores_originais()
+
+    def _guardar_valores_originais(self):
+        self._valores_originais = {
+            campo: self.__dict__[campo] for campo in self.CAMPOS_RASTREADOS if campo in self.__dict__
+        }
+
+    def _valores_no_banco(self):
+        """
+        Valores rastreados como estão no banco, sem consulta extra quando a
+        instância veio do banco. Retorna None para fichas ainda não gravadas.
+        """
+        if self._state.adding:
+            return None
+        originais = dict(getattr(self, '_valores_originais', {}))
+        faltando = [campo for campo in self.CAMPOS_RASTREADOS if campo not in originais]
+        if faltando:
+            # Instância montada à mão ou com campos adiados (.only/.defer): busca só o que falta
+            do_banco = Ficha.objects.filter(pk=self.pk).values(*faltando).first()
+            if do_banco is None:
+                return None
+            originais.update(do_banco)
+        return originais
 
     def save(self, *args, **kwargs):
-        # Checar alteração de status
-        if self.pk:
-            old = Ficha.objects.get(pk=self.pk)
-            if old.status != self.status and self.status in ['Utilizada', 'Cancelada']:
-                self.data_desfecho = timezone.now()
-        super().save(*args, **kwargs)
+        # Checar alteração de status (valores originais guardados ao carregar a ficha)
+        originais = self._valores_no_banco()
+        update_fields = kwargs.get('update_fields')
+        if originais and originais['status'] != self.status and self.status in ['Utilizada', 'Cancelada']:
+            self.data_desfecho = timezone.now()
+            if update_fields is not None and 'data_desfecho' not in update_fields:
+                kwargs['update_fields'] = update_fields = [*update_fields, 'data_desfecho']
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ResumoDiarioFicha.objects.aplicar_deltas(self._deltas_resumo(originais, update_fields))
+
+        if originais is not None and update_fields is not None:
+            # Campos fora de update_fields continuam com o valor antigo no banco
+            campos = {self._meta.get_field(nome).attname for nome in update_fields}
+            self._valores_originais = {
+                campo: getattr(self, campo) if campo in campos else originais[campo]
+                for campo in self.CAMPOS_RASTREADOS
+            }
+        else:
+            self._guardar_valores_originais()
+
+    def _deltas_resumo(self, originais, update_fields=None):
+        """
+        Diferença no resumo diário entre o estado anterior (originais) e o que foi gravado.
+        Campos fora de update_fields continuam com o valor antigo no banco.
+        """
+        campos = {self._meta.get_field(nome).attname for nome in update_fields} if update_fields is not None else None
+
+        def valor_gravado(campo):
+            if originais is not None and campos is not None and campo not in campos:
+                return originais[campo]
+            return getattr(self, campo)
+
+        deltas = Counter()
+        if originais is not None:
+            deltas[ResumoDiarioFicha.objects.chave(
+                originais['data_recebimento'], originais['tipo'], originais['status'], originais['entidade_id']
+            )] -= 1
+        deltas[ResumoDiarioFicha.objects.chave(
+            valor_gravado('data_recebimento'),
+            valor_gravado('tipo'),
+            valor_gravado('status'),
+            valor_gravado('entidade_id'),
+        )] += 1
+        return deltas
 
     def __str__(self):
         return f"Ficha {self.numero} - {self.get_tipo_display()}"
@@ -88,6 +306,50 @@ def criar_fichas_apos_bloco(sender, instance, created, **kwargs):
     if created:
         instance.gerar_fichas()
 
+
+@receiver(post_save, sender=Bloco)
+@receiver(post_delete, sender=Bloco)
+def invalidar_cache_do_bloco(sender, instance, **kwargs):
+    invalidar(FICHAS)
+    invalidar(BLOCO, [instance.pk])
+
+
+@receiver(post_save, sender='controle_oficio.Ficha')
+def invalidar_cache_da_ficha(sender, instance, **kwargs):
+    # O resumo diário já troca a versão geral; aqui vão o bloco e as entidades
+    # de antes e de depois (os valores originais ainda não foram atualizados)
+    entidade_anterior = getattr(instance, '_valores_originais', {}).get('entidade_id')
+    invalidar(BLOCO, [instance.bloco_id])
+    invalidar(ENTIDADE, [entidade_id for entidade_id in (entidade_anterior, instance.entidade_id) if entidade_id is not None])
+
+
+@receiver(post_delete, sender='controle_oficio.Ficha')
+def remover_ficha_do_resumo(sender, instance, **kwargs):
+    ResumoDiarioFicha.objects.aplicar_deltas(
+        Counter({ResumoDiarioFicha.objects.chave_da_ficha(instance): -1})
+    )
+    invalidar(BLOCO, [instance.bloco_id])
+    if instance.entidade_id is not None:
+        invalidar(ENTIDADE, [instance.entidade_id])
+
+
+@receiver(pre_delete, sender='controle_oficio.Entidade')
+def mover_resumo_da_entidade(sender, instance, **kwargs):
+    # As fichas da entidade ficam sem entidade (SET_NULL) via UPDATE, sem passar pelo save().
+    deltas = Counter()
+    for linha in instance.resumos.exclude(quantidade=0):
+        deltas[(linha.dia, linha.tipo, linha.status, None)] += linha.quantidade
+    ResumoDiarioFicha.objects.aplicar_deltas(deltas)
+    instance.resumos.all().delete()
+    invalidar(ENTIDADE, [instance.pk])
+
+
+@receiver(post_save, sender='controle_oficio.Entidade')
+@receiver(post_delete, sender='controle_oficio.Entidade')
+def invalidar_busca_de_entidades(sender, instance, **kwargs):
+    invalidar(CADASTRO_ENTIDADES)
+
+
 class Entidade(models.Model):
     TIPO_CHOICES = [
         ('Medico', 'Médico'),
@@ -114,7 +376,205 @@ class Entidade(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['nome']
+        ordering = ['nome', 'id']
+        indexes = [
+            # Ordem da listagem e da paginação por chave (nome, id).
+            # Os índices de trigramas da busca são criados pela migração 0006, se houver pg_trgm.
+            models.Index(fields=['nome', 'id'], name='entidade_nome_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} ({self.get_tipo_display()})"
+
+
+class ResumoDiarioFichaManager(models.Manager):
+
+    def chave(self, data_recebimento, tipo, status, entidade_id):
+        return (timezone.localdate(data_recebimento), tipo, status, entidade_id)
+
+    def chave_da_ficha(self, ficha):
+        return self.chave(ficha.data_recebimento, ficha.tipo, ficha.status, ficha.entidade_id)
+
+    def deltas_de_atualizacao(self, estados, **novos_valores):
+        """
+        Monta os deltas para um .update() em lote.
+        `estados` são tuplas (data_recebimento, tipo, status, entidade_id) lidas
+        antes do update; `novos_valores` aceita 'status' e/ou 'entidade_id'.
+        """
+        deltas = Counter()
+        for data_recebimento, tipo, status, entidade_id in estados:
+            deltas[self.chave(data_recebimento, tipo, status, entidade_id)] -= 1
+            deltas[self.chave(
+                data_recebimento,
+                tipo,
+                novos_valores.get('status', status),
+                novos_valores.get('entidade_id', entidade_id),
+            )] += 1
+        return deltas
+
+    def aplicar_deltas(self, deltas):
+        """
+        Soma os deltas {(dia, tipo, status, entidade_id): quantidade} no resumo
+        com um único INSERT ... ON CONFLICT DO UPDATE, e troca a versão dos
+        contextos gerais em cache.
+        """
+        linhas = sorted(
+            ((dia, tipo, status, entidade_id, quantidade)
+             for (dia, tipo, status, entidade_id), quantidade in deltas.items() if quantidade),
+            key=lambda linha: (linha[0], linha[1], linha[2], linha[3] or 0),
+        )  # Ordem fixa para evitar deadlock entre transações concorrentes
+        if not linhas:
+            return
+
+        tabela = self.model._meta.db_table
+        valores = ', '.join(['(%s, %s, %s, %s, %s)'] * len(linhas))
+        sql = f"""
+            INSERT INTO {tabela} (dia, tipo, status, entidade_id, quantidade)
+            VALUES {valores}
+            ON CONFLICT (dia, tipo, status, entidade_id)
+            DO UPDATE SET quantidade = {tabela}.quantidade + EXCLUDED.quantidade
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [valor for linha in linhas for valor in linha])
+        # Toda mudança de ficha passa por aqui: troca a versão dos contextos gerais
+        invalidar(FICHAS)
+
+    def reconstruir(self):
+        """
+        Recalcula o resumo inteiro a partir da tabela de fichas.
+        """
+        linhas = (
+            Ficha.objects
+            .order_by()
+            .annotate(dia=TruncDate('data_recebimento'))
+            .values('dia', 'tipo', 'status', 'entidade_id')
+            .annotate(quantidade=Count('id'))
+        )
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create((self.model(**linha) for linha in linhas), batch_size=1000)
+        invalidar(FICHAS)
+        return self.count()
+
+
+class ResumoDiarioFicha(models.Model):
+    """
+    Contagem de fichas por dia de recebimento x tipo x status x entidade.
+    Mantido de forma incremental pelas rotinas que alteram as fichas,
+    para que os painéis leiam poucas linhas em vez da tabela de fichas inteira.
+    """
+    dia = models.DateField()
+    tipo = models.CharField(max_length=3, choices=Bloco.TIPO_CHOICES)
+    status = models.CharField(max_length=15, choices=Ficha.STATUS_CHOICES)
+    entidade = models.ForeignKey('Entidade', null=True, blank=True, on_delete=models.CASCADE, related_name='resumos')
+    quantidade = models.IntegerField(default=0)
+
+    objects = ResumoDiarioFichaManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dia', 'tipo', 'status', 'entidade'],
+                name='resumo_ficha_chave_unica',
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.tipo} {self.status}: {self.quantidade}"
+
+
+class FichaEventoQuerySet(models.QuerySet):
+
+    def registrar(self, acao, estados, usuario=None, data_evento=None, **novos_valores):
+        """
+        Grava os eventos de um .update() em lote com um único INSERT.
+        `estados` são tuplas (ficha_id, status, entidade_id) lidas antes do
+        update; `novos_valores` aceita 'status' e/ou 'entidade_id', como em
+        ResumoDiarioFicha.objects.deltas_de_atualizacao().
+        """
+        data_evento = data_evento or timezone.now()
+        return self.bulk_create([
+            self.model(
+                ficha_id=ficha_id,
+                acao=acao,
+                status_anterior=status,
+                status_novo=novos_valores.get('status', status),
+                entidade_anterior_id=entidade_id,
+                entidade_id=novos_valores.get('entidade_id', entidade_id),
+                usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+                data_evento=data_evento,
+            )
+            for ficha_id, status, entidade_id in estados
+        ])
+
+    def update(self, **kwargs):
+        raise TypeError("O histórico de fichas não pode ser alterado.")
+
+    def linha_do_tempo(self, ficha):
+        """
+        Eventos de uma ficha, do mais antigo ao mais recente.
+        """
+        return self.filter(ficha=ficha).order_by('data_evento', 'id')
+
+    def da_entidade(self, entidade, inicio=None, fim=None):
+        """
+        Eventos em que a entidade recebeu ou perdeu fichas no período [inicio, fim).
+        """
+        eventos = self.filter(Q(entidade=entidade) | Q(entidade_anterior=entidade))
+        if inicio is not None:
+            eventos = eventos.filter(data_evento__gte=inicio)
+        if fim is not None:
+            eventos = eventos.filter(data_evento__lt=fim)
+        return eventos.order_by('-data_evento', '-id')
+
+
+class FichaEvento(models.Model):
+    """
+    Histórico das fichas: uma linha por mudança de status ou de entidade,
+    só de inclusão. A Ficha guarda apenas o estado atual.
+    """
+    ACAO_CHOICES = [
+        ('Distribuicao', 'Distribuição'),
+        ('Desfecho', 'Desfecho'),
+        ('Transferencia', 'Transferência'),
+    ]
+
+    # Sem o índice automático das FKs: os índices compostos do Meta começam por elas
+    ficha = models.ForeignKey('Ficha', on_delete=models.CASCADE, related_name='eventos', db_index=False)
+    acao = models.CharField(max_length=15, choices=ACAO_CHOICES)
+    status_anterior = models.CharField(max_length=15, choices=Ficha.STATUS_CHOICES)
+    status_novo = models.CharField(max_length=15, choices=Ficha.STATUS_CHOICES)
+    entidade_anterior = models.ForeignKey(
+        'Entidade', null=True, blank=True, on_delete=models.SET_NULL, related_name='eventos_de_saida', db_index=False
+    )
+    entidade = models.ForeignKey(
+        'Entidade', null=True, blank=True, on_delete=models.SET_NULL, related_name='eventos_fichas', db_index=False
+    )
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    data_evento = models.DateTimeField(default=timezone.now)
+
+    objects = FichaEventoQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-data_evento', '-id']
+        indexes = [
+            # Linha do tempo de uma ficha
+            models.Index(fields=['ficha', 'data_evento'], name='evento_ficha_data_idx'),
+            # Eventos de uma entidade num período (fichas recebidas)
+            models.Index(fields=['entidade', 'data_evento'], name='evento_entidade_data_idx'),
+            # ... e fichas que saíram dela (transferências)
+            models.Index(
+                fields=['entidade_anterior', 'data_evento'],
+                name='evento_ent_anterior_data_idx',
+                condition=Q(entidade_anterior__isnull=False),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError("O histórico de fichas não pode ser alterado.")
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.nome} ({self.get_tipo_display()})"
\ No newline at end of file
+        return f"{self.ficha_id} {self.get_acao_display()}: {self.status_anterior} -> {self.status_novo}"
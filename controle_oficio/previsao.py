@@ -0,0 +1,144 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import FICHAS, chave, em_cache, versao
+from .estatisticas import STATUS_FINALIZADOS, _inicio_do_dia
+from .models import Entidade, Ficha, ResumoDiarioFicha
+
+
+# Janelas (em dias) das taxas de consumo. A previsão usa a maior das duas:
+# a curta reage a um aumento recente, a longa não deixa um mês fraco esconder o uso normal.
+JANELA_CURTA_DIAS = 30
+JANELA_LONGA_DIAS = 90
+
+# Dias de estoque abaixo dos quais a entidade entra em alerta
+LIMITE_CRITICO_DIAS = 15
+LIMITE_ATENCAO_DIAS = 30
+
+# Situações, da mais urgente para a menos urgente
+SITUACOES = ['Sem estoque', 'Crítico', 'Atenção', 'OK', 'Sem consumo']
+
+
+def serie_consumo(inicio):
+    """
+    Fichas finalizadas (utilizadas ou canceladas) por entidade, tipo e dia
+    a partir de `inicio`, numa única query agrupada.
+    """
+    return (
+        Ficha.objects
+        .filter(entidade__isnull=False, data_desfecho__gte=inicio, status__in=STATUS_FINALIZADOS)
+        .annotate(dia=TruncDate('data_desfecho'))
+        .order_by()
+        .values_list('entidade_id', 'tipo', 'dia')
+        .annotate(quantidade=Count('id'))
+    )
+
+
+def estoque_por_entidade():
+    """
+    Fichas distribuídas (em mãos) por entidade e tipo, lidas do resumo diário.
+    """
+    return (
+        ResumoDiarioFicha.objects
+        .filter(entidade__isnull=False, status='Distribuida')
+        .order_by()
+        .values_list('entidade_id', 'tipo')
+        .annotate(estoque=Sum('quantidade'))
+        .filter(estoque__gt=0)
+    )
+
+
+def calcular_previsao(hoje=None):
+    """
+    Previsão de fim do estoque em mãos de cada entidade e tipo (DO/DNV).
+
+    Monta a matriz (entidade, tipo) x dia do consumo dos últimos
+    JANELA_LONGA_DIAS dias e calcula de uma vez, para todas as entidades, as
+    taxas diárias das duas janelas e os dias de estoque restantes.
+
+    Retorna uma lista de dicts, da situação mais urgente para a menos urgente.
+    """
+    hoje = hoje or timezone.localdate()
+    dias = [hoje - timedelta(days=i) for i in range(JANELA_LONGA_DIAS - 1, -1, -1)]
+
+    consumo = pd.DataFrame.from_records(
+        list(serie_consumo(_inicio_do_dia(dias[0]))),
+        columns=['entidade_id', 'tipo', 'dia', 'quantidade'],
+    )
+    estoque = pd.DataFrame.from_records(
+        list(estoque_por_entidade()),
+        columns=['entidade_id', 'tipo', 'estoque'],
+    ).set_index(['entidade_id', 'tipo'])['estoque']
+
+    # Dias sem consumo entram como zero, para as médias serem por dia corrido
+    matriz = (
+        consumo.pivot_table(index=['entidade_id', 'tipo'], columns='dia', values='quantidade', aggfunc='sum')
+        .reindex(columns=dias)
+        .fillna(0)
+    )
+    valores = matriz.to_numpy(dtype=float)
+    taxas = pd.DataFrame({
+        'consumo_30_dias': valores[:, -JANELA_CURTA_DIAS:].sum(axis=1),
+        'taxa_curta': valores[:, -JANELA_CURTA_DIAS:].mean(axis=1),
+        'taxa_longa': valores.mean(axis=1),
+    }, index=matriz.index)
+
+    previsao = taxas.join(estoque, how='outer').fillna(0)
+    if previsao.empty:
+        return []
+
+    taxa = np.maximum(previsao['taxa_curta'].to_numpy(), previsao['taxa_longa'].to_numpy())
+    em_maos = previsao['estoque'].to_numpy()
+    dias_restantes = np.divide(em_maos, taxa, out=np.full(len(taxa), np.inf), where=taxa > 0)
+
+    situacao = np.select(
+        [
+            (em_maos == 0) & (taxa > 0),
+            dias_restantes < LIMITE_CRITICO_DIAS,
+            dias_restantes < LIMITE_ATENCAO_DIAS,
+            taxa > 0,
+        ],
+        SITUACOES[:4],
+        default='Sem consumo',
+    )
+
+    previsao = previsao.assign(
+        taxa_diaria=taxa,
+        dias_restantes=dias_restantes,
+        situacao=situacao,
+        ordem=pd.Categorical(situacao, categories=SITUACOES).codes,
+    ).reset_index()
+    nomes = dict(
+        Entidade.objects.filter(pk__in=previsao['entidade_id'].unique().tolist()).values_list('id', 'nome')
+    )
+    previsao['entidade_nome'] = previsao['entidade_id'].map(nomes)
+    previsao = previsao.sort_values(['ordem', 'dias_restantes', 'entidade_nome'])
+
+    return [
+        {
+            'entidade_id': int(linha.entidade_id),
+            'entidade_nome': linha.entidade_nome,
+            'tipo': linha.tipo,
+            'estoque': int(linha.estoque),
+            'consumo_30_dias': int(linha.consumo_30_dias),
+            'taxa_diaria': round(float(linha.taxa_diaria), 2),
+            'dias_restantes': None if np.isinf(linha.dias_restantes) else int(linha.dias_restantes),
+            'data_prevista': None if np.isinf(linha.dias_restantes) else hoje + timedelta(days=int(linha.dias_restantes)),
+            'situacao': linha.situacao,
+        }
+        for linha in previsao.itertuples(index=False)
+    ]
+
+
+def previsao_reposicao():
+    """
+    Previsão de todas as entidades, guardada em cache até a próxima mudança
+    nas fichas (ou até o dia seguinte, quando as janelas andam).
+    """
+    hoje = timezone.localdate()
+    return em_cache(chave('previsao_reposicao', versao(FICHAS), hoje), lambda: calcular_previsao(hoje))
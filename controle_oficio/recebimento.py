@@ -0,0 +1,157 @@
+import csv
+import io
+import re
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Bloco, Ficha, ResumoDiarioFicha
+
+
+# Limite de blocos por recebimento em lote
+LIMITE_BLOCOS_POR_RECEBIMENTO = 1000
+
+
+class BlocosInvalidos(ValueError):
+    """
+    Recebimento recusado; `erros` traz uma mensagem por problema encontrado.
+    """
+
+    def __init__(self, erros):
+        super().__init__(' '.join(erros))
+        self.erros = erros
+
+
+def interpretar_numeros_iniciais(texto):
+    """
+    Lê os números iniciais dos blocos separados por vírgula, ponto e vírgula,
+    espaço ou quebra de linha. Lança ValueError para trechos inválidos.
+    """
+    numeros = []
+    for parte in re.split(r'[,;\s]+', texto or ''):
+        if not parte:
+            continue
+        if not parte.isdigit():
+            raise ValueError(f"Número inicial inválido: '{parte}'. Use apenas dígitos.")
+        numeros.append(int(parte))
+    return numeros
+
+
+def ler_csv_blocos(arquivo, tipo_padrao=None):
+    """
+    Lê um CSV (separado por vírgula ou ponto e vírgula) com uma linha por bloco:
+    "tipo;numero_inicial" ou só "numero_inicial" (usa `tipo_padrao`).
+    Um cabeçalho na primeira linha é ignorado.
+
+    Retorna uma lista de tuplas (tipo, numero_inicial).
+    """
+    conteudo = arquivo.read()
+    if isinstance(conteudo, bytes):
+        conteudo = conteudo.decode('utf-8-sig')
+
+    blocos = []
+    leitor = csv.reader(io.StringIO(conteudo.replace(';', ',')))
+    for linha, colunas in enumerate(leitor, start=1):
+        colunas = [coluna.strip() for coluna in colunas if coluna.strip()]
+        if not colunas:
+            continue
+        tipo, numero = (colunas[0].upper(), colunas[1]) if len(colunas) > 1 else (tipo_padrao, colunas[0])
+        if not numero.isdigit():
+            if linha == 1:
+                continue  # Cabeçalho
+            raise ValueError(f"Linha {linha}: número inicial inválido '{numero}'.")
+        if tipo not in Bloco.TAMANHO_NUMERO_POR_TIPO:
+            raise ValueError(f"Linha {linha}: informe o tipo do bloco (DO ou DNV).")
+        blocos.append((tipo, int(numero)))
+    return blocos
+
+
+def validar_blocos(blocos):
+    """
+    Confere uma lista de (tipo, numero_inicial) antes de gravar: tamanho do número
+    para o tipo, sobreposição entre os próprios blocos informados e sobreposição
+    com as faixas dos blocos já cadastrados (uma única query).
+
+    Retorna a lista de mensagens de erro (vazia quando está tudo certo).
+    """
+    if not blocos:
+        return ["Informe ao menos um bloco."]
+    if len(blocos) > LIMITE_BLOCOS_POR_RECEBIMENTO:
+        return [f"Foram informados {len(blocos)} blocos; o limite por recebimento é {LIMITE_BLOCOS_POR_RECEBIMENTO}."]
+
+    erros = []
+    for tipo, inicio in blocos:
+        ultimo = inicio + Bloco.FICHAS_POR_BLOCO - 1
+        if len(str(ultimo)) > Bloco.TAMANHO_NUMERO_POR_TIPO[tipo]:
+            erros.append(
+                f"Bloco {tipo} {inicio}: as fichas passariam de {Bloco.TAMANHO_NUMERO_POR_TIPO[tipo]} dígitos."
+            )
+    if erros:
+        return erros
+
+    # Sobreposição entre os blocos do próprio lote: ordenados, dois vizinhos não podem distar menos de 30
+    ordenados = sorted(blocos)
+    for (tipo_anterior, anterior), (tipo, inicio) in zip(ordenados, ordenados[1:]):
+        if tipo == tipo_anterior and inicio - anterior < Bloco.FICHAS_POR_BLOCO:
+            erros.append(
+                f"Blocos {tipo} {Bloco.formatar_numero(tipo, anterior)} e "
+                f"{Bloco.formatar_numero(tipo, inicio)} se sobrepõem."
+            )
+
+    # Sobreposição com blocos já cadastrados: uma única query, com cada faixa
+    # resolvida pelo índice GiST dos blocos, sem procurar ficha por ficha
+    faixas = [(tipo, inicio, inicio + Bloco.FICHAS_POR_BLOCO - 1) for tipo, inicio in blocos]
+    existentes = list(Bloco.objects.sobrepostos(faixas).only('tipo', 'numero_inicial', 'numero_inicio', 'numero_fim').order_by('numero_inicio'))
+    for tipo, inicio, fim in faixas:
+        for existente in existentes:
+            if existente.tipo == tipo and existente.numero_inicio <= fim and inicio <= existente.numero_fim:
+                erros.append(
+                    f"Bloco {tipo} {Bloco.formatar_numero(tipo, inicio)}: "
+                    f"sobrepõe o bloco {existente.numero_inicial} já cadastrado."
+                )
+                break
+    return erros
+
+
+def receber_blocos(blocos, data_recebimento=None):
+    """
+    Cadastra de uma vez os blocos informados como (tipo, numero_inicial) e as
+    suas fichas: um INSERT para os blocos, outro para as fichas e uma
+    atualização do resumo diário, tudo na mesma transação.
+
+    Lança BlocosInvalidos com os problemas encontrados, sem gravar nada.
+    Retorna a lista de blocos criados.
+    """
+    blocos = list(dict.fromkeys(blocos))  # Remove repetidos mantendo a ordem
+    erros = validar_blocos(blocos)
+    if erros:
+        raise BlocosInvalidos(erros)
+
+    data_recebimento = data_recebimento or timezone.now()
+    novos = [
+        Bloco(tipo=tipo, numero_inicial=Bloco.formatar_numero(tipo, inicio), data_recebimento=data_recebimento)
+        for tipo, inicio in blocos
+    ]
+
+    try:
+        with transaction.atomic():
+            # bulk_create não dispara o post_save, então as fichas são inseridas aqui mesmo
+            criados = Bloco.objects.bulk_create(novos)
+            Ficha.objects.bulk_create(
+                [ficha for bloco in criados for ficha in bloco.construir_fichas()],
+                batch_size=5000,
+            )
+
+            deltas = Counter()
+            for bloco in criados:
+                deltas[ResumoDiarioFicha.objects.chave(bloco.data_recebimento, bloco.tipo, 'Disponível', None)] += Bloco.FICHAS_POR_BLOCO
+            ResumoDiarioFicha.objects.aplicar_deltas(deltas)
+    except IntegrityError:
+        # Outro recebimento (ou o mesmo enviado duas vezes) gravou blocos sobrepostos
+        # entre a validação e o INSERT: as constraints recusam e a remessa é validada de novo
+        raise BlocosInvalidos(
+            validar_blocos(blocos) or ["Os blocos foram cadastrados por outro recebimento ao mesmo tempo. Confira a lista de blocos."]
+        )
+
+    return criados
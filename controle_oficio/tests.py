@@ -1,3 +1,1165 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+
+from .models import Bloco, Entidade, Ficha, FichaEvento, ResumoDiarioFicha
+from .cache import BLOCO, invalidar, versao
+from .checks import verificar_indices_busca
+from .distribuicao import distribuir_intervalos, distribuir_numeros, interpretar_intervalos, resumir_numeros
+from .estatisticas import estatisticas_fichas, estatisticas_resumo, intervalos_por_datas
+from .importacao import importar_entidades, ler_csv_entidades
+from .previsao import calcular_previsao
+from .views import ENTIDADES_POR_PAGINA, LIMITE_BUSCA_ENTIDADES, codificar_cursor
+from . import recebimento
+from .recebimento import BlocosInvalidos, receber_blocos, validar_blocos
+
+
+# Os testes não usam o cache configurado (em disco, no ARQUIVO), que é o mesmo da aplicação
+CACHES_DE_TESTE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'}}
+
+
+def criar_cenario(alvo):
+    """
+    Cenário comum dos testes: o usuário 'testuser', um bloco DO 10000000 (fichas
+    10000000 a 10000029 disponíveis) e a entidade 'Dra. Teste', guardados em
+    `alvo` (a classe, no setUpTestData, ou o próprio teste).
+    """
+    alvo.user = User.objects.create_user(username='testuser', password='testpass123')
+    alvo.bloco = Bloco.objects.create(tipo='DO', numero_inicial='10000000')
+    alvo.entidade = Entidade.objects.create(
+        tipo='Medico', tipo_documento='CPF', numero_documento='123', nome='Dra. Teste'
+    )
+
+
+def criar_outra_entidade():
+    return Entidade.objects.create(
+        tipo='Estabelecimento', tipo_documento='CNES', numero_documento='456', nome='Hospital Teste'
+    )
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class UsuarioLogadoTestCase(TestCase):
+    """
+    Base dos testes de views: o usuário 'testuser', logado em cada teste.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def setUp(self):
+        self.client.login(username='testuser', password='testpass123')
+
+
+class CenarioTestCase(UsuarioLogadoTestCase):
+    """
+    Base com o cenário comum (ver criar_cenario()), com o usuário logado.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        criar_cenario(cls)
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class EstatisticasFichasTestCase(TestCase):
+    """
+    Testes para o cálculo das estatísticas do dashboard.
+    """
+
+    def setUp(self):
+        self.ontem = timezone.now() - timedelta(days=1)
+        self.bloco_do = Bloco.objects.create(tipo='DO', numero_inicial='10000000', data_recebimento=self.ontem)
+        self.bloco_dnv = Bloco.objects.create(tipo='DNV', numero_inicial='2000000000')
+        self.entidade = Entidade.objects.create(
+            tipo='Medico', tipo_documento='CPF', numero_documento='123', nome='Dra. Teste'
+        )
+        Ficha.objects.filter(numero__in=['10000000', '10000001']).update(status='Distribuida', entidade=self.entidade)
+        Ficha.objects.filter(numero='2000000000').update(status='Utilizada', entidade=self.entidade)
+
+    def test_contagens_em_uma_query(self):
+        """
+        Testa se todas as contagens (geral e por tipo) saem de uma única query.
+        """
+        with self.assertNumQueries(1):
+            estatisticas = estatisticas_fichas()
+
+        self.assertEqual(estatisticas['total'], 60)
+        self.assertEqual(estatisticas['disponiveis'], 57)
+        self.assertEqual(estatisticas['distribuidas'], 2)
+        self.assertEqual(estatisticas['finalizadas'], 1)
+        self.assertEqual(estatisticas['por_tipo']['DO']['distribuidas'], 2)
+        self.assertEqual(estatisticas['por_tipo']['DNV']['finalizadas'], 1)
+
+    def test_filtro_por_datas(self):
+        """
+        Testa o filtro por data de recebimento usando intervalos na coluna bruta.
+        """
+        dia = timezone.localdate(self.ontem).isoformat()
+        estatisticas = estatisticas_fichas(intervalos_por_datas([dia, 'data-invalida']))
+
+        self.assertEqual(estatisticas['total'], 30)
+        self.assertEqual(estatisticas['por_tipo']['DNV']['total'], 0)
+
+    def test_datas_consecutivas_viram_um_intervalo(self):
+        intervalos = intervalos_por_datas(['2025-09-02', '2025-09-01', '2025-09-05'])
+        self.assertEqual(len(intervalos), 2)
+
+    def test_dashboard_htmx(self):
+        """
+        Testa se o refresh via HTMX retorna apenas o bloco de estatísticas.
+        """
+        User.objects.create_user(username='testuser', password='testpass123')
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        response = client.get(reverse('controle_oficio_dashboard'), HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="stats-container"')
+        self.assertNotContains(response, '<html')
+
+
+class ResumoDiarioFichaTestCase(CenarioTestCase):
+    """
+    Testes para a manutenção incremental do resumo diário de fichas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outra_entidade = criar_outra_entidade()
+
+    def assertResumoConsistente(self):
+        self.assertEqual(estatisticas_resumo(), estatisticas_fichas())
+
+    def test_gerar_fichas_alimenta_resumo(self):
+        self.assertEqual(estatisticas_resumo()['disponiveis'], 30)
+        self.assertResumoConsistente()
+
+    def test_save_e_lotes_mantem_resumo(self):
+        """
+        Testa se save(), desfecho em lote e transferência mantêm o resumo igual à contagem real.
+        """
+        fichas = list(Ficha.objects.filter(bloco=self.bloco)[:3])
+        for ficha in fichas:
+            ficha.entidade = self.entidade
+            ficha.status = 'Distribuida'
+            ficha.save(update_fields=['entidade', 'status'])
+        self.assertResumoConsistente()
+
+        self.client.post(reverse('dar_desfecho_em_lote'), {
+            'ficha_ids': [fichas[0].id],
+            'status': 'Utilizada',
+            'entidade_id': self.entidade.id,
+        })
+        self.client.post(reverse('transferir_fichas_em_lote'), {
+            'ficha_ids': [fichas[1].id, fichas[2].id],
+            'nova_entidade_id': self.outra_entidade.id,
+            'entidade_origem_id': self.entidade.id,
+        })
+        self.assertResumoConsistente()
+        self.assertEqual(
+            ResumoDiarioFicha.objects.get(entidade=self.outra_entidade, status='Distribuida').quantidade, 2
+        )
+
+    def test_exclusoes_mantem_resumo(self):
+        Ficha.objects.filter(numero='10000000').first().delete()
+        ficha = Ficha.objects.get(numero='10000001')
+        ficha.entidade = self.entidade
+        ficha.status = 'Distribuida'
+        ficha.save()
+        self.entidade.delete()
+        self.assertResumoConsistente()
+
+    def test_reconstruir(self):
+        Ficha.objects.filter(numero='10000000').update(status='Cancelada')
+        ResumoDiarioFicha.objects.reconstruir()
+        self.assertResumoConsistente()
+
+
+class FichaRastreamentoTestCase(CenarioTestCase):
+    """
+    Testes para a detecção de mudanças do Ficha.save() sem consulta extra.
+    """
+
+    def test_save_sem_select(self):
+        ficha = Ficha.objects.get(numero='10000000')
+        ficha.status = 'Utilizada'
+
+        with CaptureQueriesContext(connection) as queries:
+            ficha.save(update_fields=['status'])
+
+        self.assertFalse([q for q in queries if q['sql'].lstrip().upper().startswith('SELECT')])
+        ficha.refresh_from_db()
+        self.assertIsNotNone(ficha.data_desfecho)
+
+    def test_save_sem_mudanca_de_status_nao_carimba(self):
+        ficha = Ficha.objects.get(numero='10000000')
+        ficha.entidade = self.entidade
+        ficha.save()
+        self.assertIsNone(ficha.data_desfecho)
+
+        ficha.save()  # Segundo save parte dos valores já gravados
+        self.assertEqual(ResumoDiarioFicha.objects.get(entidade=self.entidade).quantidade, 1)
+
+    def test_desfecho_em_lote_carimba_data_desfecho(self):
+        Ficha.objects.filter(numero='10000000').dar_desfecho('Cancelada')
+        Ficha.objects.filter(numero__in=['10000000', '10000001']).dar_desfecho('Cancelada')
+
+        datas = dict(Ficha.objects.filter(status='Cancelada').values_list('numero', 'data_desfecho'))
+        self.assertLess(datas['10000000'], datas['10000001'])
+
+        # update() continua sem efeitos extras
+        Ficha.objects.filter(numero='10000002').update(status='Utilizada')
+        self.assertIsNone(Ficha.objects.get(numero='10000002').data_desfecho)
+
+
+class DistribuicaoTestCase(CenarioTestCase):
+    """
+    Testes para a distribuição de fichas em lote.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ficha.objects.filter(numero='10000001').update(status='Utilizada')
+
+    def test_classificacao_dos_numeros(self):
+        resultado = distribuir_numeros(self.entidade, ['10000002', '10000001', '99999999', '10000000', '10000002'])
+
+        self.assertEqual(resultado['distribuidos'], ['10000002', '10000000'])
+        self.assertEqual(resultado['indisponiveis'], ['10000001'])
+        self.assertEqual(resultado['invalidos'], ['99999999'])
+        self.assertEqual(Ficha.objects.filter(entidade=self.entidade, status='Distribuida').count(), 2)
+        self.assertEqual(ResumoDiarioFicha.objects.get(entidade=self.entidade).quantidade, 2)
+
+    def test_quantidade_de_queries_constante(self):
+        with CaptureQueriesContext(connection) as poucas:
+            distribuir_numeros(self.entidade, ['10000002', '10000003'])
+        with CaptureQueriesContext(connection) as muitas:
+            distribuir_numeros(self.entidade, [str(10000004 + i) for i in range(26)])
+        self.assertEqual(len(poucas), len(muitas))
+
+    def test_view_mantem_mensagens(self):
+        response = self.client.post(
+            reverse('distribuir_fichas', args=[self.entidade.id]),
+            {'fichas': ['10000000', '10000001', '99999999']},
+            follow=True,
+        )
+        mensagens = [str(m) for m in response.context['messages']]
+        self.assertIn('1 fichas distribuídas para Dra. Teste: 10000000.', mensagens)
+        self.assertIn('1 fichas já estavam indisponíveis: 10000001.', mensagens)
+        self.assertIn('1 fichas não existem no sistema: 99999999.', mensagens)
+
+
+class DistribuicaoIntervaloTestCase(CenarioTestCase):
+    """
+    Testes para a distribuição por intervalos de números.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Bloco DNV cujos números (10 dígitos) começam com os mesmos algarismos dos DOs
+        cls.bloco_dnv = Bloco.objects.create(tipo='DNV', numero_inicial='1000000000')
+
+    def test_interpretar_intervalos(self):
+        self.assertEqual(interpretar_intervalos('10-12; 15 ,20 - 21'), [(10, 12), (15, 15), (20, 21)])
+        with self.assertRaises(ValueError):
+            interpretar_intervalos('12-10')
+        with self.assertRaises(ValueError):
+            interpretar_intervalos('abc')
+
+    def test_intervalo_respeita_tipo(self):
+        Ficha.objects.filter(numero='10000003').update(status='Cancelada')
+        resultado = distribuir_intervalos(self.entidade, 'DO', [(10000000, 10000004), (10000028, 10000031)])
+
+        self.assertEqual(len(resultado['distribuidos']), 6)
+        self.assertEqual(resultado['indisponiveis'], ['10000003'])
+        self.assertEqual(resultado['invalidos'], ['10000030', '10000031'])
+        self.assertFalse(Ficha.objects.filter(tipo='DNV').exclude(status='Disponível').exists())
+
+    def test_intervalo_ignora_numeros_com_mais_digitos(self):
+        # Números de 10 dígitos ficam entre '10000000' e '10000001' na ordem de texto
+        bloco_longo = Bloco.objects.create(tipo='DO', numero_inicial='1000000050')
+        resultado = distribuir_intervalos(self.entidade, 'DO', [(10000000, 10000001)])
+
+        self.assertEqual(resultado['distribuidos'], ['10000000', '10000001'])
+        self.assertEqual(Ficha.objects.filter(status='Distribuida').count(), 2)
+        self.assertFalse(bloco_longo.fichas.exclude(status='Disponível').exists())
+
+    def test_view_bloco_inteiro(self):
+        response = self.client.post(
+            reverse('distribuir_fichas_intervalo', args=[self.entidade.id]),
+            {'bloco': self.bloco_dnv.id},
+            follow=True,
+        )
+        mensagens = [str(m) for m in response.context['messages']]
+        self.assertIn('30 fichas distribuídas para Dra. Teste: 1000000000 a 1000000029.', mensagens)
+        self.assertEqual(self.bloco_dnv.fichas.filter(status='Distribuida').count(), 30)
+
+    def test_resumir_numeros(self):
+        self.assertEqual(resumir_numeros(['10000002', '10000000', '10000001', '10000005']), '10000000 a 10000002, 10000005')
+
+
+class BlocoListViewTestCase(UsuarioLogadoTestCase):
+    """
+    Benchmark de queries da listagem de blocos.
+    """
+
+    def criar_blocos(self, quantidade, inicio):
+        for i in range(quantidade):
+            Bloco.objects.create(tipo='DO', numero_inicial=str(inicio + i * 30).zfill(8))
+
+    def queries_da_listagem(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('bloco_list'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_constantes(self):
+        self.criar_blocos(2, 10000000)
+        _, poucos = self.queries_da_listagem()
+
+        self.criar_blocos(20, 20000000)
+        response, muitos = self.queries_da_listagem()
+
+        self.assertEqual(poucos, muitos)
+        self.assertEqual(response.context['total_blocos'], 22)
+        self.assertEqual(response.context['total_fichas'], 22 * 30)
+        self.assertEqual(response.context['blocos'][0].fichas_disponiveis_count, 30)
+
+
+class EntidadeListViewTestCase(UsuarioLogadoTestCase):
+    """
+    Testes para a listagem de entidades com paginação por chave e busca.
+    """
+
+    def criar_entidades(self, quantidade, inicio=0):
+        # Nomes repetidos de 3 em 3 para a paginação precisar desempatar pelo id
+        Entidade.objects.bulk_create([
+            Entidade(tipo='Medico', tipo_documento='CPF', numero_documento=f'{inicio + i:05d}', nome=f'Entidade {(inicio + i) // 3:03d}')
+            for i in range(quantidade)
+        ])
+
+    def listar(self, **parametros):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('entidade_list'), parametros)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_percorre_todas_as_paginas_nos_dois_sentidos(self):
+        self.criar_entidades(2 * ENTIDADES_POR_PAGINA + 5)
+        esperado = list(Entidade.objects.order_by('nome', 'id').values_list('id', flat=True))
+
+        vistas, paginas, parametros = [], [], {}
+        while True:
+            response, _ = self.listar(**parametros)
+            pagina = [entidade.id for entidade in response.context['entidade_list']]
+            vistas += pagina
+            paginas.append(pagina)
+            if not response.context['cursor_proximo']:
+                break
+            parametros = {'depois': response.context['cursor_proximo']}
+        self.assertEqual(vistas, esperado)
+        self.assertEqual([len(pagina) for pagina in paginas], [ENTIDADES_POR_PAGINA, ENTIDADES_POR_PAGINA, 5])
+
+        # Voltando a partir da última página
+        response, _ = self.listar(antes=response.context['cursor_anterior'])
+        self.assertEqual([entidade.id for entidade in response.context['entidade_list']], paginas[1])
+        response, _ = self.listar(antes=response.context['cursor_anterior'])
+        self.assertEqual([entidade.id for entidade in response.context['entidade_list']], paginas[0])
+        self.assertIsNone(response.context['cursor_anterior'])
+
+    def test_busca_por_nome_e_documento(self):
+        self.criar_entidades(10)
+        response, _ = self.listar(q='entidade 001')
+        self.assertEqual([entidade.numero_documento for entidade in response.context['entidade_list']], ['00003', '00004', '00005'])
+        response, _ = self.listar(q='0009')
+        self.assertEqual([entidade.nome for entidade in response.context['entidade_list']], ['Entidade 003'])
+        response, _ = self.listar(q='inexistente', depois='cursor-invalido')
+        self.assertContains(response, 'Nenhuma entidade encontrada para')
+
+    def test_queries_constantes_com_contagens(self):
+        self.criar_entidades(2)
+        _, poucas = self.listar()
+
+        self.criar_entidades(ENTIDADES_POR_PAGINA * 2, inicio=2)
+        Bloco.objects.create(tipo='DO', numero_inicial='10000000')
+        entidade = Entidade.objects.order_by('nome', 'id').first()
+        distribuir_numeros(entidade, ['10000000', '10000001', '10000002'])
+        Ficha.objects.filter(numero='10000002').update(status='Utilizada')
+        ResumoDiarioFicha.objects.reconstruir()
+        response, muitas = self.listar(depois=codificar_cursor(Entidade.objects.order_by('nome', 'id')[5]))
+
+        self.assertEqual(poucas, muitas)
+        response, _ = self.listar()
+        primeira = response.context['entidade_list'][0]
+        self.assertEqual((primeira.fichas_distribuidas_count, primeira.fichas_count), (2, 3))
+
+
+class BuscaEntidadesTestCase(UsuarioLogadoTestCase):
+    """
+    Testes para a busca de entidades do modal de transferência.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hospital = Entidade.objects.create(
+            tipo='Estabelecimento', tipo_documento='CNES', numero_documento='1112223', nome='Hospital Central'
+        )
+        cls.centro = Entidade.objects.create(
+            tipo='Estabelecimento', tipo_documento='CNES', numero_documento='4445556', nome='Centro de Saúde'
+        )
+        cls.medica = Entidade.objects.create(
+            tipo='Medico', tipo_documento='CPF', numero_documento='77788899900', nome='Dra. Centena'
+        )
+
+    def buscar(self, **parametros):
+        response = self.client.get(reverse('busca_entidades'), parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['resultados']
+
+    def test_prefixo_primeiro_e_sem_a_entidade_de_origem(self):
+        resultados = self.buscar(q='  CENT ')
+        self.assertEqual([r['nome'] for r in resultados], ['Centro de Saúde', 'Dra. Centena', 'Hospital Central'])
+        self.assertEqual(resultados[0], {
+            'id': self.centro.id, 'nome': 'Centro de Saúde', 'tipo': 'Estabelecimento de Saúde', 'numero_documento': '4445556',
+        })
+
+        resultados = self.buscar(q='cent', excluir=self.centro.id)
+        self.assertEqual([r['id'] for r in resultados], [self.medica.id, self.hospital.id])
+        self.assertEqual([r['id'] for r in self.buscar(q='2223')], [self.hospital.id])
+        self.assertEqual(self.buscar(q='c'), [])
+
+    def test_limite_de_resultados(self):
+        Entidade.objects.bulk_create([
+            Entidade(tipo='Medico', tipo_documento='CPF', numero_documento=f'9{i:04d}', nome=f'Médico {i:02d}')
+            for i in range(LIMITE_BUSCA_ENTIDADES + 5)
+        ])
+        resultados = self.buscar(q='médico', excluir=Entidade.objects.get(nome='Médico 00').id)
+        self.assertEqual(len(resultados), LIMITE_BUSCA_ENTIDADES)
+        self.assertEqual(resultados[0]['nome'], 'Médico 01')
+
+    def test_pagina_da_entidade_nao_lista_as_outras(self):
+        response = self.client.get(reverse('entidade_detail', args=[self.centro.id]))
+        self.assertNotIn('outras_entidades', response.context)
+        self.assertNotContains(response, 'Hospital Central')
+        self.assertContains(response, f'{reverse("busca_entidades")}?excluir={self.centro.id}')
+
+    def test_check_avisa_indices_ausentes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS entidade_documento_trgm_idx')
+        avisos = verificar_indices_busca(None, databases=['default'])
+        self.assertEqual([aviso.id for aviso in avisos], ['controle_oficio.W001'])
+        self.assertIn('entidade_documento_trgm_idx', avisos[0].msg)
+        self.assertEqual(verificar_indices_busca(None), [])
+
+
+class EstoqueDisponivelTestCase(CenarioTestCase):
+    """
+    Testes para o estoque disponível carregado sob demanda na página da entidade.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Bloco.objects.create(tipo='DNV', numero_inicial='2000000000')
+        distribuir_numeros(cls.entidade, ['10000005', '10000006'])
+
+    def test_pagina_da_entidade_nao_lista_estoque(self):
+        response = self.client.get(reverse('entidade_detail', args=[self.entidade.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '10000007')
+        self.assertContains(response, reverse('estoque_disponivel', args=[self.entidade.id]))
+
+    def test_resumo_por_bloco(self):
+        response = self.client.get(reverse('estoque_disponivel', args=[self.entidade.id]), {'tipo': 'DO'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '28 fichas disponíveis')
+        self.assertContains(response, '10000000 a 10000004, 10000007 a 10000029')
+        self.assertNotContains(response, '2000000000')
+
+    def test_tipo_invalido(self):
+        response = self.client.get(reverse('estoque_disponivel', args=[self.entidade.id]), {'tipo': 'XX'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_fichas_do_bloco(self):
+        response = self.client.get(reverse('fichas_disponiveis_bloco', args=[self.bloco.id]))
+        self.assertContains(response, "toggleFicha('10000007', 'distribuir')")
+        self.assertNotContains(response, '10000005')
+
+
+class EntidadeDetailViewTestCase(CenarioTestCase):
+    """
+    Testes para a montagem da página da entidade.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Bloco.objects.create(tipo='DNV', numero_inicial='2000000000')
+        distribuir_numeros(cls.entidade, ['10000000', '10000001', '10000002', '2000000000', '2000000001'])
+        Ficha.objects.filter(numero__in=['10000000', '2000000000']).dar_desfecho('Utilizada')
+        Ficha.objects.filter(numero='10000001').update(
+            status='Cancelada', data_desfecho=timezone.now() - timedelta(days=40)
+        )
+
+    def test_contexto(self):
+        response = self.client.get(reverse('entidade_detail', args=[self.entidade.id]))
+
+        self.assertEqual(response.context['do_30days_count'], 1)
+        self.assertEqual(response.context['dnv_30days_count'], 1)
+        self.assertEqual([f.numero for f in response.context['fichas_do_distribuidas']], ['10000002'])
+        self.assertEqual(len(response.context['fichas_dnv_distribuidas_ids']), 1)
+
+    def test_queries_constantes(self):
+        with CaptureQueriesContext(connection) as poucas:
+            self.client.get(reverse('entidade_detail', args=[self.entidade.id]))
+        distribuir_numeros(self.entidade, [str(10000003 + i) for i in range(20)])
+        with CaptureQueriesContext(connection) as muitas:
+            self.client.get(reverse('entidade_detail', args=[self.entidade.id]))
+        self.assertEqual(len(poucas), len(muitas))
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class DadosSinteticosTestCase(TestCase):
+    """
+    Testes para a geração de massa sintética e a suíte de benchmark.
+    """
+
+    def gerar(self, blocos=10, entidades=3):
+        call_command('gerar_dados_sinteticos', blocos=blocos, entidades=entidades, anos=2, stdout=StringIO())
+
+    def test_gerar_dados(self):
+        self.gerar()
+        self.gerar()  # Uma segunda execução continua a numeração sem colidir
+
+        self.assertEqual(Bloco.objects.count(), 20)
+        self.assertEqual(Ficha.objects.count(), 20 * 30)
+        self.assertEqual(Entidade.objects.count(), 6)
+        self.assertEqual(estatisticas_resumo(), estatisticas_fichas())
+
+    def test_benchmark_grava_json_e_desfaz_acoes(self):
+        self.gerar()
+        User.objects.create_superuser(username='admin', password='testpass123')
+        distribuidas_antes = Ficha.objects.filter(status='Distribuida').count()
+
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = os.path.join(pasta, 'resultado.json')
+            call_command('benchmark_controle_oficio', repeticoes=1, saida=saida, stdout=StringIO())
+            with open(saida, encoding='utf-8') as arquivo:
+                resultado = json.load(arquivo)
+
+            self.assertIn('dashboard', resultado['cenarios'])
+            self.assertIn('dar_desfecho_em_lote', resultado['cenarios'])
+            for medicao in resultado['cenarios'].values():
+                self.assertIn(medicao['status'], [200, 302])
+                self.assertGreater(medicao['queries'], 0)
+            self.assertEqual(Ficha.objects.filter(status='Distribuida').count(), distribuidas_antes)
+
+            # Uma execução anterior com menos queries aponta regressão
+            resultado['cenarios']['bloco_list']['queries'] = 0
+            with open(saida, 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo)
+            with self.assertRaises(CommandError):
+                call_command('benchmark_controle_oficio', repeticoes=1, comparar=saida, stdout=StringIO())
+
+
+class RecebimentoBlocosTestCase(CenarioTestCase):
+    """
+    Testes para o recebimento de blocos em lote.
+    """
+
+    def test_queries_constantes(self):
+        with CaptureQueriesContext(connection) as poucos:
+            receber_blocos([('DO', 20000000), ('DNV', 3000000000)])
+        with CaptureQueriesContext(connection) as muitos:
+            receber_blocos([('DO', 30000000 + i * 30) for i in range(50)])
+
+        self.assertEqual(len(poucos), len(muitos))
+        self.assertEqual(Bloco.objects.count(), 53)
+        self.assertEqual(Ficha.objects.count(), 53 * 30)
+        self.assertEqual(Ficha.objects.get(numero='3000000029').bloco.numero_inicial, '3000000000')
+        self.assertEqual(estatisticas_resumo(), estatisticas_fichas())
+
+    def test_sobreposicao_recusa_a_remessa_inteira(self):
+        with self.assertRaises(BlocosInvalidos) as contexto:
+            receber_blocos([('DO', 20000000), ('DO', 10000015), ('DO', 20000010)])
+
+        self.assertEqual(len(contexto.exception.erros), 2)
+        self.assertEqual(Bloco.objects.count(), 1)
+        self.assertEqual(Ficha.objects.count(), 30)
+
+    def test_bloco_gravado_durante_o_recebimento(self):
+        # Um recebimento concorrente grava um bloco sobreposto depois da validação
+        validar = recebimento.validar_blocos
+
+        def validar_e_gravar_concorrente(blocos):
+            erros = validar(blocos)
+            if not Bloco.objects.filter(numero_inicial='20000010').exists():
+                Bloco.objects.create(tipo='DO', numero_inicial='20000010')
+            return erros
+
+        with mock.patch('controle_oficio.recebimento.validar_blocos', side_effect=validar_e_gravar_concorrente):
+            with self.assertRaises(BlocosInvalidos) as contexto:
+                receber_blocos([('DO', 20000000), ('DO', 30000000)])
+
+        self.assertEqual(contexto.exception.erros, ['Bloco DO 20000000: sobrepõe o bloco 20000010 já cadastrado.'])
+        self.assertEqual(
+            set(Bloco.objects.values_list('numero_inicial', flat=True)), {'10000000', '20000010'}
+        )
+
+    def test_view_com_csv(self):
+        arquivo = SimpleUploadedFile('remessa.csv', b'tipo;numero_inicial\nDNV;3000000000\n20000000\n')
+        response = self.client.post(reverse('bloco_receber_lote'), {
+            'tipo': 'DO',
+            'numeros_iniciais': '20000030, 20000060',
+            'arquivo': arquivo,
+        })
+
+        self.assertRedirects(response, reverse('bloco_list'))
+        self.assertEqual(
+            set(Bloco.objects.values_list('numero_inicial', flat=True)),
+            {'10000000', '20000000', '20000030', '20000060', '3000000000'},
+        )
+
+    def test_view_mostra_sobreposicao(self):
+        response = self.client.post(reverse('bloco_receber_lote'), {'tipo': 'DO', 'numeros_iniciais': '10000010'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.assertEqual(Bloco.objects.count(), 1)
+
+    def test_comando(self):
+        call_command('receber_blocos', '20000000', '20000030', tipo='DO', data='2025-01-15', stdout=StringIO())
+
+        bloco = Bloco.objects.get(numero_inicial='20000030')
+        self.assertEqual(timezone.localtime(bloco.data_recebimento).date().isoformat(), '2025-01-15')
+        self.assertEqual(bloco.fichas.count(), 30)
+
+
+class FaixaNumerosBlocoTestCase(CenarioTestCase):
+    """
+    Testes para a faixa de números dos blocos e a constraint de sobreposição.
+    """
+
+    def test_colunas_geradas(self):
+        self.assertEqual(self.bloco.numero_inicio, 10000000)
+        self.assertEqual(self.bloco.numero_fim, 10000029)
+
+    def test_constraint_recusa_sobreposicao(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Bloco.objects.create(tipo='DO', numero_inicial='10000029')
+
+        self.assertEqual(Bloco.objects.count(), 1)
+        self.assertEqual(Ficha.objects.count(), 30)
+
+    def test_tipos_diferentes_nao_conflitam(self):
+        Bloco.objects.create(tipo='DNV', numero_inicial='0010000010')
+        Bloco.objects.create(tipo='DO', numero_inicial='10000030')
+
+        self.assertEqual(Bloco.objects.count(), 3)
+
+    def test_formulario_mostra_sobreposicao(self):
+        response = self.client.post(reverse('bloco_create'), {'tipo': 'DO', 'numero_inicial': '09999990'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('numero_inicial', response.context['form'].errors)
+        self.assertEqual(Bloco.objects.count(), 1)
+
+    def test_validacao_em_uma_query(self):
+        candidatos = [('DO', 20000000 + i * 30) for i in range(100)] + [('DO', 10000020)]
+
+        with self.assertNumQueries(1):
+            erros = validar_blocos(candidatos)
+
+        self.assertEqual(erros, ['Bloco DO 10000020: sobrepõe o bloco 10000000 já cadastrado.'])
+
+
+class ExportacaoFichasTestCase(UsuarioLogadoTestCase):
+    """
+    Testes para a exportação do histórico de fichas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ontem = timezone.now() - timedelta(days=1)
+        Bloco.objects.create(tipo='DO', numero_inicial='10000000', data_recebimento=cls.ontem)
+        Bloco.objects.create(tipo='DNV', numero_inicial='2000000000')
+        cls.entidade = Entidade.objects.create(
+            tipo='Medico', tipo_documento='CPF', numero_documento='123', nome='Dra. Teste'
+        )
+        distribuir_numeros(cls.entidade, ['10000000', '2000000000'])
+        Ficha.objects.filter(numero='10000000').update(status='Utilizada', desfecho_por=cls.user)
+
+    def exportar(self, **params):
+        response = self.client.get(reverse('exportar_fichas'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+
+    def test_exporta_com_bloco_entidade_e_desfecho(self):
+        linhas = self.exportar(entidade=self.entidade.pk)
+
+        self.assertEqual(linhas[0].split(';')[0], 'Número')
+        self.assertEqual(len(linhas), 3)
+        colunas = linhas[1].split(';')
+        self.assertEqual(colunas[:4], ['10000000', 'DO', 'Utilizada', '10000000'])
+        self.assertEqual(colunas[5:8], ['Dra. Teste', 'CPF', '123'])
+        self.assertEqual(colunas[-1], 'testuser')
+        self.assertEqual(colunas[4], timezone.localtime(self.ontem).strftime('%d/%m/%Y %H:%M'))
+
+    def test_filtra_pelas_datas_do_dashboard(self):
+        linhas = self.exportar(datas=[timezone.localdate(self.ontem).isoformat()])
+
+        self.assertEqual(len(linhas), 31)
+        self.assertTrue(all(linha.split(';')[1] == 'DO' for linha in linhas[1:]))
+
+    def test_comando_gera_o_mesmo_arquivo(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = os.path.join(pasta, 'fichas.csv')
+            call_command('exportar_fichas', saida, entidade=self.entidade.pk, stdout=StringIO())
+            with open(saida, encoding='utf-8-sig') as arquivo:
+                self.assertEqual(arquivo.read().splitlines(), self.exportar(entidade=self.entidade.pk))
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class ImportacaoEntidadesTestCase(TestCase):
+    """
+    Testes para a importação de entidades em lote (upsert pelo numero_documento).
+    """
+
+    def setUp(self):
+        Entidade.objects.create(tipo='Medico', tipo_documento='CPF', numero_documento='111', nome='Nome Antigo')
+
+    def importar(self, conteudo, **kwargs):
+        return importar_entidades(ler_csv_entidades(StringIO(conteudo)), **kwargs)
+
+    def test_insere_atualiza_e_rejeita(self):
+        resultado = self.importar(
+            'tipo;tipo_documento;numero_documento;nome\n'
+            'Médico;CPF;111;Nome Novo\n'
+            'Estabelecimento;CNES;2222222;UBS Centro\n'
+            'Foguete;CNES;3333333;Inválida\n'
+            'Estabelecimento;CNES;;Sem documento\n'
+        )
+
+        self.assertEqual(resultado['inseridas'], 1)
+        self.assertEqual(resultado['atualizadas'], 1)
+        self.assertEqual([linha for linha, _ in resultado['rejeitadas']], [4, 5])
+        self.assertEqual(Entidade.objects.get(numero_documento='111').nome, 'Nome Novo')
+        self.assertEqual(Entidade.objects.get(numero_documento='2222222').tipo, 'Estabelecimento')
+
+    def test_cnes_com_valores_padrao_e_repetidos(self):
+        resultado = self.importar(
+            'CNES,NOME_FANTASIA\n2222222,UBS Norte\n3333333,UBS Sul\n2222222,UBS Norte II\n',
+            tipo_padrao='Estabelecimento', tipo_documento_padrao='CNES',
+        )
+
+        self.assertEqual(resultado['inseridas'], 2)
+        self.assertEqual(resultado['rejeitadas'][0][0], 2)
+        self.assertEqual(Entidade.objects.get(numero_documento='2222222').nome, 'UBS Norte II')
+
+    def test_queries_constantes(self):
+        def linhas(inicio, quantidade):
+            return ((i, {'numero_documento': f'D{i}', 'nome': f'Entidade {i}'}) for i in range(inicio, inicio + quantidade))
+
+        with CaptureQueriesContext(connection) as poucas:
+            importar_entidades(linhas(0, 10), tipo_padrao='Medico', tipo_documento_padrao='CPF')
+        with CaptureQueriesContext(connection) as muitas:
+            resultado = importar_entidades(linhas(5, 1000), tipo_padrao='Medico', tipo_documento_padrao='CPF')
+
+        self.assertEqual(len(poucas), len(muitas))
+        self.assertEqual(resultado['inseridas'], 995)
+        self.assertEqual(resultado['inalteradas'], 5)
+
+    def test_admin(self):
+        User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.login(username='admin', password='testpass123')
+        arquivo = SimpleUploadedFile('cnes.csv', 'cnes;nome\n4444444;Hospital São José\n'.encode('latin-1'))
+
+        response = self.client.post(
+            reverse('admin:controle_oficio_entidade_importar_csv'),
+            {'arquivo': arquivo, 'tipo': 'Estabelecimento', 'tipo_documento': 'CNES'},
+        )
+
+        self.assertRedirects(response, reverse('admin:controle_oficio_entidade_changelist'))
+        self.assertEqual(Entidade.objects.get(numero_documento='4444444').nome, 'Hospital São José')
+
+    def test_comando(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'entidades.csv')
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                arquivo.write('numero_documento;nome;tipo;tipo_documento\n555;Enf. Ana;Enfermeiro;COREN\n')
+            saida = StringIO()
+            call_command('importar_entidades', caminho, stdout=saida)
+
+        self.assertIn('1 entidade(s) inserida(s)', saida.getvalue())
+        self.assertTrue(Entidade.objects.filter(numero_documento='555', tipo='Enfermeiro').exists())
+
+
+class FichaEventoTestCase(CenarioTestCase):
+    """
+    Testes para o histórico (só de inclusão) das fichas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outra_entidade = criar_outra_entidade()
+
+    def _transferir(self, fichas):
+        return self.client.post(reverse('transferir_fichas_em_lote'), {
+            'ficha_ids': [ficha.id for ficha in fichas],
+            'nova_entidade_id': self.outra_entidade.id,
+            'entidade_origem_id': self.entidade.id,
+        })
+
+    def test_linha_do_tempo_guarda_a_transferencia(self):
+        self.client.post(reverse('distribuir_fichas', args=[self.entidade.id]), {'fichas': ['10000000', '10000001']})
+        ficha = Ficha.objects.get(numero='10000000')
+        self._transferir([ficha])
+        self.client.post(reverse('dar_desfecho_ficha', args=[ficha.id]), {'status': 'Utilizada'})
+
+        eventos = list(FichaEvento.objects.linha_do_tempo(ficha).values_list(
+            'acao', 'status_anterior', 'status_novo', 'entidade_anterior_id', 'entidade_id', 'usuario_id'
+        ))
+        self.assertEqual(eventos, [
+            ('Distribuicao', 'Disponível', 'Distribuida', None, self.entidade.id, self.user.id),
+            ('Transferencia', 'Distribuida', 'Distribuida', self.entidade.id, self.outra_entidade.id, self.user.id),
+            ('Desfecho', 'Distribuida', 'Utilizada', self.outra_entidade.id, self.outra_entidade.id, self.user.id),
+        ])
+
+        # A entidade de origem continua vendo a ficha que saiu dela
+        self.assertEqual(FichaEvento.objects.da_entidade(self.entidade).count(), 3)
+        self.assertEqual(
+            FichaEvento.objects.da_entidade(self.outra_entidade, inicio=timezone.now() - timedelta(days=1)).count(), 2
+        )
+        self.assertFalse(FichaEvento.objects.da_entidade(self.entidade, fim=timezone.now() - timedelta(days=1)).exists())
+
+    def test_desfecho_em_lote_e_distribuicao_por_intervalo(self):
+        distribuir_intervalos(self.entidade, 'DO', [(10000000, 10000009)], usuario=self.user)
+        self.client.post(reverse('dar_desfecho_em_lote'), {
+            'ficha_ids': list(Ficha.objects.filter(numero__lte='10000004').values_list('id', flat=True)),
+            'status': 'Cancelada',
+            'entidade_id': self.entidade.id,
+        })
+        self.assertEqual(FichaEvento.objects.filter(acao='Distribuicao').count(), 10)
+        self.assertEqual(FichaEvento.objects.filter(acao='Desfecho', status_novo='Cancelada').count(), 5)
+
+    def test_um_insert_por_requisicao(self):
+        distribuir_numeros(self.entidade, [str(10000000 + i) for i in range(20)])
+        fichas = list(Ficha.objects.filter(entidade=self.entidade))
+
+        with CaptureQueriesContext(connection) as poucas:
+            self._transferir(fichas[:2])
+        with CaptureQueriesContext(connection) as muitas:
+            self._transferir(fichas[2:])
+        self.assertEqual(len(poucas), len(muitas))
+        inserts = [q['sql'] for q in muitas.captured_queries if q['sql'].startswith('INSERT INTO "controle_oficio_fichaevento"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(FichaEvento.objects.filter(acao='Transferencia').count(), 20)
+
+    def test_historico_nao_pode_ser_alterado(self):
+        distribuir_numeros(self.entidade, ['10000000'])
+        evento = FichaEvento.objects.get()
+        evento.status_novo = 'Cancelada'
+        with self.assertRaises(TypeError):
+            evento.save()
+        with self.assertRaises(TypeError):
+            FichaEvento.objects.update(status_novo='Cancelada')
+
+
+class AcoesEntidadeHtmxTestCase(CenarioTestCase):
+    """
+    Testes para as respostas parciais (HTMX) das ações sobre as fichas da entidade.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outra_entidade = criar_outra_entidade()
+
+    def test_sem_htmx_continua_redirecionando(self):
+        response = self.client.post(reverse('distribuir_fichas', args=[self.entidade.id]), {'fichas': ['10000000']})
+        self.assertRedirects(response, reverse('entidade_detail', args=[self.entidade.id]))
+
+    def test_distribuicao_devolve_trechos_e_estoque(self):
+        response = self.client.post(
+            reverse('distribuir_fichas', args=[self.entidade.id]),
+            {'fichas': ['10000000', '10000001']},
+            HTTP_HX_REQUEST='true',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateNotUsed(response, 'controle_oficio/entidade_detail.html')
+        for trecho in ('id="mensagens"', 'id="contadores-entidade"', 'id="gestao-fichas-distribuidas"', 'id="distribuicao-acordeon"'):
+            self.assertContains(response, trecho)
+        self.assertContains(response, 'hx-swap-oob="true"', count=4)
+        self.assertContains(response, '2 fichas distribuídas para Dra. Teste: 10000000, 10000001.')
+
+    def test_desfecho_e_transferencia_nao_recarregam_estoque(self):
+        distribuir_numeros(self.entidade, [str(10000000 + i) for i in range(20)])
+        ids = list(Ficha.objects.filter(entidade=self.entidade).values_list('id', flat=True))
+
+        def desfecho(fichas):
+            return self.client.post(reverse('dar_desfecho_em_lote'), {
+                'ficha_ids': fichas, 'status': 'Utilizada', 'entidade_id': self.entidade.id,
+            }, HTTP_HX_REQUEST='true')
+
+        with CaptureQueriesContext(connection) as poucas:
+            desfecho(ids[:2])
+        with CaptureQueriesContext(connection) as muitas:
+            response = desfecho(ids[2:10])
+        self.assertEqual(len(poucas), len(muitas))
+        self.assertNotContains(response, 'id="distribuicao-acordeon"')
+        self.assertEqual(response.context['fichas_do_distribuidas_ids'], ids[10:])
+
+        response = self.client.post(reverse('transferir_fichas_em_lote'), {
+            'ficha_ids': ids[10:],
+            'nova_entidade_id': self.outra_entidade.id,
+            'entidade_origem_id': self.entidade.id,
+        }, HTTP_HX_REQUEST='true')
+        self.assertNotContains(response, 'id="distribuicao-acordeon"')
+        self.assertContains(response, '10 fichas foram transferidas com sucesso para Hospital Teste.')
+        self.assertEqual(response.context['fichas_do_distribuidas'], [])
+
+    def test_distribuir_bloco_via_htmx(self):
+        response = self.client.get(reverse('estoque_disponivel', args=[self.entidade.id]), {'tipo': 'DO'})
+        self.assertContains(response, f'hx-post="{reverse("distribuir_fichas_intervalo", args=[self.entidade.id])}"')
+
+        response = self.client.post(
+            reverse('distribuir_fichas_intervalo', args=[self.entidade.id]),
+            {'bloco': self.bloco.id},
+            HTTP_HX_REQUEST='true',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="distribuicao-acordeon"')
+        self.assertContains(response, '30 fichas distribuídas para Dra. Teste: 10000000 a 10000029.')
+
+    def test_desfecho_de_uma_ficha_via_htmx(self):
+        distribuir_numeros(self.entidade, ['10000000'])
+        ficha = Ficha.objects.get(numero='10000000')
+        url = reverse('dar_desfecho_ficha', args=[ficha.id])
+
+        response = self.client.get(reverse('entidade_detail', args=[self.entidade.id]))
+        self.assertContains(response, f'hx-post="{url}"', count=2)
+
+        response = self.client.post(url, {'status': 'Cancelada'}, HTTP_HX_REQUEST='true')
+        self.assertContains(response, 'A ficha 10000000 foi marcada como &#x27;Cancelada&#x27;.')
+        self.assertNotContains(response, 'id="distribuicao-acordeon"')
+        self.assertEqual(response.context['fichas_do_distribuidas'], [])
+        ficha.refresh_from_db()
+        self.assertEqual(ficha.status, 'Cancelada')
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class CacheContextosTestCase(TransactionTestCase):
+    """
+    Testes para o cache versionado dos contextos do dashboard, da lista de blocos e da entidade.
+    TransactionTestCase porque os valores só são guardados fora de transação.
+    """
+
+    def setUp(self):
+        # TransactionTestCase não tem setUpTestData: o cenário é criado a cada teste
+        cache.clear()
+        criar_cenario(self)
+        self.outra_entidade = criar_outra_entidade()
+        self.client.login(username='testuser', password='testpass123')
+
+    def consultar(self, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_dashboard(self):
+        url = reverse('controle_oficio_dashboard')
+        _, primeira = self.consultar(url)
+        response, segunda = self.consultar(url)
+        self.assertLess(segunda, primeira)
+        self.assertEqual(response.context['distribuidas_count'], 0)
+
+        distribuir_numeros(self.entidade, ['10000000', '10000001'])
+        response, _ = self.consultar(url)
+        self.assertEqual(response.context['distribuidas_count'], 2)
+        self.assertEqual(response.context['disponiveis_count'], 28)
+
+    def test_lista_de_blocos(self):
+        url = reverse('bloco_list')
+        _, primeira = self.consultar(url)
+        response, segunda = self.consultar(url)
+        self.assertLess(segunda, primeira)
+        self.assertEqual(response.context['blocos'][0].fichas_disponiveis_count, 30)
+
+        distribuir_numeros(self.entidade, ['10000000', '10000001', '10000002'])
+        self.client.post(reverse('dar_desfecho_em_lote'), {
+            'ficha_ids': [Ficha.objects.get(numero='10000000').id],
+            'status': 'Utilizada',
+            'entidade_id': self.entidade.id,
+        })
+        Bloco.objects.create(tipo='DNV', numero_inicial='2000000000')
+        response, _ = self.consultar(url)
+        contagens = {
+            bloco.numero_inicial: (bloco.fichas_count, bloco.fichas_disponiveis_count, bloco.fichas_distribuidas_count)
+            for bloco in response.context['blocos']
+        }
+        self.assertEqual(contagens, {'10000000': (30, 27, 2), '2000000000': (30, 30, 0)})
+        self.assertEqual(response.context['total_blocos'], 2)
+
+    def test_pagina_da_entidade(self):
+        distribuir_numeros(self.entidade, ['10000000', '10000001'])
+        url = reverse('entidade_detail', args=[self.entidade.id])
+        _, primeira = self.consultar(url)
+        _, segunda = self.consultar(url)
+        self.assertLess(segunda, primeira)
+
+        # Transferência e desfecho pelo save() trocam a versão das entidades envolvidas
+        self.client.post(reverse('transferir_fichas_em_lote'), {
+            'ficha_ids': [Ficha.objects.get(numero='10000000').id],
+            'nova_entidade_id': self.outra_entidade.id,
+            'entidade_origem_id': self.entidade.id,
+        })
+        response, _ = self.consultar(url)
+        self.assertEqual([f.numero for f in response.context['fichas_do_distribuidas']], ['10000001'])
+
+        ficha = Ficha.objects.get(numero='10000001')
+        ficha.status = 'Utilizada'
+        ficha.save()
+        response, _ = self.consultar(url)
+        self.assertEqual(response.context['fichas_do_distribuidas'], [])
+        self.assertEqual(response.context['do_30days_count'], 1)
+
+        response, _ = self.consultar(reverse('entidade_detail', args=[self.outra_entidade.id]))
+        self.assertEqual([f.numero for f in response.context['fichas_do_distribuidas']], ['10000000'])
+
+    def test_busca_de_entidades(self):
+        url = reverse('busca_entidades')
+        _, primeira = self.consultar(url, data={'q': 'hosp'})
+        response, segunda = self.consultar(url, data={'q': 'hosp'})
+        self.assertLess(segunda, primeira)
+        self.assertEqual([r['nome'] for r in response.json()['resultados']], ['Hospital Teste'])
+
+        # Cadastro pelo save() e importação em lote trocam a versão da busca
+        Entidade.objects.create(tipo='Estabelecimento', tipo_documento='CNES', numero_documento='789', nome='Hospital Novo')
+        importar_entidades([(2, {'numero_documento': '999', 'nome': 'Hospital Importado', 'tipo': 'Estabelecimento', 'tipo_documento': 'CNES'})])
+        response, _ = self.consultar(url, data={'q': 'hosp'})
+        self.assertEqual(
+            [r['nome'] for r in response.json()['resultados']],
+            ['Hospital Importado', 'Hospital Novo', 'Hospital Teste'],
+        )
+
+    def test_versao_trocada_de_novo_apos_o_commit(self):
+        inicial = versao(BLOCO, self.bloco.pk)
+        with transaction.atomic():
+            invalidar(BLOCO, [self.bloco.pk])
+            durante = versao(BLOCO, self.bloco.pk)
+            self.assertNotEqual(durante, inicial)
+        self.assertNotEqual(versao(BLOCO, self.bloco.pk), durante)
+
+    def test_transacao_desfeita_nao_deixa_valor_no_cache(self):
+        url = reverse('entidade_detail', args=[self.entidade.id])
+        with transaction.atomic():
+            distribuir_numeros(self.entidade, ['10000000'])
+            response, _ = self.consultar(url)
+            self.assertEqual(len(response.context['fichas_do_distribuidas']), 1)
+            transaction.set_rollback(True)
+
+        response, _ = self.consultar(url)
+        self.assertEqual(response.context['fichas_do_distribuidas'], [])
+
+
+class PrevisaoReposicaoTestCase(CenarioTestCase):
+    """
+    Testes para a previsão de fim do estoque em mãos das entidades.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.com_consumo = cls.entidade
+        cls.sem_consumo = criar_outra_entidade()
+        cls.sem_estoque = Entidade.objects.create(
+            tipo='Estabelecimento', tipo_documento='CNES', numero_documento='789', nome='Clínica Teste'
+        )
+        distribuir_intervalos(cls.com_consumo, 'DO', [(10000000, 10000019)])
+        distribuir_intervalos(cls.sem_consumo, 'DO', [(10000020, 10000025)])
+        distribuir_intervalos(cls.sem_estoque, 'DO', [(10000026, 10000028)])
+
+        # 15 fichas usadas nos últimos 30 dias (0,5 por dia) e uma fora da janela de 90 dias
+        agora = timezone.now()
+        for i in range(15):
+            Ficha.objects.filter(numero=str(10000000 + i)).update(
+                status='Utilizada', data_desfecho=agora - timedelta(days=i * 2)
+            )
+        Ficha.objects.filter(numero='10000025').update(status='Utilizada', data_desfecho=agora - timedelta(days=120))
+        Ficha.objects.filter(numero__in=['10000026', '10000027', '10000028']).update(
+            status='Cancelada', data_desfecho=agora - timedelta(days=60)
+        )
+        ResumoDiarioFicha.objects.reconstruir()
+
+    def test_taxas_e_dias_restantes(self):
+        hoje = timezone.localdate()
+        previsao = {linha['entidade_id']: linha for linha in calcular_previsao(hoje)}
+        self.assertEqual(set(previsao), {self.com_consumo.id, self.sem_consumo.id, self.sem_estoque.id})
+
+        linha = previsao[self.com_consumo.id]
+        self.assertEqual((linha['estoque'], linha['consumo_30_dias'], linha['taxa_diaria']), (5, 15, 0.5))
+        self.assertEqual((linha['dias_restantes'], linha['data_prevista']), (10, hoje + timedelta(days=10)))
+        self.assertEqual(linha['situacao'], 'Crítico')
+
+        linha = previsao[self.sem_consumo.id]
+        self.assertEqual((linha['estoque'], linha['taxa_diaria'], linha['dias_restantes']), (5, 0.0, None))
+        self.assertEqual(linha['situacao'], 'Sem consumo')
+
+        # Sem uso nos últimos 30 dias, vale a taxa de 90 dias (3 fichas / 90 dias)
+        linha = previsao[self.sem_estoque.id]
+        self.assertEqual((linha['estoque'], linha['consumo_30_dias'], linha['taxa_diaria']), (0, 0, 0.03))
+        self.assertEqual((linha['dias_restantes'], linha['situacao']), (0, 'Sem estoque'))
+
+        # Da mais urgente para a menos urgente
+        self.assertEqual(
+            [linha['situacao'] for linha in calcular_previsao(hoje)],
+            ['Sem estoque', 'Crítico', 'Sem consumo'],
+        )
+
+    def test_previsao_em_poucas_queries(self):
+        with CaptureQueriesContext(connection) as poucas:
+            calcular_previsao()
+        distribuir_intervalos(self.com_consumo, 'DO', [(10000029, 10000029)])
+        Bloco.objects.create(tipo='DO', numero_inicial='10000030')
+        for i in range(20):
+            entidade = Entidade.objects.create(
+                tipo='Medico', tipo_documento='CPF', numero_documento=f'9{i}', nome=f'Entidade {i}'
+            )
+            distribuir_numeros(entidade, [str(10000030 + i)])
+        with CaptureQueriesContext(connection) as muitas:
+            previsao = calcular_previsao()
+        self.assertEqual(len(poucas), len(muitas))
+        self.assertEqual(len(previsao), 23)
+
+    def test_tela_filtra_por_situacao_e_tipo(self):
+        response = self.client.get(reverse('reposicao'), {'situacao': 'Crítico'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Dra. Teste')
+        self.assertNotContains(response, 'Hospital Teste')
+        self.assertIn(('Sem consumo', 1), response.context['situacoes'])
+
+        response = self.client.get(reverse('reposicao'), {'tipo': 'DNV'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertContains(response, 'Nenhuma entidade com fichas em mãos ou consumo recente.')
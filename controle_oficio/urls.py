@@ -8,18 +8,25 @@ urlpatterns = [
     path("", views.dashboard_view, name="controle_oficio_dashboard"),
     path("entidades/", views.EntidadeListView.as_view(), name="entidade_list"),
     path("entidades/nova/", views.EntidadeCreateView.as_view(), name="entidade_create"),
+    path("entidades/busca/", views.busca_entidades, name="busca_entidades"),
     path("entidades/<int:pk>/editar/", views.EntidadeUpdateView.as_view(), name="entidade_update"),
     path("entidades/<int:pk>/", views.EntidadeDetailView.as_view(), name="entidade_detail"),
     # DISTRIBUIÇÃO DE FICHAS
     path("entidades/<int:entidade_id>/distribuir/", views.distribuir_fichas, name="distribuir_fichas"),
+    path("entidades/<int:entidade_id>/distribuir-intervalo/", views.distribuir_fichas_intervalo, name="distribuir_fichas_intervalo"),
+    path("entidades/<int:entidade_id>/estoque-disponivel/", views.estoque_disponivel, name="estoque_disponivel"),
 
     # FICHAS
     path("fichas/<int:ficha_id>/desfecho/", views.dar_desfecho_ficha, name="dar_desfecho_ficha"),
     path("fichas/desfecho-em-lote/", views.dar_desfecho_em_lote, name="dar_desfecho_em_lote"),
     path("fichas/transferir-em-lote/", views.transferir_fichas_em_lote, name="transferir_fichas_em_lote"),
+    path("fichas/exportar/", views.exportar_fichas, name="exportar_fichas"),
+    path("reposicao/", views.reposicao_view, name="reposicao"),
 
     # BLOCOS
     path("blocos/", views.BlocoListView.as_view(), name="bloco_list"),
     path("blocos/novo/", views.BlocoCreateView.as_view(), name="bloco_create"),
+    path("blocos/receber-em-lote/", views.receber_blocos_em_lote, name="bloco_receber_lote"),
     path("blocos/<int:pk>/", views.BlocoDetailView.as_view(), name="bloco_detail"),
+    path("blocos/<int:pk>/fichas-disponiveis/", views.fichas_disponiveis_bloco, name="fichas_disponiveis_bloco"),
 ]
@@ -1,15 +1,28 @@
+import json
 import locale
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.urls import reverse_lazy
 from django.shortcuts import get_object_or_404, redirect, render
-from collections import defaultdict
+from collections import Counter, defaultdict
 from django.contrib import messages
 from django.utils import timezone
 from datetime import timedelta
 from django.db import transaction
+from django.db.models import Case, Count, Exists, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.paginator import Paginator
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.views.decorators.http import require_POST
 
-from .forms import EntidadeForm
+from .cache import BLOCO, CADASTRO_ENTIDADES, ENTIDADE, FICHAS, chave, em_cache, invalidar, varios_em_cache, versao, versoes
+from .forms import DistribuicaoIntervaloForm, EntidadeForm, RecebimentoBlocosForm
+from .distribuicao import distribuir_intervalos, distribuir_numeros, resumir_numeros
+from .estatisticas import datas_de_recebimento, dias_selecionados, estatisticas_resumo
+from .exportacao import consulta_exportacao, linhas_csv
+from .previsao import LIMITE_ATENCAO_DIAS, LIMITE_CRITICO_DIAS, SITUACOES, previsao_reposicao
+from .recebimento import BlocosInvalidos, receber_blocos
 
 # Isso garante que a formatação de datas, como nomes de meses, use o idioma correto.
 try:
@@ -21,7 +34,7 @@ except locale.Error:
         print("Atenção: Locale 'pt_BR.UTF-8' e 'portuguese' não encontrados. A formatação de datas pode ficar em inglês.")
         pass
 
-from .models import Bloco, Entidade, Ficha
+from .models import Bloco, Entidade, Ficha, FichaEvento, ResumoDiarioFicha
 
 
 # =========================
@@ -39,12 +52,170 @@ class BlocoCreateView(CreateView):
         return response
 
 
+def receber_blocos_em_lote(request):
+    """
+    Recebe uma remessa inteira de blocos: valida as sobreposições de uma vez e
+    cadastra todos os blocos e fichas na mesma transação.
+    """
+    form = RecebimentoBlocosForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        try:
+            criados = receber_blocos(form.cleaned_data['blocos'])
+        except BlocosInvalidos as e:
+            for erro in e.erros:
+                form.add_error(None, erro)
+        else:
+            messages.success(
+                request,
+                f"{len(criados)} bloco(s) recebido(s), com {len(criados) * Bloco.FICHAS_POR_BLOCO} fichas geradas."
+            )
+            return redirect('bloco_list')
+
+    return render(request, 'controle_oficio/bloco_recebimento_lote.html', {'form': form})
+
+
 # =========================
 # ENTIDADE
 # =========================
+# Entidades por página da listagem
+ENTIDADES_POR_PAGINA = 30
+
+
+def codificar_cursor(entidade):
+    """
+    Cursor da paginação por chave: o (nome, id) da entidade, em base64 para ir na URL.
+    """
+    return urlsafe_base64_encode(json.dumps([entidade.nome, entidade.pk]).encode())
+
+
+def ler_cursor(valor):
+    """
+    (nome, id) de um cursor de codificar_cursor(), ou None se ausente ou inválido.
+    """
+    if not valor:
+        return None
+    try:
+        nome, pk = json.loads(urlsafe_base64_decode(valor))
+        return str(nome), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def contagem_fichas_da_entidade(**filtros):
+    """
+    Subquery com a quantidade de fichas da entidade externa (OuterRef), somada
+    do resumo diário, com filtros opcionais.
+    """
+    resumos = (
+        ResumoDiarioFicha.objects
+        .filter(entidade=OuterRef('pk'), **filtros)
+        .order_by()
+        .values('entidade')
+        .annotate(quantidade=Sum('quantidade'))
+        .values('quantidade')
+    )
+    return Coalesce(Subquery(resumos), 0)
+
+
 class EntidadeListView(ListView):
     model = Entidade
     template_name = 'controle_oficio/entidade_list.html'
+    context_object_name = 'entidade_list'
+
+    def get_queryset(self):
+        """
+        Uma página de entidades em ordem de (nome, id), buscada a partir do
+        cursor ('depois' ou 'antes') em vez de OFFSET: o índice (nome, id) leva
+        direto ao ponto da página, por mais longe que ela esteja. As contagens
+        de fichas são subqueries, calculadas só para as entidades da página.
+        """
+        self.busca = self.request.GET.get('q', '').strip()
+        self.depois = ler_cursor(self.request.GET.get('depois'))
+        self.antes = None if self.depois else ler_cursor(self.request.GET.get('antes'))
+
+        entidades = Entidade.objects.all()
+        if self.busca:
+            # icontains vira UPPER(...) LIKE; com o pg_trgm instalado, usa os índices de trigramas
+            entidades = entidades.filter(Q(nome__icontains=self.busca) | Q(numero_documento__icontains=self.busca))
+
+        # nome >= x limita a faixa do índice; o OR só desempata pelo id
+        if self.depois:
+            nome, pk = self.depois
+            entidades = entidades.filter(Q(nome__gt=nome) | Q(nome=nome, pk__gt=pk), nome__gte=nome).order_by('nome', 'id')
+        elif self.antes:
+            nome, pk = self.antes
+            entidades = entidades.filter(Q(nome__lt=nome) | Q(nome=nome, pk__lt=pk), nome__lte=nome).order_by('-nome', '-id')
+        else:
+            entidades = entidades.order_by('nome', 'id')
+
+        pagina = list(
+            entidades.annotate(
+                fichas_distribuidas_count=contagem_fichas_da_entidade(status='Distribuida'),
+                fichas_count=contagem_fichas_da_entidade(),
+            )[:ENTIDADES_POR_PAGINA + 1]
+        )
+        # Uma entidade a mais diz se existe página seguinte (ou anterior, indo para trás)
+        self.tem_mais = len(pagina) > ENTIDADES_POR_PAGINA
+        pagina = pagina[:ENTIDADES_POR_PAGINA]
+        if self.antes:
+            pagina.reverse()
+        return pagina
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        pagina = context['entidade_list']
+        tem_proxima = bool(self.antes) or self.tem_mais
+        tem_anterior = bool(self.depois) or (bool(self.antes) and self.tem_mais)
+        context.update({
+            'busca': self.busca,
+            'cursor_proximo': codificar_cursor(pagina[-1]) if pagina and tem_proxima else None,
+            'cursor_anterior': codificar_cursor(pagina[0]) if pagina and tem_anterior else None,
+        })
+        return context
+
+
+# Busca de entidades do modal de transferência (typeahead)
+MINIMO_CARACTERES_BUSCA = 2
+LIMITE_BUSCA_ENTIDADES = 20
+
+
+def buscar_entidades(termo):
+    """
+    Entidades cujo nome ou documento contém `termo`, primeiro as que começam
+    por ele. Devolve uma a mais que LIMITE_BUSCA_ENTIDADES, para sobrar o
+    limite depois de tirar a entidade da página. Fica em cache por termo até
+    a próxima mudança no cadastro de entidades.
+    """
+    def calcular():
+        comeca_com = Q(nome__istartswith=termo) | Q(numero_documento__istartswith=termo)
+        return list(
+            Entidade.objects
+            .filter(Q(nome__icontains=termo) | Q(numero_documento__icontains=termo))
+            .annotate(ordem=Case(When(comeca_com, then=0), default=1))
+            .order_by('ordem', 'nome', 'id')
+            .values('id', 'nome', 'tipo', 'numero_documento')[:LIMITE_BUSCA_ENTIDADES + 1]
+        )
+
+    return em_cache(chave('busca_entidades', versao(CADASTRO_ENTIDADES), termo), calcular)
+
+
+def busca_entidades(request):
+    """
+    Entidades para o campo de destino do modal de transferência, em JSON.
+    `excluir` tira do resultado a entidade de origem.
+    """
+    termo = ' '.join(request.GET.get('q', '').split()).lower()[:100]
+    if len(termo) < MINIMO_CARACTERES_BUSCA:
+        return JsonResponse({'resultados': []})
+
+    excluir = request.GET.get('excluir', '')
+    tipos = dict(Entidade.TIPO_CHOICES)
+    resultados = [
+        {**entidade, 'tipo': tipos.get(entidade['tipo'], entidade['tipo'])}
+        for entidade in buscar_entidades(termo)
+        if str(entidade['id']) != excluir
+    ]
+    return JsonResponse({'resultados': resultados[:LIMITE_BUSCA_ENTIDADES]})
 
 
 class EntidadeCreateView(CreateView):
@@ -61,6 +232,50 @@ class EntidadeUpdateView(UpdateView):
     success_url = reverse_lazy('entidade_list')
 
 
+def consulta_fichas_entidade(entidade, data_limite):
+    return (
+        entidade.fichas
+        .filter(Q(status='Distribuida') | Q(data_desfecho__gte=data_limite))
+        .only('id', 'numero', 'tipo', 'status', 'entidade', 'data_entrega', 'data_desfecho')
+        .order_by('numero')
+    )
+
+
+def contexto_fichas_entidade(entidade):
+    """
+    Busca de uma vez as fichas da entidade que a página usa (distribuídas e
+    finalizadas nos últimos 30 dias), só com as colunas necessárias, e separa
+    em memória por tipo e status. Fica em cache até a próxima mudança nas
+    fichas da entidade.
+    """
+    return em_cache(
+        chave('contexto_fichas_entidade', entidade.pk, versao(ENTIDADE, entidade.pk)),
+        lambda: _calcular_contexto_fichas_entidade(entidade),
+    )
+
+
+def _calcular_contexto_fichas_entidade(entidade):
+    data_limite = timezone.now() - timedelta(days=30)
+    fichas = consulta_fichas_entidade(entidade, data_limite)
+
+    distribuidas = {'DO': [], 'DNV': []}
+    uso_30_dias = {'DO': 0, 'DNV': 0}
+    for ficha in fichas:
+        if ficha.status == 'Distribuida':
+            distribuidas[ficha.tipo].append(ficha)
+        if ficha.data_desfecho and ficha.data_desfecho >= data_limite:
+            uso_30_dias[ficha.tipo] += 1
+
+    return {
+        'do_30days_count': uso_30_dias['DO'],
+        'dnv_30days_count': uso_30_dias['DNV'],
+        'fichas_do_distribuidas': distribuidas['DO'],
+        'fichas_dnv_distribuidas': distribuidas['DNV'],
+        'fichas_do_distribuidas_ids': [ficha.id for ficha in distribuidas['DO']],
+        'fichas_dnv_distribuidas_ids': [ficha.id for ficha in distribuidas['DNV']],
+    }
+
+
 class EntidadeDetailView(DetailView):
     model = Entidade
     template_name = 'controle_oficio/entidade_detail.html'
@@ -69,74 +284,116 @@ class EntidadeDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # --- 1. DADOS BASE ---
-        fichas_entidade = self.object.fichas.all().order_by('numero')
-        
-        # --- 2. LÓGICA PARA ESTATÍSTICAS DE 30 DIAS ---
-        data_limite = timezone.now() - timedelta(days=30)
-        
-        dnv_recent_use = fichas_entidade.filter(tipo='DNV', data_desfecho__gte=data_limite)
-        context['dnv_30days_count'] = dnv_recent_use.count()
-
-        do_recent_use = fichas_entidade.filter(tipo='DO', data_desfecho__gte=data_limite)
-        context['do_30days_count'] = do_recent_use.count()
-
-        # --- 3. LÓGICA DE AGRUPAMENTO OTIMIZADA (CORRIGIDA) ---
-        # Busca todas as fichas disponíveis já com os dados do bloco (select_related).
-        fichas_disponiveis = Ficha.objects.filter(status='Disponível').select_related('bloco').order_by('bloco__numero_inicial', 'numero')
-
-        # Cria dicionários para agrupar as fichas por objeto de bloco.
-        blocos_do_agrupados = {}
-        blocos_dnv_agrupados = {}
-
-        for ficha in fichas_disponiveis:
-            if ficha.tipo == 'DO':
-                if ficha.bloco not in blocos_do_agrupados:
-                    blocos_do_agrupados[ficha.bloco] = []
-                blocos_do_agrupados[ficha.bloco].append(ficha)
-            elif ficha.tipo == 'DNV':
-                if ficha.bloco not in blocos_dnv_agrupados:
-                    blocos_dnv_agrupados[ficha.bloco] = []
-                blocos_dnv_agrupados[ficha.bloco].append(ficha)
-
-        # Transforma os dicionários na estrutura de lista que o template espera.
-        grupos_do = []
-        for bloco, fichas_do_bloco in blocos_do_agrupados.items():
-            grupos_do.append({
-                'bloco': bloco,
-                'fichas_disponiveis': fichas_do_bloco,
-                'ficha_ids': [f.id for f in fichas_do_bloco]
-            })
-
-        grupos_dnv = []
-        for bloco, fichas_dnv_bloco in blocos_dnv_agrupados.items():
-            grupos_dnv.append({
-                'bloco': bloco,
-                'fichas_disponiveis': fichas_dnv_bloco,
-                'ficha_ids': [f.id for f in fichas_dnv_bloco]
-            })
-        
-        context['grupos_do'] = grupos_do
-        context['grupos_dnv'] = grupos_dnv
-
-        # --- 4. DADOS PARA A LISTAGEM DE FICHAS DA ENTIDADE ---
-        context['fichas_do_distribuidas'] = fichas_entidade.filter(tipo='DO', status='Distribuida')
-        context['fichas_dnv_distribuidas'] = fichas_entidade.filter(tipo='DNV', status='Distribuida')
-        context['fichas_do_distribuidas_ids'] = list(context['fichas_do_distribuidas'].values_list('id', flat=True))
-        context['fichas_dnv_distribuidas_ids'] = list(context['fichas_dnv_distribuidas'].values_list('id', flat=True))
-        
-        context['fichas_do_finalizadas'] = fichas_entidade.filter(tipo='DO').exclude(status__in=['Distribuida', 'Disponível'])
-        context['fichas_dnv_finalizadas'] = fichas_entidade.filter(tipo='DNV').exclude(status__in=['Distribuida', 'Disponível'])
-
-        # --- 5. DADOS PARA O MODAL DE TRANSFERÊNCIA ---
-        context['outras_entidades'] = Entidade.objects.exclude(pk=self.object.pk).order_by('nome')
+        # --- 1 a 4. FICHAS DA ENTIDADE E ESTATÍSTICAS DE 30 DIAS (uma única query) ---
+        # O estoque disponível é carregado sob demanda via HTMX (estoque_disponivel /
+        # fichas_disponiveis_bloco), para a página não percorrer todas as fichas do sistema.
+        context.update(contexto_fichas_entidade(self.object))
 
-        context['id_numero_map'] = {
-            str(f.id): f.numero for f in fichas_disponiveis
-        }
-        
+        # --- 5. O destino do modal de transferência é buscado sob demanda (busca_entidades) ---
         return context
 
+
+def resposta_acao_entidade(request, entidade, estoque_alterado=False):
+    """
+    Resposta das ações sobre as fichas da entidade. Sem HTMX, volta para a
+    página da entidade; com HTMX, devolve só os trechos afetados (mensagens,
+    contadores, fichas distribuídas e, se o estoque mudou, a distribuição),
+    sem refazer a página inteira nem o modal de transferência.
+    """
+    if 'HX-Request' not in request.headers:
+        return redirect('entidade_detail', pk=getattr(entidade, 'pk', entidade))
+    if not isinstance(entidade, Entidade):
+        entidade = get_object_or_404(Entidade, pk=entidade)
+
+    context = {
+        'entidade': entidade,
+        'oob': True,
+        'estoque_alterado': estoque_alterado,
+        **contexto_fichas_entidade(entidade),
+    }
+    return render(request, 'controle_oficio/partials/resultado_acao_entidade.html', context)
+
+
+# Quantidade de blocos por página no estoque disponível da entidade
+ESTOQUE_BLOCOS_POR_PAGINA = 20
+
+
+def contagem_fichas_do_bloco(**filtros):
+    """
+    Subquery com a quantidade de fichas do bloco externo (OuterRef), com filtros opcionais.
+    """
+    fichas = (
+        Ficha.objects
+        .filter(bloco=OuterRef('pk'), **filtros)
+        .order_by()
+        .values('bloco')
+        .annotate(quantidade=Count('id'))
+        .values('quantidade')
+    )
+    return Coalesce(Subquery(fichas), 0)
+
+
+def consulta_estoque_disponivel(tipo):
+    # Percorre os blocos na ordem de numero_inicial e só consulta as fichas dos
+    # blocos da página (EXISTS/subqueries), em vez de agrupar todo o estoque.
+    fichas_disponiveis = Ficha.objects.filter(bloco=OuterRef('pk'), status='Disponível')
+    return (
+        Bloco.objects
+        .filter(Exists(fichas_disponiveis), tipo=tipo)
+        .annotate(
+            quantidade_disponivel=contagem_fichas_do_bloco(status='Disponível'),
+            numeros_disponiveis=ArraySubquery(fichas_disponiveis.order_by('numero').values('numero')),
+        )
+        .order_by('numero_inicial')
+    )
+
+
+def estoque_disponivel(request, entidade_id):
+    """
+    Partial HTMX com o resumo do estoque disponível de um tipo: um item por bloco,
+    com a quantidade e as faixas de números disponíveis, paginado.
+    """
+    entidade = get_object_or_404(Entidade, pk=entidade_id)
+    tipo = request.GET.get('tipo')
+    if tipo not in Bloco.TAMANHO_NUMERO_POR_TIPO:
+        return HttpResponseBadRequest("Tipo inválido.")
+
+    try:
+        pagina = max(int(request.GET.get('pagina', 1)), 1)
+    except ValueError:
+        pagina = 1
+
+    blocos = consulta_estoque_disponivel(tipo)
+    inicio = (pagina - 1) * ESTOQUE_BLOCOS_POR_PAGINA
+    # Busca um bloco a mais só para saber se existe próxima página, sem COUNT
+    blocos = list(blocos[inicio:inicio + ESTOQUE_BLOCOS_POR_PAGINA + 1])
+    tem_mais = len(blocos) > ESTOQUE_BLOCOS_POR_PAGINA
+    blocos = blocos[:ESTOQUE_BLOCOS_POR_PAGINA]
+
+    for bloco in blocos:
+        bloco.faixas_disponiveis = resumir_numeros(bloco.numeros_disponiveis)
+
+    context = {
+        'entidade': entidade,
+        'tipo': tipo,
+        'blocos': blocos,
+        'pagina': pagina,
+        'tem_mais': tem_mais,
+    }
+    return render(request, 'controle_oficio/partials/estoque_disponivel.html', context)
+
+
+def fichas_disponiveis_bloco(request, pk):
+    """
+    Partial HTMX com as fichas disponíveis de um único bloco, buscado quando o bloco é aberto.
+    """
+    bloco = get_object_or_404(Bloco, pk=pk)
+    fichas = bloco.fichas.filter(status='Disponível').only('id', 'numero').order_by('numero')
+    return render(request, 'controle_oficio/partials/fichas_disponiveis_bloco.html', {
+        'bloco': bloco,
+        'fichas': fichas,
+    })
+
 # =========================
 # TRANSFERIR FICHAS EM LOTE
 # =========================
@@ -152,7 +409,7 @@ def transferir_fichas_em_lote(request):
 
     if not ficha_ids or not nova_entidade_id:
         messages.warning(request, "Informações insuficientes para realizar a transferência.")
-        return redirect('entidade_detail', pk=entidade_origem_id)
+        return resposta_acao_entidade(request, entidade_origem_id)
 
     try:
         nova_entidade = Entidade.objects.get(pk=nova_entidade_id)
@@ -162,12 +419,31 @@ def transferir_fichas_em_lote(request):
                 id__in=ficha_ids,
                 entidade_id=entidade_origem_id # Garante que só estamos transferindo fichas da entidade correta
             )
-            contagem = fichas_para_transferir.count()
+            # Trava as fichas e guarda o estado atual para o resumo diário e o histórico
+            linhas = list(
+                fichas_para_transferir.select_for_update()
+                .values_list('id', 'data_recebimento', 'tipo', 'status', 'entidade_id')
+            )
+            agora = timezone.now()
 
             # .update() para uma única query no banco, muito mais rápido.
-            fichas_para_transferir.update(
+            contagem = fichas_para_transferir.update(
                 entidade=nova_entidade,
-                data_entrega=timezone.now() # Atualiza a data para a da nova entrega/transferência
+                data_entrega=agora # Atualiza a data para a da nova entrega/transferência
+            )
+            ResumoDiarioFicha.objects.aplicar_deltas(
+                ResumoDiarioFicha.objects.deltas_de_atualizacao(
+                    [linha[1:] for linha in linhas], entidade_id=nova_entidade.id
+                )
+            )
+            # Os blocos não mudam de contagem: só as duas entidades
+            invalidar(ENTIDADE, [nova_entidade.id] + [linha[4] for linha in linhas if linha[4]])
+            FichaEvento.objects.registrar(
+                'Transferencia',
+                [(ficha_id, status, entidade_id) for ficha_id, _, _, status, entidade_id in linhas],
+                usuario=request.user,
+                data_evento=agora,
+                entidade_id=nova_entidade.id,
             )
 
         messages.success(request, f"{contagem} fichas foram transferidas com sucesso para {nova_entidade.nome}.")
@@ -176,7 +452,7 @@ def transferir_fichas_em_lote(request):
     except Exception as e:
         messages.error(request, f"Ocorreu um erro ao processar a transferência: {e}")
 
-    return redirect('entidade_detail', pk=entidade_origem_id)
+    return resposta_acao_entidade(request, entidade_origem_id)
 
 # =========================
 # DISTRIBUIR FICHAS
@@ -189,83 +465,130 @@ def distribuir_fichas(request, entidade_id):
 
         if not numeros_selecionados:
             messages.warning(request, "Nenhuma ficha foi selecionada para distribuição.")
-            return redirect('entidade_detail', pk=entidade.id)
-
-        # Separação de feedback
-        numeros_invalidos = []
-        numeros_indisponiveis = []
-        numeros_distribuidos = []
+            return resposta_acao_entidade(request, entidade)
 
-        with transaction.atomic():
-            # Lock pessimista para evitar corrida
-            fichas_tentadas = (
-                Ficha.objects
-                .select_for_update()
-                .filter(numero__in=numeros_selecionados)
-            )
-
-            # Mapear os números realmente encontrados no banco
-            encontrados = {f.numero: f for f in fichas_tentadas}
-
-            for numero in numeros_selecionados:
-                ficha = encontrados.get(numero)
-                if not ficha:
-                    numeros_invalidos.append(numero)
-                elif ficha.status != 'Disponível':
-                    numeros_indisponiveis.append(numero)
-                else:
-                    ficha.entidade = entidade
-                    ficha.status = 'Distribuida'
-                    ficha.data_entrega = timezone.now()
-                    ficha.save(update_fields=['entidade', 'status', 'data_entrega'])
-                    numeros_distribuidos.append(numero)
-
-        # Mensagens de retorno
-        if numeros_distribuidos:
-            messages.success(
-                request,
-                f"{len(numeros_distribuidos)} fichas distribuídas para {entidade.nome}: "
-                f"{', '.join(numeros_distribuidos)}."
-            )
+        # Distribuição em lote: um lock, um UPDATE e a classificação dos números restantes
+        resultado = distribuir_numeros(entidade, numeros_selecionados, usuario=request.user)
+        _mensagens_distribuicao(request, entidade, resultado, ', '.join)
 
-        if numeros_indisponiveis:
-            messages.warning(
-                request,
-                f"{len(numeros_indisponiveis)} fichas já estavam indisponíveis: "
-                f"{', '.join(numeros_indisponiveis)}."
-            )
+        return resposta_acao_entidade(request, entidade, estoque_alterado=bool(resultado['distribuidos']))
 
-        if numeros_invalidos:
-            messages.error(
-                request,
-                f"{len(numeros_invalidos)} fichas não existem no sistema: "
-                f"{', '.join(numeros_invalidos)}."
-            )
 
-        return redirect('entidade_detail', pk=entidade.id)
+@require_POST
+def distribuir_fichas_intervalo(request, entidade_id):
+    """
+    Distribui fichas por faixa de números ("do número X ao Y"), por bloco ou entre blocos.
+    """
+    entidade = get_object_or_404(Entidade, pk=entidade_id)
+    form = DistribuicaoIntervaloForm(request.POST)
+
+    if not form.is_valid():
+        for erros in form.errors.values():
+            for erro in erros:
+                messages.error(request, erro)
+        return resposta_acao_entidade(request, entidade)
+
+    resultado = distribuir_intervalos(
+        entidade,
+        form.cleaned_data['tipo'],
+        form.cleaned_data['intervalos'],
+        bloco=form.cleaned_data['bloco'],
+        usuario=request.user,
+    )
+    _mensagens_distribuicao(request, entidade, resultado, resumir_numeros)
+
+    return resposta_acao_entidade(request, entidade, estoque_alterado=bool(resultado['distribuidos']))
+
+
+def _mensagens_distribuicao(request, entidade, resultado, formatar):
+    numeros_distribuidos = resultado['distribuidos']
+    numeros_indisponiveis = resultado['indisponiveis']
+    numeros_invalidos = resultado['invalidos']
+
+    # Mensagens de retorno
+    if numeros_distribuidos:
+        messages.success(
+            request,
+            f"{len(numeros_distribuidos)} fichas distribuídas para {entidade.nome}: "
+            f"{formatar(numeros_distribuidos)}."
+        )
+
+    if numeros_indisponiveis:
+        messages.warning(
+            request,
+            f"{len(numeros_indisponiveis)} fichas já estavam indisponíveis: "
+            f"{formatar(numeros_indisponiveis)}."
+        )
+
+    if numeros_invalidos:
+        messages.error(
+            request,
+            f"{len(numeros_invalidos)} fichas não existem no sistema: "
+            f"{formatar(numeros_invalidos)}."
+        )
 
 class BlocoListView(ListView):
     model = Bloco
     template_name = 'controle_oficio/bloco_list.html'
     context_object_name = 'blocos'
-    
+    paginate_by = 30
+
+    def get_queryset(self):
+        # As contagens de fichas de cada bloco vêm do cache (contagens_dos_blocos),
+        # então a listagem em si só pagina os blocos.
+        return Bloco.objects.order_by('-data_recebimento', '-id')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Contagens para as estatísticas
-        blocos = self.get_queryset()
-        context['total_blocos'] = blocos.count()
-        context['blocos_do_count'] = blocos.filter(tipo='DO').count()
-        context['blocos_dnv_count'] = blocos.filter(tipo='DNV').count()
-        context['total_fichas'] = blocos.count() * 30  # Cada bloco tem 30 fichas
-        
-        # Adicionar contagens de fichas por status para cada bloco
-        for bloco in context['blocos']:
-            bloco.fichas_disponiveis_count = bloco.fichas.filter(status='Disponível').count()
-            bloco.fichas_distribuidas_count = bloco.fichas.filter(status='Distribuida').count()
+        contagens_dos_blocos(context['blocos'])
+
+        # Contagens para as estatísticas (uma única query com agregação condicional),
+        # guardadas até a próxima mudança nas fichas
+        context.update(em_cache(chave('totais_blocos', versao(FICHAS)), totais_dos_blocos))
         
         return context
 
+
+def totais_dos_blocos():
+    totais = Bloco.objects.aggregate(
+        total_blocos=Count('id'),
+        blocos_do_count=Count('id', filter=Q(tipo='DO')),
+        blocos_dnv_count=Count('id', filter=Q(tipo='DNV')),
+    )
+    totais['total_fichas'] = estatisticas_resumo()['total']  # Lido do resumo diário, sem contar a tabela de fichas
+    return totais
+
+
+def contagens_dos_blocos(blocos):
+    """
+    Preenche fichas_count, fichas_disponiveis_count e fichas_distribuidas_count
+    dos blocos da página. Cada bloco tem sua chave no cache (na versão do
+    bloco); os que faltarem são contados juntos numa única query.
+    """
+    versoes_blocos = versoes(BLOCO, [bloco.pk for bloco in blocos])
+    chaves = {pk: chave('contagens_bloco', pk, versao_bloco) for pk, versao_bloco in versoes_blocos.items()}
+
+    def contar(pks):
+        contagens = {pk: (0, 0, 0) for pk in pks}
+        linhas = (
+            Ficha.objects
+            .filter(bloco_id__in=pks)
+            .order_by()
+            .values('bloco_id')
+            .annotate(
+                total=Count('id'),
+                disponiveis=Count('id', filter=Q(status='Disponível')),
+                distribuidas=Count('id', filter=Q(status='Distribuida')),
+            )
+        )
+        for linha in linhas:
+            contagens[linha['bloco_id']] = (linha['total'], linha['disponiveis'], linha['distribuidas'])
+        return contagens
+
+    contagens = varios_em_cache(chaves, contar)
+    for bloco in blocos:
+        bloco.fichas_count, bloco.fichas_disponiveis_count, bloco.fichas_distribuidas_count = contagens[bloco.pk]
+
 class BlocoDetailView(DetailView):
     model = Bloco
     template_name = 'controle_oficio/bloco_detail.html'
@@ -278,30 +601,39 @@ def dar_desfecho_ficha(request, ficha_id):
     Atualiza o status de uma ficha para 'Utilizada' ou 'Cancelada'.
     """
     ficha = get_object_or_404(Ficha, pk=ficha_id)
-    # Guarda o ID da entidade para redirecionar de volta para a página correta.
-    entidade_id = ficha.entidade.id 
+    # Guarda a entidade para voltar para a página correta.
+    entidade = ficha.entidade
 
     novo_status = request.POST.get('status')
 
     # Validação para garantir que o status enviado é válido
     if novo_status not in ['Utilizada', 'Cancelada']:
         messages.error(request, "Status inválido para o desfecho.")
-        return redirect('entidade_detail', pk=entidade_id)
+        return resposta_acao_entidade(request, entidade)
 
     # Validação para garantir que a ficha está no estado correto para ser finalizada
     if ficha.status != 'Distribuida':
         messages.warning(request, f"A ficha {ficha.numero} não está com o status 'Distribuida' e não pode ser finalizada.")
-        return redirect('entidade_detail', pk=entidade_id)
+        return resposta_acao_entidade(request, entidade)
 
     # Se tudo estiver OK, atualiza os campos da ficha
+    status_anterior = ficha.status
     ficha.status = novo_status
     ficha.desfecho_por = request.user
     ficha.data_desfecho=timezone.now()
-    # O método save() do model já cuida de preencher a data_desfecho
-    ficha.save(update_fields=['status', 'desfecho_por', 'data_desfecho'])
+    with transaction.atomic():
+        # O método save() do model já cuida de preencher a data_desfecho
+        ficha.save(update_fields=['status', 'desfecho_por', 'data_desfecho'])
+        FichaEvento.objects.registrar(
+            'Desfecho',
+            [(ficha.id, status_anterior, ficha.entidade_id)],
+            usuario=request.user,
+            data_evento=ficha.data_desfecho,
+            status=novo_status,
+        )
 
     messages.success(request, f"A ficha {ficha.numero} foi marcada como '{novo_status}'.")
-    return redirect('entidade_detail', pk=entidade_id)
+    return resposta_acao_entidade(request, entidade)
 
 
 @require_POST
@@ -315,11 +647,11 @@ def dar_desfecho_em_lote(request):
 
     if not ficha_ids:
         messages.warning(request, "Nenhuma ficha foi selecionada.")
-        return redirect('entidade_detail', pk=entidade_id)
+        return resposta_acao_entidade(request, entidade_id)
 
     if novo_status not in ['Utilizada', 'Cancelada']:
         messages.error(request, "Status inválido para o desfecho.")
-        return redirect('entidade_detail', pk=entidade_id)
+        return resposta_acao_entidade(request, entidade_id)
 
     try:
         with transaction.atomic():
@@ -329,46 +661,63 @@ def dar_desfecho_em_lote(request):
                 entidade_id=entidade_id,
                 status='Distribuida'
             )
-            
-            contagem = fichas_para_atualizar.count()
+            # Trava as fichas e guarda o estado atual para o resumo diário e o histórico
+            linhas = list(
+                fichas_para_atualizar.select_for_update()
+                .values_list('id', 'bloco_id', 'data_recebimento', 'tipo', 'status', 'entidade_id')
+            )
 
-            # Usamos .update() para uma única query no banco, muito mais rápido.
-            # Nota: .update() não chama o método .save() do model, 
-            # então temos que setar a data_desfecho manualmente aqui.
-            fichas_para_atualizar.update(
+            # Uma única query no banco, muito mais rápido que salvar ficha por ficha.
+            # dar_desfecho() preenche a data_desfecho na mesma query (o save() não é chamado).
+            contagem = fichas_para_atualizar.dar_desfecho(novo_status, desfecho_por=request.user)
+            ResumoDiarioFicha.objects.aplicar_deltas(
+                ResumoDiarioFicha.objects.deltas_de_atualizacao(
+                    [linha[2:] for linha in linhas], status=novo_status
+                )
+            )
+            FichaEvento.objects.registrar(
+                'Desfecho',
+                [(ficha_id, status, entidade_id) for ficha_id, _, _, _, status, entidade_id in linhas],
+                usuario=request.user,
                 status=novo_status,
-                desfecho_por=request.user,
-                data_desfecho=timezone.now()
             )
+            invalidar(BLOCO, [linha[1] for linha in linhas])
+            invalidar(ENTIDADE, [linha[5] for linha in linhas])
 
         messages.success(request, f"{contagem} fichas foram marcadas como '{novo_status}'.")
     except Exception as e:
         messages.error(request, f"Ocorreu um erro ao processar o lote: {e}")
 
-    return redirect('entidade_detail', pk=entidade_id)
+    return resposta_acao_entidade(request, entidade_id)
 
 
 def dashboard_view(request):
     selected_dates = request.GET.getlist('datas')
-    base_queryset = Ficha.objects.all()
 
-    if selected_dates:
-        base_queryset = base_queryset.filter(data_recebimento__date__in=selected_dates)
+    # --- Cálculo das Estatísticas (uma única query sobre o resumo diário) ---
+    # Guardadas por seleção de dias até a próxima mudança nas fichas
+    versao_fichas = versao(FICHAS)
+    estatisticas = em_cache(
+        chave('estatisticas_resumo', versao_fichas, dias_selecionados(selected_dates)),
+        lambda: estatisticas_resumo(selected_dates),
+    )
 
-    # --- Cálculo das Estatísticas (sem alteração) ---
-    total_recebidas = base_queryset.count()
-    disponiveis_count = base_queryset.filter(status='Disponível').count()
-    distribuidas_count = base_queryset.filter(status='Distribuida').count()
-    finalizadas_count = base_queryset.filter(status__in=['Utilizada', 'Cancelada']).count()
-    
-    if total_recebidas > 0:
-        percentual_finalizadas = (finalizadas_count / total_recebidas) * 100
-    else:
-        percentual_finalizadas = 0
+    context = {
+        'total_recebidas': estatisticas['total'],
+        'disponiveis_count': estatisticas['disponiveis'],
+        'distribuidas_count': estatisticas['distribuidas'],
+        'percentual_finalizadas': estatisticas['percentual_finalizadas'],
+        'estatisticas_por_tipo': estatisticas['por_tipo'],
+        'selected_dates': selected_dates,
+    }
+
+    # O refresh via HTMX só troca o bloco de estatísticas, então não precisa das datas do filtro.
+    if 'HX-Request' in request.headers:
+        return render(request, 'controle_oficio/partials/dashboard_stats.html', context)
 
     # --- NOVA LÓGICA PARA AGRUPAR DATAS ---
-    # 1. Busca todas as datas únicas de recebimento do banco
-    all_unique_dates = Ficha.objects.dates('data_recebimento', 'day', order='DESC')
+    # 1. Busca todas as datas únicas de recebimento a partir do resumo diário
+    all_unique_dates = em_cache(chave('datas_de_recebimento', versao_fichas), lambda: list(datas_de_recebimento()))
 
     # 2. Usa um dicionário para agrupar as datas por Mês/Ano
     dates_by_month = defaultdict(list)
@@ -386,16 +735,60 @@ def dashboard_view(request):
         })
     # --- FIM DA NOVA LÓGICA ---
 
+    context['grouped_dates'] = grouped_dates # Enviamos as datas agrupadas
+
+    return render(request, 'controle_oficio/dashboard.html', context)
+
+
+# =========================
+# REPOSIÇÃO
+# =========================
+
+# Linhas (entidade e tipo) por página da previsão de reposição
+LINHAS_POR_PAGINA_REPOSICAO = 50
+
+
+def reposicao_view(request):
+    """
+    Previsão de fim do estoque em mãos de cada entidade, da situação mais
+    urgente para a menos urgente, com filtro por tipo e por situação.
+    A previsão de todas as entidades vem do cache; aqui só se filtra e pagina.
+    """
+    tipo = request.GET.get('tipo', '')
+    situacao = request.GET.get('situacao', '')
+
+    previsao = [linha for linha in previsao_reposicao() if not tipo or linha['tipo'] == tipo]
+    por_situacao = Counter(linha['situacao'] for linha in previsao)
+    if situacao:
+        previsao = [linha for linha in previsao if linha['situacao'] == situacao]
+
     context = {
-        'total_recebidas': total_recebidas,
-        'disponiveis_count': disponiveis_count,
-        'distribuidas_count': distribuidas_count,
-        'percentual_finalizadas': percentual_finalizadas,
-        'grouped_dates': grouped_dates, # Enviamos as datas agrupadas
-        'selected_dates': selected_dates,
+        'page_obj': Paginator(previsao, LINHAS_POR_PAGINA_REPOSICAO).get_page(request.GET.get('page')),
+        'situacoes': [(nome, por_situacao[nome]) for nome in SITUACOES],
+        'tipos': Bloco.TIPO_CHOICES,
+        'tipo': tipo,
+        'situacao': situacao,
+        'limite_critico': LIMITE_CRITICO_DIAS,
+        'limite_atencao': LIMITE_ATENCAO_DIAS,
     }
+    return render(request, 'controle_oficio/reposicao.html', context)
 
-    if 'HX-Request' in request.headers:
-        return render(request, 'controle_oficio/partials/dashboard_stats.html', context)
-    
-    return render(request, 'controle_oficio/dashboard.html', context)
\ No newline at end of file
+
+# =========================
+# EXPORTAÇÃO
+# =========================
+
+def exportar_fichas(request):
+    """
+    Exporta em CSV o histórico das fichas (com bloco, entidade e desfecho),
+    filtrado pelas mesmas datas do dashboard e, opcionalmente, por entidade.
+    As linhas são enviadas conforme saem do banco, sem montar o arquivo em memória.
+    """
+    entidade_id = request.GET.get('entidade')
+    if entidade_id and not entidade_id.isdigit():
+        return HttpResponseBadRequest("Entidade inválida.")
+
+    fichas = consulta_exportacao(request.GET.getlist('datas'), entidade_id)
+    response = StreamingHttpResponse(linhas_csv(fichas), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="fichas_{timezone.localtime():%Y%m%d_%H%M}.csv"'
+    return response
@@ -0,0 +1,45 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const selectElement = document.getElementById('nova_entidade_id');
+
+    // Se o '<select>' de destino da transferência não existir na página, o script não faz nada.
+    if (!selectElement) {
+        return;
+    }
+
+    // Inicialização do Tom Select: as opções vêm do servidor conforme o usuário digita,
+    // em vez de a página trazer todas as entidades cadastradas.
+    new TomSelect(selectElement, {
+        valueField: 'id',
+        labelField: 'nome',
+        searchField: ['nome', 'numero_documento'],
+        placeholder: 'Digite o nome ou o documento...',
+        create: false,
+
+        // O servidor só responde a partir de 2 caracteres
+        shouldLoad: function (query) {
+            return query.length >= 2;
+        },
+
+        load: function (query, callback) {
+            // 'data-url' já traz o parâmetro 'excluir' com a entidade de origem
+            const url = new URL(selectElement.dataset.url, window.location.origin);
+            url.searchParams.set('q', query);
+            fetch(url)
+                .then(response => response.json())
+                .then(json => callback(json.resultados))
+                .catch(() => callback());
+        },
+
+        render: {
+            option: function (item, escape) {
+                return `<div>
+                    <div class="font-medium">${escape(item.nome)}</div>
+                    <div class="text-xs text-gray-500">${escape(item.tipo)} · ${escape(item.numero_documento)}</div>
+                </div>`;
+            },
+            no_results: function () {
+                return '<div class="no-results">Nenhuma entidade encontrada</div>';
+            },
+        },
+    });
+});
@@ -0,0 +1,122 @@
+"""
+Cache dos resultados da consulta de CEP, compartilhado pelos workers pelo
+cache do Django.
+
+Cada CEP é guardado já com os resultados montados (telefones e endereços
+formatados), numa chave que leva a versão da base publicada por
+recarregar_indice_cep: depois de atualizar as tabelas e rodar o comando, os
+valores antigos ficam órfãos e expiram sozinhos. CEPs que não estão na base
+também são guardados, por menos tempo.
+
+Os resultados ficam no alias 'ubs_consulta' do CACHES, com limite de entradas
+próprio (CACHE_UBS_CONSULTA_MAX_ENTRIES), para que os CEPs não tirem do cache
+os contextos do controle_oficio. O descarte ao atingir o limite é o do
+backend: os menos usados no LOCAL; no ARQUIVO, uma parte das entradas
+escolhida ao acaso (não é LRU); no REDIS, conforme o maxmemory-policy
+(allkeys-lru para LRU).
+
+Acertos e falhas são contados na memória de cada worker e somados no cache
+a cada INTERVALO_ENVIO_CONTAGENS segundos (ver estatisticas()).
+"""
+import threading
+import time
+
+from django.core.cache import cache, caches
+from django.db import connection
+
+from .indice import versao_publicada
+
+
+# Alias do CACHES com os resultados por CEP; a versão da base e os contadores ficam no 'default'
+CACHE_RESULTADOS = 'ubs_consulta'
+
+# Tempo de vida dos resultados de um CEP encontrado e de um CEP fora da base
+TEMPO_CACHE_CEP = 60 * 60
+TEMPO_CACHE_CEP_NAO_ENCONTRADO = 5 * 60
+
+# Guardado no lugar dos resultados de um CEP que não está na base
+NAO_ENCONTRADO = []
+
+ACERTOS = 'acertos'
+FALHAS = 'falhas'
+
+# Segundos entre os envios das contagens do worker para o cache: um incr a
+# cada consulta custaria mais que a própria leitura do cache no backend ARQUIVO
+INTERVALO_ENVIO_CONTAGENS = 10
+
+_contagens = {ACERTOS: 0, FALHAS: 0}
+_enviado_em = time.monotonic()
+_trava = threading.Lock()
+
+
+def _prefixo():
+    # O nome do banco separa os caches de bancos diferentes (LOCAL/SUPABASE, testes)
+    return f"ubs_consulta:{connection.settings_dict['NAME']}"
+
+
+def _chave_contador(nome):
+    return f'{_prefixo()}:cache_cep:{nome}'
+
+
+def _enviar_contagens():
+    global _enviado_em
+    with _trava:
+        contagens = {nome: quantidade for nome, quantidade in _contagens.items() if quantidade}
+        for nome in _contagens:
+            _contagens[nome] = 0
+        _enviado_em = time.monotonic()
+
+    for nome, quantidade in contagens.items():
+        chave_contador = _chave_contador(nome)
+        try:
+            cache.incr(chave_contador, quantidade)
+        except ValueError:
+            # Primeiro envio (ou o contador foi descartado pelo backend)
+            if not cache.add(chave_contador, quantidade, None):
+                cache.incr(chave_contador, quantidade)
+
+
+def _contar(nome):
+    with _trava:
+        _contagens[nome] += 1
+    if time.monotonic() - _enviado_em >= INTERVALO_ENVIO_CONTAGENS:
+        _enviar_contagens()
+
+
+def consultar_em_cache(cep, consultar):
+    """
+    Resultados de consultar(cep) guardados por CEP. Retorna None se o CEP
+    não estiver na base, como consulta.consultar_cep().
+    """
+    chave_cep = f'{_prefixo()}:cep:{versao_publicada()}:{cep}'
+    resultados = caches[CACHE_RESULTADOS].get(chave_cep)
+    if resultados is not None:
+        _contar(ACERTOS)
+        return resultados or None
+
+    _contar(FALHAS)
+    resultados = consultar(cep)
+    if resultados is None:
+        caches[CACHE_RESULTADOS].set(chave_cep, NAO_ENCONTRADO, TEMPO_CACHE_CEP_NAO_ENCONTRADO)
+    else:
+        caches[CACHE_RESULTADOS].set(chave_cep, resultados, TEMPO_CACHE_CEP)
+    return resultados
+
+
+def estatisticas():
+    """
+    Acertos e falhas do cache desde a última zeragem, somando todos os workers
+    (dos outros, até o último envio).
+    """
+    _enviar_contagens()
+    chaves = {nome: _chave_contador(nome) for nome in (ACERTOS, FALHAS)}
+    guardados = cache.get_many(list(chaves.values()))
+    contagens = {nome: guardados.get(chave_contador, 0) for nome, chave_contador in chaves.items()}
+    total = contagens[ACERTOS] + contagens[FALHAS]
+    contagens['taxa_acerto'] = contagens[ACERTOS] / total if total else None
+    return contagens
+
+
+def zerar_estatisticas():
+    _enviar_contagens()
+    cache.delete_many([_chave_contador(nome) for nome in (ACERTOS, FALHAS)])
@@ -0,0 +1,152 @@
+"""
+Consulta das tabelas de referência de endereçamento de Jundiaí (logradouros
+e ubs). As tabelas são carregadas fora do Django, sem models; as consultas
+usam a conexão do próprio Django, que é reaproveitada entre requisições
+(CONN_MAX_AGE) e verificada antes do uso (CONN_HEALTH_CHECKS).
+"""
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import connection
+
+
+SEM_UNIDADE = "SEM UNIDADE DESIGNADA"
+
+# CEPs de Jundiaí
+PREFIXOS_CEP = ("1320", "1321")
+
+
+def validar_cep(cep):
+    """
+    Mensagem de erro do CEP digitado, ou None se ele for válido.
+    """
+    if len(cep) != 8:
+        return f"CEP deve conter exatamente 8 dígitos. Você digitou {len(cep)} dígitos."
+    if not cep.isdigit():
+        return "CEP deve conter apenas números."
+    if not cep.startswith(PREFIXOS_CEP):
+        return f"CEP {cep} não pertence à região de Jundiaí (deve começar com 1320 ou 1321)."
+    return None
+
+
+def formatar_telefone(telefone):
+    # O telefone vem da planilha como número (ex.: 1145891234.0)
+    if not telefone:
+        return "Não informado"
+    try:
+        telefone_str = str(int(float(telefone)))
+    except (ValueError, TypeError):
+        return "Não informado"
+    return f"({telefone_str[:2]}) {telefone_str[2:6]}-{telefone_str[6:]}" if len(telefone_str) >= 10 else telefone_str
+
+
+def formatar_endereco(logradouro, numero, bairro):
+    partes = [parte for parte in [logradouro, f"nº {numero}" if numero else None, f"- {bairro}" if bairro else None] if parte]
+    return ", ".join(partes) if partes else "Endereço não informado"
+
+
+# Logradouros já com a UBS de cada um: uma única ida ao banco por consulta.
+# O LEFT JOIN mantém os códigos de UBS que não existem na tabela ubs.
+COLUNAS_CONSULTA = """
+    l."BAIRRO", l."LOGRADOURO", l."COD UBS",
+    u."PK", u."UNIDADE DE SAÚDE", u."logradouro", u."numero", u."bairro", u."telefone"
+"""
+JUNCAO_CONSULTA = """
+    FROM logradouros l
+    LEFT JOIN ubs u ON u."PK" = l."COD UBS"
+"""
+
+CONSULTA_CEP = f"""
+    SELECT {COLUNAS_CONSULTA}
+    {JUNCAO_CONSULTA}
+    WHERE l."CEP" = %s
+    ORDER BY l."BAIRRO", l."LOGRADOURO";
+"""
+
+# Vários CEPs de uma vez (consulta em lote), com o CEP na primeira coluna
+CONSULTA_CEPS = f"""
+    SELECT l."CEP", {COLUNAS_CONSULTA}
+    {JUNCAO_CONSULTA}
+    WHERE l."CEP" IN %s
+    ORDER BY l."CEP", l."BAIRRO", l."LOGRADOURO";
+"""
+
+
+def montar_resultados(linhas):
+    """
+    Agrupa por bairro as linhas de CONSULTA_CEP no formato usado pela tela:
+    uma lista de {'nome' (logradouros), 'bairro', 'ubs_list'}.
+    """
+    # Agrupa os resultados por bairro, guardando os dados de cada UBS uma vez só
+    bairros_data = defaultdict(lambda: {'logradouros': set(), 'ubs': {}})
+    for bairro, logradouro, cod_ubs, pk, *ubs_info in linhas:
+        bairros_data[bairro]['logradouros'].add(logradouro)
+        if cod_ubs:
+            bairros_data[bairro]['ubs'][cod_ubs] = ubs_info if pk is not None else None
+
+    resultados = []
+    for bairro, data in bairros_data.items():
+        ubs_list = []
+        tem_ubs_real = False
+
+        for cod, ubs_info in sorted(data['ubs'].items()):
+            if ubs_info:
+                nome, logradouro_ubs, numero, bairro_ubs, telefone = ubs_info
+                if nome == SEM_UNIDADE:
+                    continue
+                tem_ubs_real = True
+                ubs_list.append({
+                    "nome": nome,
+                    "endereco": formatar_endereco(logradouro_ubs, numero, bairro_ubs),
+                    "telefone": formatar_telefone(telefone),
+                })
+            else:
+                ubs_list.append({
+                    "nome": f"UBS código {cod} - Informações não encontradas",
+                    "endereco": "Dados não disponíveis",
+                    "telefone": "Não informado",
+                })
+
+        # Se não houver UBS real, adiciona a mensagem padrão
+        if not tem_ubs_real:
+            ubs_list.append({
+                "nome": SEM_UNIDADE,
+                "endereco": "Entre em contato com a Secretaria de Saúde para mais informações sobre o endereçamento desta região",
+                "telefone": "Não informado",
+            })
+
+        resultados.append({
+            "nome": ", ".join(sorted(data['logradouros'])),  # Pode ser mais de um logradouro por bairro
+            "bairro": bairro,
+            "ubs_list": ubs_list,
+        })
+
+    return resultados
+
+
+def consultar_cep(cep):
+    """
+    UBS de referência de cada bairro do CEP (ver montar_resultados()).
+    Retorna None se o CEP não estiver na base.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(CONSULTA_CEP, (cep,))
+        linhas = cursor.fetchall()
+    return montar_resultados(linhas) if linhas else None
+
+
+def consultar_ceps(ceps):
+    """
+    consultar_cep() de vários CEPs numa única consulta: {cep: resultados}
+    só com os CEPs encontrados.
+    """
+    ceps = tuple(ceps)
+    if not ceps:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(CONSULTA_CEPS, (ceps,))
+        linhas = cursor.fetchall()
+    return {
+        str(cep): montar_resultados([linha[1:] for linha in linhas_do_cep])
+        for cep, linhas_do_cep in groupby(linhas, key=lambda linha: linha[0])
+    }
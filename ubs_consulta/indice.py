@@ -0,0 +1,121 @@
+"""
+Índice em memória CEP -> logradouros/UBS, usado quando UBS_CONSULTA_EM_MEMORIA
+está ligado: cada worker carrega uma vez toda a base de Jundiaí (CEPs 1320/1321)
+e as consultas deixam de ir ao banco.
+
+Para trocar os dados sem reiniciar os workers, o comando recarregar_indice_cep
+publica uma nova versão no cache do Django (compartilhado entre os workers com
+CACHE_ACTIVE=ARQUIVO ou REDIS). Cada worker confere a versão a cada
+INTERVALO_VERIFICACAO segundos e, se mudou, monta o índice novo ao lado do
+antigo e troca a referência de uma vez: quem estiver lendo o antigo termina
+com ele.
+"""
+import secrets
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+from .consulta import COLUNAS_CONSULTA, JUNCAO_CONSULTA, montar_resultados
+
+
+# Segundos entre as conferências da versão publicada
+INTERVALO_VERIFICACAO = 30
+
+CARGA_INDICE = f"""
+    SELECT l."CEP", {COLUNAS_CONSULTA}
+    {JUNCAO_CONSULTA}
+    WHERE l."CEP"::text LIKE '1320%' OR l."CEP"::text LIKE '1321%'
+    ORDER BY l."CEP", l."BAIRRO", l."LOGRADOURO";
+"""
+
+
+class IndiceCep:
+    """
+    Linhas da consulta (as mesmas de CONSULTA_CEP) agrupadas por CEP, em tuplas.
+    """
+
+    def __init__(self, linhas_por_cep, versao):
+        self.linhas_por_cep = linhas_por_cep
+        self.versao = versao
+        self.verificado_em = time.monotonic()
+
+    @classmethod
+    def carregar(cls, versao):
+        linhas_por_cep = {}
+        with connection.cursor() as cursor:
+            cursor.execute(CARGA_INDICE)
+            for cep, *linha in cursor.fetchall():
+                linhas_por_cep.setdefault(int(cep), []).append(tuple(linha))
+        return cls({cep: tuple(linhas) for cep, linhas in linhas_por_cep.items()}, versao)
+
+    def consultar(self, cep):
+        linhas = self.linhas_por_cep.get(int(cep))
+        return montar_resultados(linhas) if linhas else None
+
+
+_indice = None
+# Só uma thread por worker confere a versão e carrega o índice
+_trava = threading.Lock()
+
+
+def _chave_versao():
+    # O nome do banco separa as versões de bancos diferentes (LOCAL/SUPABASE, testes)
+    return f"ubs_consulta:{connection.settings_dict['NAME']}:versao_indice"
+
+
+def versao_publicada():
+    chave = _chave_versao()
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, secrets.token_hex(8), None)
+        versao = cache.get(chave)
+    return versao
+
+
+def indice_atual():
+    """
+    Índice do worker, recarregado se a versão publicada mudou.
+
+    Só uma thread confere a versão e recarrega; enquanto isso as outras
+    seguem com o índice atual. Só a primeira carga faz as demais esperarem.
+    """
+    global _indice
+    indice = _indice
+    if indice is not None and time.monotonic() - indice.verificado_em < INTERVALO_VERIFICACAO:
+        return indice
+
+    if not _trava.acquire(blocking=indice is None):
+        return indice
+    try:
+        indice = _indice
+        if indice is not None and time.monotonic() - indice.verificado_em < INTERVALO_VERIFICACAO:
+            return indice
+        versao = versao_publicada()
+        if indice is None or indice.versao != versao:
+            _indice = indice = IndiceCep.carregar(versao)
+        else:
+            indice.verificado_em = time.monotonic()
+        return indice
+    finally:
+        _trava.release()
+
+
+def consultar_indice(cep):
+    """
+    Mesmo resultado de consulta.consultar_cep(), lido do índice em memória.
+    """
+    return indice_atual().consultar(cep)
+
+
+def recarregar_indice():
+    """
+    Carrega um índice novo neste processo e publica a versão dele para os
+    demais workers. A versão só é publicada se a carga der certo.
+    """
+    global _indice
+    versao = secrets.token_hex(8)
+    _indice = indice = IndiceCep.carregar(versao)
+    cache.set(_chave_versao(), versao, None)
+    return indice
@@ -0,0 +1,161 @@
+"""
+Consulta de UBS para uma lista de CEPs (planilhas de pacientes, por exemplo).
+
+A entrada é um CSV com uma coluna 'cep' (as demais colunas são devolvidas
+como vieram) ou uma lista JSON de CEPs. Os CEPs distintos e válidos são
+resolvidos de uma vez (uma consulta ao banco, ou o índice em memória) e a
+saída é o mesmo CSV com as colunas de RESULTADO acrescentadas, uma linha
+para cada linha da entrada.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+
+from .consulta import consultar_ceps, validar_cep
+from .indice import consultar_indice
+
+
+# Colunas acrescentadas a cada linha da entrada
+RESULTADO = ['situacao', 'bairros', 'ubs', 'enderecos_ubs', 'telefones_ubs']
+
+# Separador e BOM para o arquivo abrir direto no Excel em português
+DELIMITADOR_CSV = ';'
+BOM_UTF8 = '\ufeff'
+
+# Separa os vários bairros/UBS de um mesmo CEP dentro de uma célula
+SEPARADOR_VALORES = ' | '
+
+SITUACAO_OK = 'OK'
+
+
+def normalizar_cep(valor):
+    # Planilhas costumam trazer o CEP formatado (13201-234, 13.201-234)
+    return str(valor).strip().replace('-', '').replace('.', '').replace(' ', '')
+
+
+def _decodificar(conteudo):
+    if isinstance(conteudo, bytes):
+        try:
+            return conteudo.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return conteudo.decode('latin-1')
+    return conteudo.lstrip(BOM_UTF8)
+
+
+def ler_entrada(conteudo):
+    """
+    Lê o CSV (separado por vírgula ou ponto e vírgula, UTF-8 ou Latin-1) ou a
+    lista JSON (["13201234", ...] ou {"ceps": [...]}) e devolve
+    (cabecalho, linhas, índice da coluna do CEP).
+
+    Um CSV de uma coluna só pode vir sem cabeçalho.
+    """
+    conteudo = _decodificar(conteudo).strip()
+    if not conteudo:
+        raise ValueError("Nenhum CEP informado.")
+
+    if conteudo[0] in '[{':
+        try:
+            dados = json.loads(conteudo)
+        except json.JSONDecodeError:
+            raise ValueError("JSON inválido.")
+        if isinstance(dados, dict):
+            dados = dados.get('ceps')
+        if not isinstance(dados, list):
+            raise ValueError("O JSON deve ser uma lista de CEPs ou um objeto com a lista em 'ceps'.")
+        return ['cep'], [[str(cep)] for cep in dados], 0
+
+    primeira_linha = conteudo.split('\n', 1)[0]
+    delimitador = ';' if primeira_linha.count(';') > primeira_linha.count(',') else ','
+    linhas = [valores for valores in csv.reader(io.StringIO(conteudo), delimiter=delimitador) if any(v.strip() for v in valores)]
+    if not linhas:
+        raise ValueError("Nenhum CEP informado.")
+
+    colunas = [coluna.strip().lower() for coluna in linhas[0]]
+    if 'cep' in colunas:
+        return linhas[0], linhas[1:], colunas.index('cep')
+    if len(colunas) > 1:
+        raise ValueError("O arquivo precisa de uma coluna 'cep'.")
+    # Uma coluna só: a primeira linha é cabeçalho se não for um número
+    if normalizar_cep(linhas[0][0]).isdigit():
+        return ['cep'], linhas, 0
+    return linhas[0], linhas[1:], 0
+
+
+def _resultado(resultados):
+    """
+    Valores das colunas de RESULTADO para um CEP encontrado.
+    """
+    ubs = {}
+    for logradouro in resultados:
+        for item in logradouro['ubs_list']:
+            ubs.setdefault(item['nome'], item)
+    return [
+        SITUACAO_OK,
+        SEPARADOR_VALORES.join(logradouro['bairro'] for logradouro in resultados),
+        SEPARADOR_VALORES.join(ubs),
+        SEPARADOR_VALORES.join(item['endereco'] for item in ubs.values()),
+        SEPARADOR_VALORES.join(item['telefone'] for item in ubs.values()),
+    ]
+
+
+def resolver_ceps(ceps):
+    """
+    {cep: valores de RESULTADO} de cada CEP informado, consultando os CEPs
+    válidos de uma só vez.
+    """
+    resolvidos = {}
+    validos = set()
+    for cep in set(ceps):
+        erro = validar_cep(cep)
+        if erro:
+            resolvidos[cep] = [erro, '', '', '', '']
+        else:
+            validos.add(cep)
+
+    if settings.UBS_CONSULTA_EM_MEMORIA:
+        encontrados = {cep: consultar_indice(cep) for cep in validos}
+    else:
+        encontrados = consultar_ceps(sorted(validos))
+
+    for cep in validos:
+        if encontrados.get(cep):
+            resolvidos[cep] = _resultado(encontrados[cep])
+        else:
+            resolvidos[cep] = [f"CEP {cep} não foi encontrado na base de dados de Jundiaí.", '', '', '', '']
+    return resolvidos
+
+
+def resolver_lote(conteudo):
+    """
+    Lê a entrada e resolve os CEPs; devolve (cabecalho, linhas, CEP de cada
+    linha, resolvidos) para linhas_csv(). A consulta acontece aqui, antes de
+    a resposta começar a ser enviada.
+    """
+    cabecalho, linhas, coluna_cep = ler_entrada(conteudo)
+    ceps = [normalizar_cep(valores[coluna_cep]) if coluna_cep < len(valores) else '' for valores in linhas]
+    return cabecalho, linhas, ceps, resolver_ceps(ceps)
+
+
+class _Eco:
+    """
+    "Arquivo" que só devolve o que recebe, para o csv.writer gerar linhas sob demanda.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(cabecalho, linhas, ceps, resolvidos):
+    """
+    Gera o CSV de saída linha a linha: cada linha da entrada seguida das
+    colunas de RESULTADO do seu CEP.
+    """
+    escritor = csv.writer(_Eco(), delimiter=DELIMITADOR_CSV, lineterminator='\n')
+    yield BOM_UTF8 + escritor.writerow(cabecalho + RESULTADO)
+    for valores, cep in zip(linhas, ceps):
+        # Completa as linhas com menos colunas que o cabeçalho
+        valores = valores + [''] * (len(cabecalho) - len(valores))
+        yield escritor.writerow(valores + resolvidos[cep])
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from ubs_consulta.consulta import consultar_cep
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede quantas consultas de CEP por segundo a base de logradouros/UBS atende, comparando '
+        'uma conexão nova a cada consulta (como o psycopg2.connect() por requisição) com a '
+        'conexão reaproveitada do Django (CONN_MAX_AGE).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('ceps', nargs='*', help='CEPs consultados em rodízio (padrão: os primeiros da base).')
+        parser.add_argument('--consultas', type=int, default=200, help='Consultas em cada modo.')
+
+    def handle(self, *args, **options):
+        if options['consultas'] < 1:
+            raise CommandError('--consultas deve ser maior que zero.')
+
+        try:
+            ceps = options['ceps'] or self._ceps_da_base()
+            if not ceps:
+                raise CommandError('Nenhum CEP encontrado na tabela logradouros.')
+
+            for nome, reconectar in (('conexão nova por consulta', True), ('conexão reaproveitada', False)):
+                tempos = self._medir(ceps, options['consultas'], reconectar)
+                self.stdout.write(
+                    f"{nome:<28} {len(tempos) / sum(tempos):>9.1f} consultas/s  "
+                    f"{statistics.median(tempos) * 1000:>8.2f} ms (mediana)"
+                )
+        except DatabaseError as e:
+            raise CommandError(f'Erro ao consultar a base de logradouros/UBS: {e}')
+
+    def _ceps_da_base(self, quantidade=20):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT DISTINCT "CEP" FROM logradouros ORDER BY "CEP" LIMIT %s', [quantidade])
+            return [str(cep) for (cep,) in cursor.fetchall()]
+
+    def _medir(self, ceps, consultas, reconectar):
+        connection.close()
+        tempos = []
+        for i in range(consultas):
+            inicio = time.perf_counter()
+            if reconectar:
+                connection.close()
+            consultar_cep(ceps[i % len(ceps)])
+            tempos.append(time.perf_counter() - inicio)
+        return tempos
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from ubs_consulta.lote import linhas_csv, resolver_lote
+
+
+class Command(BaseCommand):
+    help = (
+        'Consulta a UBS de uma lista de CEPs (CSV com coluna "cep" ou lista JSON) e grava o CSV '
+        'com a UBS de cada linha. Os CEPs distintos são consultados de uma só vez.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entrada', help='Arquivo CSV ou JSON com os CEPs ("-" para a entrada padrão).')
+        parser.add_argument('--saida', help='Arquivo CSV a gravar (padrão: saída padrão).')
+
+    def handle(self, *args, **options):
+        try:
+            if options['entrada'] == '-':
+                conteudo = sys.stdin.buffer.read()
+            else:
+                with open(options['entrada'], 'rb') as arquivo:
+                    conteudo = arquivo.read()
+            lote = resolver_lote(conteudo)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        except DatabaseError as e:
+            raise CommandError(f'Erro ao consultar a base de logradouros/UBS: {e}')
+
+        if not options['saida']:
+            for linha in linhas_csv(*lote):
+                self.stdout.write(linha, ending='')
+            return
+
+        try:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as arquivo:
+                arquivo.writelines(linhas_csv(*lote))
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{len(lote[1])} linha(s) gravada(s) em {options['saida']}."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ubs_consulta.cache import ACERTOS, FALHAS, estatisticas, zerar_estatisticas
+
+
+class Command(BaseCommand):
+    help = 'Mostra os acertos e falhas do cache de resultados da consulta de UBS por CEP (todos os workers).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zerar', action='store_true', help='Zera os contadores depois de mostrar.')
+
+    def handle(self, *args, **options):
+        contagens = estatisticas()
+        taxa = contagens['taxa_acerto']
+        self.stdout.write(f"Acertos: {contagens[ACERTOS]}")
+        self.stdout.write(f"Falhas:  {contagens[FALHAS]}")
+        self.stdout.write(f"Taxa de acerto: {'-' if taxa is None else f'{taxa:.1%}'}")
+
+        if options['zerar']:
+            zerar_estatisticas()
+            self.stdout.write(self.style.SUCCESS('Contadores zerados.'))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from ubs_consulta.indice import INTERVALO_VERIFICACAO, recarregar_indice
+
+
+class Command(BaseCommand):
+    help = (
+        'Recarrega o índice em memória da consulta de UBS por CEP (UBS_CONSULTA_EM_MEMORIA) depois '
+        'de uma atualização das tabelas logradouros/ubs. Os workers trocam o índice sem reiniciar '
+        'e os resultados guardados no cache passam a ser consultados de novo.'
+    )
+
+    def handle(self, *args, **options):
+        try:
+            indice = recarregar_indice()
+        except DatabaseError as e:
+            raise CommandError(f'Erro ao carregar a base de logradouros/UBS; a versão atual foi mantida: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice carregado com {len(indice.linhas_por_cep)} CEPs. '
+            f'Os workers passam a usá-lo em até {INTERVALO_VERIFICACAO} s.'
+        ))
+        if not settings.UBS_CONSULTA_EM_MEMORIA:
+            self.stdout.write(self.style.WARNING('UBS_CONSULTA_EM_MEMORIA está desligado; as consultas continuam indo ao banco.'))
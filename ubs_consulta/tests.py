@@ -1,7 +1,35 @@
-from django.test import TestCase, Client
+import time
+from io import StringIO
+from tempfile import NamedTemporaryFile
+
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
 
+from . import cache as cache_cep, indice
+from .consulta import consultar_cep, consultar_ceps
+
+# Os testes não usam o cache configurado (em disco, no ARQUIVO), que é o mesmo da aplicação
+CACHES_DE_TESTE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'},
+    'ubs_consulta': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes_ubs_consulta'},
+}
+
+
+def limpar_caches():
+    for alias in CACHES_DE_TESTE:
+        caches[alias].clear()
+    # Contagens do worker que ainda não foram enviadas ao cache
+    cache_cep._contagens.update(dict.fromkeys(cache_cep._contagens, 0))
+    cache_cep._enviado_em = time.monotonic()
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
 class ConsultaCEPTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -20,3 +48,245 @@ class ConsultaCEPTests(TestCase):
     def test_cep_invalido(self):
         response = self.client.get(reverse('ubs_consulta:consulta_cep'), {'cep': '123'})
         self.assertContains(response, "não tem 8 dígitos")
+
+
+def criar_tabelas_de_referencia(cursor):
+    """
+    As tabelas logradouros e ubs são carregadas fora do Django (sem models);
+    nos testes são criadas com algumas linhas de exemplo.
+    """
+    cursor.execute(
+        'CREATE TABLE ubs ("PK" integer PRIMARY KEY, "UNIDADE DE SAÚDE" text, '
+        'logradouro text, numero text, bairro text, telefone double precision)'
+    )
+    cursor.execute('CREATE TABLE logradouros ("CEP" varchar(8), "BAIRRO" text, "LOGRADOURO" text, "COD UBS" integer)')
+    cursor.executemany('INSERT INTO ubs VALUES (%s, %s, %s, %s, %s, %s)', [
+        (1, 'UBS Vila Arens', 'Rua Um', '10', 'Vila Arens', 1145891234.0),
+        (2, 'UBS Centro', 'Rua Dois', None, 'Centro', None),
+        (99, 'SEM UNIDADE DESIGNADA', None, None, None, None),
+    ])
+    cursor.executemany('INSERT INTO logradouros VALUES (%s, %s, %s, %s)', [
+        ('13201234', 'Vila Arens', 'Rua A', 1),
+        ('13201234', 'Vila Arens', 'Rua B', 2),
+        ('13201234', 'Centro', 'Rua C', 99),
+        ('13201234', 'Centro', 'Rua D', 7),
+        ('13209999', 'Jardim Sem UBS', 'Rua E', 99),
+        ('13209999', 'Jardim Sem UBS', 'Rua F', None),
+    ])
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class ConsultaCEPBaseTests(TestCase):
+    """
+    Testes da consulta de CEP sobre as tabelas de referência.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            criar_tabelas_de_referencia(cursor)
+        User.objects.create_user(username='teste', password='senha123')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.login(username='teste', password='senha123')
+
+    def consultar(self, cep):
+        return self.client.get(
+            reverse('ubs_consulta:consulta_cep'), {'cep': cep}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        ).json()
+
+    def test_agrupa_por_bairro(self):
+        with CaptureQueriesContext(connection) as queries:
+            resultados = consultar_cep('13201234')
+        # Uma única ida ao banco, pela conexão do Django (reaproveitada entre requisições)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('FROM logradouros', queries[0]['sql'])
+
+        self.assertEqual(resultados, [
+            {'nome': 'Rua C, Rua D', 'bairro': 'Centro', 'ubs_list': [
+                {'nome': 'UBS código 7 - Informações não encontradas', 'endereco': 'Dados não disponíveis', 'telefone': 'Não informado'},
+                {'nome': 'SEM UNIDADE DESIGNADA', 'endereco': 'Entre em contato com a Secretaria de Saúde para mais informações sobre o endereçamento desta região', 'telefone': 'Não informado'},
+            ]},
+            {'nome': 'Rua A, Rua B', 'bairro': 'Vila Arens', 'ubs_list': [
+                {'nome': 'UBS Vila Arens', 'endereco': 'Rua Um, nº 10, - Vila Arens', 'telefone': '(11) 4589-1234'},
+                {'nome': 'UBS Centro', 'endereco': 'Rua Dois, - Centro', 'telefone': 'Não informado'},
+            ]},
+        ])
+
+    def test_resposta_json(self):
+        resposta = self.consultar('13209999')
+        self.assertEqual((resposta['total_logradouros'], resposta['total_ubs']), (1, 1))
+        self.assertEqual(resposta['resultados'][0]['ubs_list'][0]['nome'], 'SEM UNIDADE DESIGNADA')
+
+        resposta = self.consultar('13200000')
+        self.assertEqual(resposta['erro'], 'CEP 13200000 não foi encontrado na base de dados de Jundiaí.')
+
+    def test_erro_de_banco_vira_mensagem(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE ubs RENAME TO ubs_antiga')
+        resposta = self.consultar('13201234')
+        self.assertEqual(resposta['erro'], 'Erro interno do sistema. Tente novamente em alguns instantes.')
+
+    def test_cache_de_resultados(self):
+        self.consultar('13201234')
+        self.consultar('13200000')
+
+        # Encontrado ou não, o CEP repetido não vai mais ao banco
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.consultar('13201234')
+            self.assertEqual(self.consultar('13200000')['erro'], 'CEP 13200000 não foi encontrado na base de dados de Jundiaí.')
+        self.assertFalse([q for q in queries if 'logradouros' in q['sql']])
+        self.assertEqual(resposta['resultados'], consultar_cep('13201234'))
+        self.assertEqual(cache_cep.estatisticas(), {'acertos': 2, 'falhas': 2, 'taxa_acerto': 0.5})
+
+        # Publicar uma versão nova da base (recarregar_indice_cep) descarta os resultados guardados
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO logradouros VALUES ('13200000', 'Jardim Novo', 'Rua G', 2)")
+        self.assertIn('erro', self.consultar('13200000'))
+        call_command('recarregar_indice_cep', stdout=StringIO())
+        self.assertEqual(self.consultar('13200000')['resultados'][0]['bairro'], 'Jardim Novo')
+
+
+@override_settings(CACHES=CACHES_DE_TESTE, UBS_CONSULTA_EM_MEMORIA=True)
+class IndiceCepTests(TestCase):
+    """
+    Testes do índice em memória (UBS_CONSULTA_EM_MEMORIA).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            criar_tabelas_de_referencia(cursor)
+        User.objects.create_user(username='teste', password='senha123')
+
+    def setUp(self):
+        limpar_caches()
+        indice._indice = None
+        self.addCleanup(setattr, indice, '_indice', None)
+        self.client.login(username='teste', password='senha123')
+
+    def test_mesmo_resultado_do_banco_sem_consultas(self):
+        for cep in ('13201234', '13209999', '13200000'):
+            self.assertEqual(indice.consultar_indice(cep), consultar_cep(cep))
+
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(
+                reverse('ubs_consulta:consulta_cep'), {'cep': '13201234'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            ).json()
+        self.assertEqual(resposta['resultados'], consultar_cep('13201234'))
+        self.assertFalse([q for q in queries if 'logradouros' in q['sql']])
+
+    def test_recarregar_troca_o_indice(self):
+        self.assertIsNone(indice.consultar_indice('13205555'))
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO logradouros VALUES ('13205555', 'Jardim Novo', 'Rua G', 2)")
+        # Sem recarregar, o índice continua com os dados antigos
+        self.assertIsNone(indice.consultar_indice('13205555'))
+
+        call_command('recarregar_indice_cep', stdout=StringIO())
+        self.assertEqual(indice.consultar_indice('13205555')[0]['ubs_list'][0]['nome'], 'UBS Centro')
+
+    def test_worker_confere_a_versao_publicada(self):
+        antigo = indice.indice_atual()
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO logradouros VALUES ('13205555', 'Jardim Novo', 'Rua G', 2)")
+
+        # Outro worker publica uma versão nova; este só confere depois do intervalo
+        cache.set(indice._chave_versao(), 'outra', None)
+        self.assertIs(indice.indice_atual(), antigo)
+        antigo.verificado_em -= indice.INTERVALO_VERIFICACAO
+
+        # Enquanto outra thread recarrega, as demais seguem com o índice antigo, sem esperar
+        with indice._trava, CaptureQueriesContext(connection) as queries:
+            self.assertIs(indice.indice_atual(), antigo)
+        self.assertEqual(len(queries), 0)
+
+        novo = indice.indice_atual()
+        self.assertIsNot(novo, antigo)
+        self.assertEqual(novo.versao, 'outra')
+        self.assertIsNotNone(novo.consultar('13205555'))
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class ConsultaLoteTests(TestCase):
+    """
+    Testes da consulta de uma lista de CEPs.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            criar_tabelas_de_referencia(cursor)
+        User.objects.create_user(username='teste', password='senha123')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.login(username='teste', password='senha123')
+
+    def linhas(self, response):
+        conteudo = b''.join(response.streaming_content).decode('utf-8-sig')
+        return [linha.split(';') for linha in conteudo.splitlines()]
+
+    def test_uma_consulta_para_todos_os_ceps(self):
+        with CaptureQueriesContext(connection) as queries:
+            encontrados = consultar_ceps(['13201234', '13209999', '13200000'])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(set(encontrados), {'13201234', '13209999'})
+        self.assertEqual(encontrados['13201234'], consultar_cep('13201234'))
+
+    def test_csv_mantem_as_colunas_e_a_ordem(self):
+        arquivo = SimpleUploadedFile('pacientes.csv', (
+            'nome;cep\n'
+            'Ana;13201-234\n'
+            'Bruno;13209999\n'
+            'Carla;13201234\n'
+            'Davi;12345678\n'
+            'Eva;13200000\n'
+        ).encode('latin-1'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('ubs_consulta:consulta_lote'), {'arquivo': arquivo})
+            linhas = self.linhas(response)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len([q for q in queries if 'logradouros' in q['sql']]), 1)
+
+        self.assertEqual(linhas[0], ['nome', 'cep', 'situacao', 'bairros', 'ubs', 'enderecos_ubs', 'telefones_ubs'])
+        self.assertEqual([linha[0] for linha in linhas[1:]], ['Ana', 'Bruno', 'Carla', 'Davi', 'Eva'])
+        self.assertEqual(linhas[1][2:5], ['OK', 'Centro | Vila Arens', 'UBS código 7 - Informações não encontradas | SEM UNIDADE DESIGNADA | UBS Vila Arens | UBS Centro'])
+        self.assertEqual(linhas[1][2:], linhas[3][2:])
+        self.assertEqual(linhas[2][4], 'SEM UNIDADE DESIGNADA')
+        self.assertEqual(linhas[4][2], 'CEP 12345678 não pertence à região de Jundiaí (deve começar com 1320 ou 1321).')
+        self.assertEqual(linhas[5][2], 'CEP 13200000 não foi encontrado na base de dados de Jundiaí.')
+
+    def test_lista_json_no_corpo(self):
+        response = self.client.post(
+            reverse('ubs_consulta:consulta_lote'), '["13209999", 13201234, "123"]', content_type='application/json'
+        )
+        linhas = self.linhas(response)
+        self.assertEqual([linha[:2] for linha in linhas[1:]], [['13209999', 'OK'], ['13201234', 'OK'], ['123', 'CEP deve conter exatamente 8 dígitos. Você digitou 3 dígitos.']])
+
+        response = self.client.post(reverse('ubs_consulta:consulta_lote'), 'nome,endereco\nAna,Rua A\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "coluna 'cep'", status_code=400)
+
+    def test_entrada_sem_ceps(self):
+        # Formulário enviado sem arquivo: volta a página com a mensagem
+        response = self.client.post(reverse('ubs_consulta:consulta_lote'), {})
+        self.assertContains(response, "Nenhum arquivo enviado.")
+
+        arquivo = SimpleUploadedFile('vazio.csv', b';;;\n ; \n')
+        response = self.client.post(reverse('ubs_consulta:consulta_lote'), {'arquivo': arquivo})
+        self.assertContains(response, "Nenhum CEP informado.")
+
+        response = self.client.post(reverse('ubs_consulta:consulta_lote'), ';;;\n', content_type='text/csv')
+        self.assertContains(response, "Nenhum CEP informado.", status_code=400)
+
+    def test_comando(self):
+        saida = StringIO()
+        with NamedTemporaryFile('w', suffix='.csv') as entrada:
+            entrada.write('CEP\n13201234\n13209999\n')
+            entrada.flush()
+            call_command('consultar_ceps_lote', entrada.name, stdout=saida)
+        linhas = [linha.split(';') for linha in saida.getvalue().lstrip('\ufeff').splitlines()]
+        self.assertEqual(linhas[0][:3], ['CEP', 'situacao', 'bairros'])
+        self.assertEqual([linha[1] for linha in linhas[1:]], ['OK', 'OK'])
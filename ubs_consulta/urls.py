@@ -5,4 +5,5 @@ app_name = 'ubs_consulta'
 
 urlpatterns = [
     path('', views.consulta_cep_view, name='consulta_cep'),
+    path('lote/', views.consulta_lote_view, name='consulta_lote'),
 ]
\ No newline at end of file